@@ -5,7 +5,16 @@ WARNING: This will delete ALL data from the specified tables and buckets!
 """
 import boto3
 import os
+import sys
+import time
+import random
+import argparse
+import threading
 from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor, wait
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import BotoCoreError, ClientError
+from dynamodb_scan import parallel_scan, CapacityBudget, DEFAULT_SEGMENTS
 
 # Configuration
 REGION = 'ap-northeast-1'
@@ -22,101 +31,291 @@ S3_BUCKETS = [
     'mozuku-impurities-dev'
 ]
 
+# Purge engine defaults (override on the command line)
+DELETE_WORKERS = 16        # concurrent BatchWriteItem / DeleteObjects calls
+MAX_BATCH_ATTEMPTS = 8     # retries for UnprocessedItems / throttling per 25-key batch
+DYNAMODB_BATCH_SIZE = 25   # BatchWriteItem limit
+S3_BATCH_SIZE = 1000       # DeleteObjects limit
+RETRYABLE_DYNAMODB_ERRORS = ('ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded')
+RETRYABLE_S3_ERRORS = ('SlowDown', 'ServiceUnavailable', 'InternalError', 'RequestTimeout', 'ThrottlingException')
+
 # Initialize AWS clients
 dynamodb = boto3.resource('dynamodb', region_name=REGION)
+dynamodb_client = boto3.client('dynamodb', region_name=REGION)  # clients are thread-safe, resources are not
 s3_client = boto3.client('s3', region_name=REGION)
+_serializer = TypeSerializer()
+
+
+class PurgeProgress:
+    """Deleted/failed counts per table or bucket, redrawn on one line every `interval` seconds"""
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.counts = {}  # target -> [deleted, failed]
+        self.errors = []  # (target, error) for listings or delete calls that failed outright
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def add(self, target, deleted=0, failed=0):
+        with self._lock:
+            entry = self.counts.setdefault(target, [0, 0])
+            entry[0] += deleted
+            entry[1] += failed
+
+    def error(self, target, error):
+        with self._lock:
+            self.errors.append((target, error))
+
+    def failed(self):
+        """Keys not deleted plus failed listings/calls"""
+        with self._lock:
+            return sum(f for _, f in self.counts.values()) + len(self.errors)
+
+    def get(self, target):
+        with self._lock:
+            return tuple(self.counts.get(target, (0, 0)))
+
+    def line(self):
+        with self._lock:
+            counts = dict(self.counts)
+        total = sum(deleted for deleted, _ in counts.values())
+        failed = sum(f for _, f in counts.values())
+        rate = total / max(time.time() - self.started, 1e-6)
+        parts = ' | '.join(f"{target} {deleted}" for target, (deleted, _) in counts.items())
+        return f"   🗑️  {parts} | total {total} ({rate:.0f}/s){f', {failed} failed' if failed else ''}"
+
+    def start(self):
+        def loop():
+            while not self._stop_event.wait(self.interval):
+                sys.stdout.write("\r" + self.line())
+                sys.stdout.flush()
+        self._thread = threading.Thread(target=loop, name='purge-progress', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+        sys.stdout.write("\r" + self.line() + "\n")
+        sys.stdout.flush()
+
+
+class BoundedPool:
+    """Thread pool whose submit() blocks once max_pending tasks are queued, so producers cannot run ahead"""
+
+    def __init__(self, workers, max_pending=None):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='purge')
+        self._slots = threading.BoundedSemaphore(max_pending or workers * 4)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self.errors = []
+
+    def submit(self, fn, *args):
+        self._slots.acquire()
+        future = self._pool.submit(fn, *args)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+        if future.exception() is not None:
+            self.errors.append(future.exception())
+        self._slots.release()
+
+    def join(self):
+        with self._lock:
+            pending = list(self._pending)
+        wait(pending)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _backoff(attempt):
+    time.sleep(min(5.0, 0.05 * 2 ** attempt) * random.uniform(0.5, 1.5))
 
 
-def delete_all_items_from_table(table_name):
+def batch_delete_keys(table_name, keys, budget=None, progress=None):
+    """
+    Delete up to 25 keys with BatchWriteItem, retrying UnprocessedItems and throttling
+    with jittered exponential backoff. Returns (deleted, failed).
+    """
+    requests = [{'DeleteRequest': {'Key': {k: _serializer.serialize(v) for k, v in key.items()}}} for key in keys]
+    deleted = 0
+    attempt = 0
+    while requests:
+        if budget is not None:
+            budget.wait()
+        try:
+            response = dynamodb_client.batch_write_item(RequestItems={table_name: requests},
+                                                        ReturnConsumedCapacity='TOTAL')
+            if budget is not None:
+                budget.consume(sum(c.get('CapacityUnits', 0) for c in response.get('ConsumedCapacity', [])))
+            unprocessed = response.get('UnprocessedItems', {}).get(table_name, [])
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in RETRYABLE_DYNAMODB_ERRORS:
+                print(f"\n   ❌ {table_name}: {e}")
+                break
+            unprocessed = requests
+        except BotoCoreError:
+            unprocessed = requests  # connection errors and timeouts
+        done = len(requests) - len(unprocessed)
+        deleted += done
+        if progress is not None and done:
+            progress.add(table_name, deleted=done)
+        requests = unprocessed
+        if requests:
+            attempt += 1
+            if attempt >= MAX_BATCH_ATTEMPTS:
+                break
+            _backoff(attempt)
+    if requests and progress is not None:
+        progress.add(table_name, failed=len(requests))
+    return deleted, len(requests)
+
+
+def delete_s3_objects(bucket_name, keys, progress=None):
+    """
+    Delete up to 1000 keys with DeleteObjects, retrying throttling (whole calls or
+    single keys) with jittered exponential backoff. Returns (deleted, failed).
+    """
+    remaining = list(keys)
+    deleted = 0
+    failed = 0
+    attempt = 0
+    while remaining:
+        try:
+            response = s3_client.delete_objects(
+                Bucket=bucket_name,
+                Delete={'Objects': [{'Key': key} for key in remaining], 'Quiet': True}
+            )
+            errors = response.get('Errors', [])
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in RETRYABLE_S3_ERRORS:
+                print(f"\n   ❌ {bucket_name}: {e}")
+                break
+            errors = [{'Key': key, 'Code': 'SlowDown'} for key in remaining]
+        except BotoCoreError:
+            errors = [{'Key': key, 'Code': 'SlowDown'} for key in remaining]  # connection errors and timeouts
+        retry = [error['Key'] for error in errors if error.get('Code') in RETRYABLE_S3_ERRORS]
+        permanent = [error for error in errors if error.get('Code') not in RETRYABLE_S3_ERRORS]
+        for error in permanent[:3]:
+            print(f"\n   ⚠️  {bucket_name}/{error.get('Key')}: {error.get('Code')} {error.get('Message')}")
+        done = len(remaining) - len(errors)
+        deleted += done
+        failed += len(permanent)
+        if progress is not None and (done or permanent):
+            progress.add(bucket_name, deleted=done, failed=len(permanent))
+        remaining = retry
+        if remaining:
+            attempt += 1
+            if attempt >= MAX_BATCH_ATTEMPTS:
+                break
+            _backoff(attempt)
+    if remaining and progress is not None:
+        progress.add(bucket_name, failed=len(remaining))
+    return deleted, failed + len(remaining)
+
+
+def purge_table(table_name, pool, progress, segments=DEFAULT_SEGMENTS, read_budget=None, write_budget=None):
+    """Key-only parallel scan of table_name feeding concurrent batch deletes"""
+    key_names = [key['AttributeName'] for key in dynamodb.Table(table_name).key_schema]
+    progress.add(table_name)
+    for page in parallel_scan(table_name, segments=segments, projection=key_names, budget=read_budget,
+                              progress=False, pages=True):
+        keys = [{k: item[k] for k in key_names} for item in page]
+        for chunk in _chunks(keys, DYNAMODB_BATCH_SIZE):
+            pool.submit(batch_delete_keys, table_name, chunk, write_budget, progress)
+
+
+def purge_bucket(bucket_name, pool, progress):
+    """List bucket_name page by page, deleting each page concurrently while listing continues"""
+    progress.add(bucket_name)
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, PaginationConfig={'PageSize': S3_BATCH_SIZE}):
+        keys = [obj['Key'] for obj in page.get('Contents', [])]
+        for chunk in _chunks(keys, S3_BATCH_SIZE):
+            pool.submit(delete_s3_objects, bucket_name, chunk, progress)
+
+
+def purge(tables, buckets, workers=DELETE_WORKERS, segments=DEFAULT_SEGMENTS, max_rcu=0, max_wcu=0):
+    """
+    Empty every table and bucket concurrently. Scans and listings run on one
+    thread per target; all deletes share a bounded pool of `workers` threads.
+    Returns the PurgeProgress with per-target counts.
+    """
+    progress = PurgeProgress()
+    pool = BoundedPool(workers)
+    read_budget = CapacityBudget(max_rcu)
+    write_budget = CapacityBudget(max_wcu)
+    progress.start()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, len(tables) + len(buckets)),
+                                thread_name_prefix='purge-source') as sources:
+            futures = {}
+            for table_name in tables:
+                futures[sources.submit(purge_table, table_name, pool, progress, segments,
+                                       read_budget, write_budget)] = table_name
+            for bucket_name in buckets:
+                futures[sources.submit(purge_bucket, bucket_name, pool, progress)] = bucket_name
+            for future, target in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"\n   ❌ Error listing {target}: {str(e)}")
+                    progress.error(target, e)
+        pool.join()
+    finally:
+        pool.shutdown()
+        progress.stop()
+    for error in pool.errors:
+        progress.error('delete', error)
+    for error in pool.errors[:5]:
+        print(f"   ❌ Delete error: {error}")
+    return progress
+
+
+def delete_all_items_from_table(table_name, segments=DEFAULT_SEGMENTS, max_rcu=0, max_wcu=0):
     """Delete all items from a DynamoDB table"""
     print(f"\n🗑️  Cleaning table: {table_name}")
-    table = dynamodb.Table(table_name)
-    
-    try:
-        # Get table key schema
-        response = table.scan()
-        items = response.get('Items', [])
-        
-        # Get key schema to know which keys to use for deletion
-        table_meta = dynamodb.Table(table_name)
-        key_schema = table_meta.key_schema
-        key_names = [key['AttributeName'] for key in key_schema]
-        
-        print(f"   Found {len(items)} items")
-        print(f"   Key schema: {key_names}")
-        
-        # Delete items in batches
-        deleted_count = 0
-        with table.batch_writer() as batch:
-            for item in items:
-                # Extract only the key attributes for deletion
-                key = {k: item[k] for k in key_names if k in item}
-                batch.delete_item(Key=key)
-                deleted_count += 1
-                if deleted_count % 25 == 0:
-                    print(f"   Deleted {deleted_count} items...")
-        
-        # Continue scanning if there are more items
-        while 'LastEvaluatedKey' in response:
-            response = table.scan(ExclusiveStartKey=response['LastEvaluatedKey'])
-            items = response.get('Items', [])
-            
-            with table.batch_writer() as batch:
-                for item in items:
-                    key = {k: item[k] for k in key_names if k in item}
-                    batch.delete_item(Key=key)
-                    deleted_count += 1
-                    if deleted_count % 25 == 0:
-                        print(f"   Deleted {deleted_count} items...")
-        
-        print(f"   ✅ Deleted {deleted_count} items from {table_name}")
-        return deleted_count
-    
-    except Exception as e:
-        print(f"   ❌ Error deleting from {table_name}: {str(e)}")
-        return 0
+    progress = purge([table_name], [], segments=segments, max_rcu=max_rcu, max_wcu=max_wcu)
+    deleted, failed = progress.get(table_name)
+    print(f"   ✅ Deleted {deleted} items from {table_name}" + (f" ({failed} failed)" if failed else ""))
+    return deleted
 
 
 def delete_all_objects_from_bucket(bucket_name):
     """Delete all objects from an S3 bucket"""
     print(f"\n🗑️  Cleaning S3 bucket: {bucket_name}")
-    
-    try:
-        # List all objects
-        paginator = s3_client.get_paginator('list_objects_v2')
-        pages = paginator.paginate(Bucket=bucket_name)
-        
-        deleted_count = 0
-        for page in pages:
-            if 'Contents' not in page:
-                continue
-            
-            objects = page['Contents']
-            print(f"   Found {len(objects)} objects in this page")
-            
-            # Delete in batches of 1000 (S3 limit)
-            for i in range(0, len(objects), 1000):
-                batch = objects[i:i+1000]
-                delete_keys = [{'Key': obj['Key']} for obj in batch]
-                
-                response = s3_client.delete_objects(
-                    Bucket=bucket_name,
-                    Delete={'Objects': delete_keys}
-                )
-                
-                deleted_count += len(response.get('Deleted', []))
-                if deleted_count % 100 == 0:
-                    print(f"   Deleted {deleted_count} objects...")
-        
-        print(f"   ✅ Deleted {deleted_count} objects from {bucket_name}")
-        return deleted_count
-    
-    except Exception as e:
-        print(f"   ❌ Error deleting from {bucket_name}: {str(e)}")
-        return 0
+    progress = purge([], [bucket_name])
+    deleted, failed = progress.get(bucket_name)
+    print(f"   ✅ Deleted {deleted} objects from {bucket_name}" + (f" ({failed} failed)" if failed else ""))
+    return deleted
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Delete ALL data from the development tables and buckets')
+    parser.add_argument('--segments', type=int, default=DEFAULT_SEGMENTS,
+                        help=f'Parallel scan segments per table (default: {DEFAULT_SEGMENTS})')
+    parser.add_argument('--workers', type=int, default=DELETE_WORKERS,
+                        help=f'Concurrent delete requests across all targets (default: {DELETE_WORKERS})')
+    parser.add_argument('--max-rcu', type=float, default=0,
+                        help='Read capacity units per second for the key scans (default: unlimited)')
+    parser.add_argument('--max-wcu', type=float, default=0,
+                        help='Write capacity units per second for the deletes (default: unlimited)')
+    parser.add_argument('--yes', action='store_true', help='Skip the confirmation prompt')
+    args = parser.parse_args()
+
     print("=" * 70)
     print("⚠️  WARNING: This will DELETE ALL DATA from development environment!")
     print("=" * 70)
@@ -127,39 +326,53 @@ def main():
     for bucket in S3_BUCKETS:
         print(f"  - {bucket}")
     
-    response = input("\n❓ Are you sure you want to continue? (yes/no): ")
-    if response.lower() != 'yes':
-        print("❌ Cleanup cancelled")
-        return
+    if not args.yes:
+        response = input("\n❓ Are you sure you want to continue? (yes/no): ")
+        if response.lower() != 'yes':
+            print("❌ Cleanup cancelled")
+            return 0
     
     print("\n🚀 Starting cleanup...")
-    
-    # Clean DynamoDB tables
+    print(f"   {len(TABLES)} tables x {args.segments} segments, {len(S3_BUCKETS)} buckets, "
+          f"{args.workers} delete workers, "
+          f"RCU {args.max_rcu or 'unlimited'}, WCU {args.max_wcu or 'unlimited'}")
+    started = time.time()
+    progress = purge(TABLES, S3_BUCKETS, workers=args.workers, segments=args.segments,
+                     max_rcu=args.max_rcu, max_wcu=args.max_wcu)
+    elapsed = time.time() - started
+
     print("\n" + "=" * 70)
-    print("STEP 1: Cleaning DynamoDB Tables")
+    print("STEP 1: DynamoDB Tables")
     print("=" * 70)
     total_items_deleted = 0
     for table in TABLES:
-        deleted = delete_all_items_from_table(table)
+        deleted, failed = progress.get(table)
         total_items_deleted += deleted
-    
+        print(f"   ✅ {table}: {deleted} items deleted" + (f", ❌ {failed} failed" if failed else ""))
     print(f"\n✅ Total items deleted from DynamoDB: {total_items_deleted}")
     
-    # Clean S3 buckets
     print("\n" + "=" * 70)
-    print("STEP 2: Cleaning S3 Buckets")
+    print("STEP 2: S3 Buckets")
     print("=" * 70)
     total_objects_deleted = 0
     for bucket in S3_BUCKETS:
-        deleted = delete_all_objects_from_bucket(bucket)
+        deleted, failed = progress.get(bucket)
         total_objects_deleted += deleted
-    
+        print(f"   ✅ {bucket}: {deleted} objects deleted" + (f", ❌ {failed} failed" if failed else ""))
     print(f"\n✅ Total objects deleted from S3: {total_objects_deleted}")
     
     print("\n" + "=" * 70)
-    print("✅ Cleanup completed successfully!")
+    rate = (total_items_deleted + total_objects_deleted) / max(elapsed, 1e-6)
+    failed = progress.failed()
+    if failed:
+        print(f"❌ Cleanup finished in {elapsed:.1f}s with {failed} failure(s) ({rate:.0f} deletes/s) "
+              f"- run it again to delete what is left")
+        print("=" * 70)
+        return 1
+    print(f"✅ Cleanup completed in {elapsed:.1f}s ({rate:.0f} deletes/s)")
     print("=" * 70)
+    return 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Parallel segmented DynamoDB scans for the ops scripts
+
+A single Scan reads one partition at a time. parallel_scan splits the table
+into TotalSegments segments, scans them concurrently from a thread pool and
+yields the items to the caller as pages arrive. ProjectionExpression keeps
+each item down to the attributes a script needs, a shared capacity budget caps
+the read units consumed per second, and a one-line progress display shows
+how far each segment has got.
+"""
+import sys
+import time
+import queue
+import threading
+import boto3
+from concurrent.futures import ThreadPoolExecutor
+
+REGION = 'ap-northeast-1'
+DEFAULT_SEGMENTS = 8
+
+
+class CapacityBudget:
+    """
+    Token bucket of capacity units per second shared by all workers.
+    Callers wait() before a request and consume() what the response reports,
+    so a large page can overdraw the bucket and later requests wait it off.
+    units_per_sec <= 0 means unlimited.
+    """
+
+    def __init__(self, units_per_sec, burst=None):
+        self.rate = float(units_per_sec)
+        self.capacity = float(burst if burst is not None else max(self.rate, 1.0))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait(self, units=0.0):
+        """Block until the bucket holds at least `units` (by default: until it is out of debt)"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                self._refill()
+                missing = units - self._tokens
+                if missing <= 0:
+                    return
+                delay = missing / self.rate
+            time.sleep(min(delay, 1.0))
+
+    def consume(self, units):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self._tokens -= units
+
+
+class ScanProgress:
+    """Per-segment item counts, redrawn on one terminal line at most every `interval` seconds"""
+
+    def __init__(self, label, total_segments, interval=1.0, stream=sys.stdout):
+        self.label = label
+        self.items = [0] * total_segments
+        self.done = [False] * total_segments
+        self.consumed = 0.0
+        self.started = time.time()
+        self.interval = interval
+        self.stream = stream
+        self._last_draw = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, segment, items, consumed, finished=False):
+        with self._lock:
+            self.items[segment] += items
+            self.consumed += consumed
+            self.done[segment] = self.done[segment] or finished
+            if time.time() - self._last_draw >= self.interval or finished:
+                self._draw()
+
+    def _draw(self):
+        self._last_draw = time.time()
+        elapsed = max(self._last_draw - self.started, 1e-6)
+        total = sum(self.items)
+        segments = ' '.join(f"{n}{'✓' if d else ''}" for n, d in zip(self.items, self.done))
+        self.stream.write(f"\r   {self.label}: {total} items ({total / elapsed:.0f}/s, "
+                          f"{self.consumed:.0f} RCU) | segments {sum(self.done)}/{len(self.done)} [{segments}]")
+        self.stream.flush()
+
+    def close(self):
+        with self._lock:
+            self._draw()
+        self.stream.write("\n")
+        self.stream.flush()
+
+
+def projection_kwargs(attributes, expression_attribute_names=None):
+    """ProjectionExpression/ExpressionAttributeNames for attributes, safe for reserved words like 'timestamp'"""
+    names = dict(expression_attribute_names or {})
+    existing = {attribute: placeholder for placeholder, attribute in names.items()}
+    placeholders = []
+    for i, attribute in enumerate(attributes):
+        placeholder = existing.get(attribute, f"#p{i}")
+        names[placeholder] = attribute
+        placeholders.append(placeholder)
+    return {'ProjectionExpression': ', '.join(placeholders), 'ExpressionAttributeNames': names}
+
+
+def parallel_scan(table_name, segments=DEFAULT_SEGMENTS, projection=None, budget=None, progress=True,
+                  region=REGION, pages=False, cursors=None, **scan_kwargs):
+    """
+    Scan table_name with `segments` concurrent segment workers.
+
+    Yields items (or whole pages as lists if pages=True) in arrival order.
+    projection: attribute names to fetch (None = whole items)
+    budget: CapacityBudget shared with other scans, or None for unlimited
+    cursors: optional {segment: LastEvaluatedKey, or None once finished} to resume from.
+             Updated in place when the caller asks for the page after a segment's page,
+             so saving it between pages gives a checkpoint of everything consumed so far.
+    scan_kwargs: passed to every Scan (FilterExpression, ExpressionAttributeValues, ...)
+    """
+    segments = max(1, int(segments))
+    if projection:
+        scan_kwargs.update(projection_kwargs(projection, scan_kwargs.get('ExpressionAttributeNames')))
+    tracker = ScanProgress(table_name, segments) if progress else None
+    if cursors is None:
+        cursors = {}
+    pending = [segment for segment in range(segments) if not (segment in cursors and cursors[segment] is None)]
+    results = queue.Queue(maxsize=segments * 4)  # backpressure: workers wait for a slow consumer
+    stop = threading.Event()
+    finished = object()
+
+    def scan_segment(segment):
+        # boto3 resources are not thread-safe: one session per worker
+        table = boto3.session.Session().resource('dynamodb', region_name=region).Table(table_name)
+        kwargs = dict(scan_kwargs, Segment=segment, TotalSegments=segments, ReturnConsumedCapacity='TOTAL')
+        if cursors.get(segment):
+            kwargs['ExclusiveStartKey'] = cursors[segment]
+        try:
+            while not stop.is_set():
+                if budget is not None:
+                    budget.wait()
+                response = table.scan(**kwargs)
+                consumed = float(response.get('ConsumedCapacity', {}).get('CapacityUnits', 0))
+                if budget is not None:
+                    budget.consume(consumed)
+                more = 'LastEvaluatedKey' in response
+                if tracker:
+                    tracker.update(segment, len(response.get('Items', [])), consumed, finished=not more)
+                results.put((segment, response.get('Items', []), response.get('LastEvaluatedKey')))
+                if not more:
+                    return
+                kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        except Exception as e:
+            results.put(e)
+        finally:
+            results.put(finished)
+
+    pool = ThreadPoolExecutor(max_workers=segments, thread_name_prefix=f'scan-{table_name}')
+    for segment in range(segments):
+        if segment in pending:
+            pool.submit(scan_segment, segment)
+        elif tracker:
+            tracker.update(segment, 0, 0, finished=True)
+    running = len(pending)
+    try:
+        while running:
+            result = results.get()
+            if result is finished:
+                running -= 1
+                continue
+            if isinstance(result, Exception):
+                raise result
+            segment, page, last_key = result
+            if pages:
+                yield page
+            else:
+                yield from page
+            cursors[segment] = last_key
+    finally:
+        stop.set()
+        # Unblock workers waiting on a full queue so the pool can shut down
+        while running:
+            try:
+                if results.get(timeout=0.1) is finished:
+                    running -= 1
+            except queue.Empty:
+                pass
+        pool.shutdown(wait=True)
+        if tracker:
+            tracker.close()
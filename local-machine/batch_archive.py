@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Batch archive format for mozuku_detection_sender.py batch mode
+
+Many small objects (frames, crops, YOLO labels) are concatenated into one S3
+object so a batch costs a single PUT. Layout:
+
+    <member 0 bytes><member 1 bytes>...<JSON index><index length: 8 bytes BE><MAGIC>
+
+The JSON index lists every member as {name, offset, length, contentType}.
+DynamoDB items reference members directly as
+
+    s3://bucket/key#bytes=<first>-<last>
+
+(the HTTP Range header value), so readers fetch a member with one ranged GET
+and never need the index (src/s3Media.js does this for the web app). The index is there for tools that list a batch:
+read the last 16 bytes, then the index right before them.
+"""
+
+import json
+import struct
+
+MAGIC = b'MZKBAT01'
+TRAILER = struct.Struct('>Q8s')
+
+
+class BatchArchive:
+    """In-memory archive being filled"""
+
+    def __init__(self):
+        self._parts = []
+        self._members = []
+        self.size = 0
+
+    def __len__(self):
+        return len(self._members)
+
+    def add(self, name, body, content_type):
+        """Append a member; returns its (offset, length)"""
+        offset = self.size
+        self._parts.append(body)
+        self._members.append({'name': name, 'offset': offset, 'length': len(body), 'contentType': content_type})
+        self.size += len(body)
+        return offset, len(body)
+
+    def to_bytes(self):
+        index = json.dumps({'version': 1, 'members': self._members}, separators=(',', ':')).encode('utf-8')
+        return b''.join(self._parts) + index + TRAILER.pack(len(index), MAGIC)
+
+
+def member_url(archive_url, offset, length):
+    return f"{archive_url}#bytes={offset}-{offset + length - 1}"
+
+
+def parse_member_url(url):
+    """Split a member URL into (archive_url, byte_range) - byte_range is None for plain URLs"""
+    if '#bytes=' not in url:
+        return url, None
+    archive_url, _, byte_range = url.partition('#bytes=')
+    return archive_url, f"bytes={byte_range}"
+
+
+def read_index(data):
+    """
+    Parse the index from the end of an archive. data must hold at least the
+    index and trailer (the whole archive, or a ranged GET of its tail).
+    """
+    if len(data) < TRAILER.size:
+        raise ValueError("Not a batch archive: too short")
+    index_len, magic = TRAILER.unpack(data[-TRAILER.size:])
+    if magic != MAGIC:
+        raise ValueError("Not a batch archive: bad magic")
+    if len(data) < TRAILER.size + index_len:
+        raise ValueError(f"Need the last {TRAILER.size + index_len} bytes of the archive")
+    return json.loads(data[-TRAILER.size - index_len:-TRAILER.size])['members']
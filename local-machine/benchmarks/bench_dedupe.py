@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Parity check + benchmark for DetectionSender NMS (dedupe_detections)
+
+Compares the pure-Python and NumPy implementations on random, heavily
+overlapping detections and times both at 10/100/1000 boxes. The parity
+check here is a quick sanity pass before timing; tests/test_dedupe.py is
+the one that gates changes.
+
+Usage:
+    python3 local-machine/benchmarks/bench_dedupe.py [--repeat 20] [--seed 0]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Keep the sender from starting a spool, encoder processes or stats thread just to be benchmarked
+os.environ.setdefault('MOZUKU_SPOOL_ENABLED', 'false')
+os.environ.setdefault('MOZUKU_ENCODE_PROCESSES', '0')
+os.environ.setdefault('MOZUKU_SESSION_STATS_ENABLED', 'false')
+os.environ.setdefault('MOZUKU_LOG_LEVEL', 'ERROR')
+
+from mozuku_detection_sender import DetectionSender  # noqa: E402
+
+BOX_COUNTS = [10, 100, 1000]
+
+
+def make_detections(count, rng, frame_w=1920, frame_h=1080):
+    """Random detections clustered around a few impurities so NMS has work to do"""
+    centers = [(rng.uniform(0, frame_w), rng.uniform(0, frame_h)) for _ in range(max(1, count // 5))]
+    detections = []
+    for _ in range(count):
+        cx, cy = rng.choice(centers)
+        w = rng.randint(0, 120)
+        h = rng.randint(0, 120)
+        detections.append({
+            'label': 'impurity',
+            # Coarse confidences so ties (and stable ordering) are exercised
+            'confidence': round(rng.uniform(0.25, 1.0), 2),
+            'bbox': {
+                'x': int(cx + rng.gauss(0, 8) - w / 2),
+                'y': int(cy + rng.gauss(0, 8) - h / 2),
+                'width': w,
+                'height': h,
+            },
+        })
+    return detections
+
+
+def check_parity(sender, rng, trials=200):
+    """Both implementations must keep exactly the same detections in the same order"""
+    for trial in range(trials):
+        detections = make_detections(rng.randint(0, 300), rng)
+        for threshold in (0.3, 0.5, 0.7, 0.9):
+            expected = sender.dedupe_detections_python(detections, threshold)
+            actual = sender.dedupe_detections_numpy(detections, threshold)
+            if [id(d) for d in expected] != [id(d) for d in actual]:
+                raise AssertionError(
+                    f"NMS mismatch (trial {trial}, n={len(detections)}, iou={threshold}): "
+                    f"python kept {len(expected)}, numpy kept {len(actual)}"
+                )
+    print(f"✅ Parity OK ({trials} random sets x 4 thresholds)")
+
+
+def time_call(fn, detections, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(detections, 0.7)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dedupe_detections')
+    parser.add_argument('--repeat', type=int, default=20, help='Timing repetitions (best is reported)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    sender = DetectionSender()
+    check_parity(sender, rng)
+
+    print(f"\n{'boxes':>6} {'kept':>6} {'python (ms)':>12} {'numpy (ms)':>12} {'speedup':>8}")
+    for count in BOX_COUNTS:
+        detections = make_detections(count, rng)
+        kept = len(sender.dedupe_detections_numpy(detections))
+        py = time_call(sender.dedupe_detections_python, detections, args.repeat)
+        vec = time_call(sender.dedupe_detections_numpy, detections, args.repeat)
+        print(f"{count:>6} {kept:>6} {py * 1000:>12.3f} {vec * 1000:>12.3f} {py / vec:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the per-detection hot paths of DetectionSender, with
+baselines kept in the repo (benchmarks/baselines/micro.json)
+
+Covers normalize_detections, dedupe_detections and _iou, _to_decimal, the
+YOLO label formatting of upload_yolo_labels_to_s3 (format_yolo_labels) and
+the crop slicing of extract_and_upload_cropped_images (extract_cropped_regions),
+across detection counts and frame sizes.
+
+Every case is timed as the best of --repeat runs, each long enough to be
+measured reliably. Timings are also stored relative to a fixed calibration
+workload sampled right before and after each case, so a slow spell of the
+machine hits both, and a baseline recorded on one machine stays usable on
+another (CI, dev laptops). --update measures --rounds full rounds and stores
+each case's median together with its noise (how far the slowest round landed
+above the median); it refuses to write a baseline whose noise exceeds the
+threshold. The check fails (exit status 1) when a case is slower than its
+baseline by more than --threshold or its recorded noise, whichever is larger
+but never more than twice the threshold; a failing case is measured twice
+more before it counts, to ride out a noisy neighbour.
+
+Usage:
+    python3 local-machine/benchmarks/bench_micro.py              # compare with the baseline
+    python3 local-machine/benchmarks/bench_micro.py --update     # record a new baseline
+    python3 local-machine/benchmarks/bench_micro.py --filter dedupe --threshold 0.5
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, HERE)
+
+# Keep the sender from starting a spool, encoder processes or stats thread just to be benchmarked
+os.environ.setdefault('MOZUKU_SPOOL_ENABLED', 'false')
+os.environ.setdefault('MOZUKU_ENCODE_PROCESSES', '0')
+os.environ.setdefault('MOZUKU_SESSION_STATS_ENABLED', 'false')
+os.environ.setdefault('MOZUKU_LOG_LEVEL', 'ERROR')
+
+from mozuku_detection_sender import DetectionSender  # noqa: E402
+from bench_dedupe import make_detections  # noqa: E402
+
+BASELINE_PATH = os.path.join(HERE, 'baselines', 'micro.json')
+DEFAULT_THRESHOLD = 0.25  # fail when more than 25% slower than the baseline
+DETECTION_COUNTS = [1, 10, 100, 1000]
+CROP_COUNTS = [1, 10, 100]
+FRAME_SIZES = [(640, 480), (1280, 720), (1920, 1080)]
+MIN_RUN_SEC = 0.05  # each timed run repeats the call until it takes at least this long
+UPDATE_ROUNDS = 5  # rounds measured for a baseline; the median is stored
+
+
+def calibrate(repeat=15):
+    """Seconds for a fixed mix of interpreter and NumPy work, the unit of the relative timings"""
+    data = np.arange(200000, dtype=np.float64)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        total = 0.0
+        for i in range(200000):
+            total += i * 0.5
+        values = {str(i): float(i) for i in range(20000)}
+        total += sum(values.values()) + float(np.sqrt(data).sum())
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def time_case(fn, repeat):
+    """Best seconds per call over `repeat` runs of an auto-sized loop"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_RUN_SEC or number >= 1 << 20:
+            break
+        number *= 2 if elapsed <= 0 else max(2, min(10, int(MIN_RUN_SEC / elapsed) + 1))
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def build_cases(sender, seed=0):
+    """[(name, fn)]; inputs are generated once here so only the call itself is timed"""
+    rng = random.Random(seed)
+    cases = []
+    width, height = 1280, 720
+    for count in DETECTION_COUNTS:
+        detections = make_detections(count, rng, width, height)
+        normalized = sender.normalize_detections(detections, width, height)
+        cases.append((f"normalize_detections[n={count}]",
+                      lambda d=detections: sender.normalize_detections(d, width, height)))
+        cases.append((f"dedupe_detections[n={count}]",
+                      lambda d=detections: sender.dedupe_detections(d)))
+        cases.append((f"_to_decimal[n={count}]",
+                      lambda d=normalized: sender._to_decimal(d)))
+        cases.append((f"format_yolo_labels[n={count}]",
+                      lambda d=normalized: sender.format_yolo_labels(d)))
+
+    pairs = [((rng.uniform(0, 100), rng.uniform(0, 100)), (rng.uniform(0, 100), rng.uniform(0, 100)))
+             for _ in range(100)]
+    pairs = [((x1, y1, x1 + 50, y1 + 50), (x2, y2, x2 + 40, y2 + 60)) for (x1, y1), (x2, y2) in pairs]
+
+    def iou_pairs():
+        for a, b in pairs:
+            sender._iou(a, b)
+    cases.append(("_iou[pairs=100]", iou_pairs))
+
+    for width, height in FRAME_SIZES:
+        frame = np.random.default_rng(seed).integers(0, 255, (height, width, 3), dtype=np.uint8)
+        for count in CROP_COUNTS:
+            detections = make_detections(count, rng, width, height)
+            cases.append((f"extract_cropped_regions[{width}x{height},n={count}]",
+                          lambda f=frame, d=detections: sender.extract_cropped_regions(f, d)))
+    return cases
+
+
+def measure_case(fn, repeat):
+    """(seconds per call, calibration seconds) with the calibration sampled right around the case"""
+    before = calibrate(3)
+    seconds = time_case(fn, repeat)
+    return seconds, min(before, calibrate(3))
+
+
+def measure(cases, repeat):
+    """One round over all cases: {name: (seconds per call, calibration seconds)}"""
+    return {name: measure_case(fn, repeat) for name, fn in cases}
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmarks for the per-detection hot functions')
+    parser.add_argument('--update', action='store_true', help='Write the results as the new baseline')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='Baseline file')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f'Allowed slowdown as a fraction (default: {DEFAULT_THRESHOLD})')
+    parser.add_argument('--absolute', action='store_true',
+                        help='Compare raw timings instead of calibration-relative ones (same machine only)')
+    parser.add_argument('--filter', default='', help='Only run cases whose name contains this')
+    parser.add_argument('--repeat', type=int, default=15, help='Timed runs per case (best is kept)')
+    parser.add_argument('--rounds', type=int, default=UPDATE_ROUNDS,
+                        help=f'Rounds measured with --update; the median is stored (default: {UPDATE_ROUNDS})')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    sender = DetectionSender()
+    cases = [(name, fn) for name, fn in build_cases(sender, args.seed) if args.filter in name]
+    baseline = None if args.update else load_baseline(args.baseline)
+    if not args.update and baseline is None:
+        print(f"⚠️  No baseline at {args.baseline} - run with --update to record one")
+
+    # A baseline stores the median of several rounds, so it is neither a lucky nor an unlucky run
+    rounds = [measure(cases, args.repeat) for _ in range(max(1, args.rounds) if args.update else 1)]
+    calibration = median([sample for measured in rounds for _, sample in measured.values()])
+    timings, relatives, noise = {}, {}, {}
+    for name, _ in cases:
+        relative = [measured[name][0] / measured[name][1] for measured in rounds]
+        timings[name] = median([measured[name][0] for measured in rounds])
+        relatives[name] = median(relative)
+        noise[name] = max(relative) / relatives[name] - 1
+
+    print(f"⏱️  calibration {calibration * 1000:.2f} ms ({platform.python_implementation()} "
+          f"{platform.python_version()}, {platform.machine()})")
+    print(f"\n{'case':<48} {'us/call':>11} {'baseline':>11} {'change':>8}")
+    results = {}
+    regressions = []
+    for name, fn in cases:
+        seconds = timings[name]
+        reference = (baseline or {}).get('cases', {}).get(name)
+
+        def change(seconds, relative):
+            if args.absolute:
+                return seconds / reference['seconds']
+            return relative / reference['relative']
+
+        status, ratio = '', None
+        if reference:
+            # A noisy case gets more room, but a baseline never excuses more than twice the threshold
+            allowed = min(max(args.threshold, reference.get('noise', 0.0)), 2 * args.threshold)
+            ratio = change(seconds, relatives[name])
+            for _ in range(2):  # confirm before failing
+                if ratio <= 1 + allowed:
+                    break
+                retry_seconds, retry_calibration = measure_case(fn, args.repeat)
+                retry_ratio = change(retry_seconds, retry_seconds / retry_calibration)
+                if retry_ratio < ratio:
+                    seconds, ratio = retry_seconds, retry_ratio
+            status = '❌' if ratio > 1 + allowed else '✅'
+            if status == '❌':
+                regressions.append((name, ratio, allowed))
+        elif baseline is not None:
+            status = '🆕'
+        results[name] = {'seconds': seconds, 'relative': relatives[name], 'noise': noise[name]}
+        expected = reference['seconds'] * (1 if args.absolute else calibration / baseline['calibration_sec']) \
+            if reference else None
+        print(f"{name:<48} {seconds * 1e6:>11.2f} "
+              f"{(f'{expected * 1e6:.2f}' if expected else '-'):>11} "
+              f"{(f'{(ratio - 1) * 100:+.0f}%' if ratio else ''):>8} {status}")
+
+    if args.update:
+        noisy = sorted((value, name) for name, value in noise.items() if value > args.threshold)
+        if noisy:
+            print(f"\n❌ Not writing {args.baseline}: {len(noisy)} case(s) varied by more than "
+                  f"{args.threshold * 100:.0f}% between rounds, too noisy to gate on:")
+            for value, name in reversed(noisy):
+                print(f"   {name}: {value * 100:.0f}%")
+            print("   Re-record on a quieter machine (idle, pinned CPU) or with more --rounds/--repeat")
+            return 1
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump({
+                'calibration_sec': calibration,
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'machine': platform.machine(),
+                'threshold': args.threshold,
+                'rounds': len(rounds),
+                'cases': results,
+            }, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\n💾 Baseline written to {args.baseline} ({len(results)} cases, median of {len(rounds)} rounds, "
+              f"noise up to {max(noise.values(), default=0.0) * 100:.0f}%)")
+        return 0
+
+    if regressions:
+        print(f"\n❌ {len(regressions)} case(s) regressed beyond their allowance:")
+        for name, ratio, allowed in regressions:
+            print(f"   {name}: {(ratio - 1) * 100:+.0f}% (allowed {allowed * 100:.0f}%)")
+        return 1
+    if baseline is not None:
+        print(f"\n✅ No regressions beyond {args.threshold * 100:.0f}% (or a case's recorded noise, "
+              f"up to {2 * args.threshold * 100:.0f}%)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+End-to-end throughput benchmark for DetectionSender.send_detection
+
+Synthetic frames and detections are pushed through the real sender (NMS,
+crops, JPEG encoding, label formatting, S3 PUTs, DynamoDB writes, spool) with
+S3 and DynamoDB replaced by the in-process stand-ins of local_aws.py, so it
+runs without network access, AWS credentials or ROS2.
+
+Frames arrive open-loop at --rate fps on --workers upload threads (like the
+bridge's upload queue); latency is then measured from a frame's scheduled
+arrival, so it includes time spent waiting for a free worker. With --rate 0
+each worker sends back to back and latency is the send_detection call itself.
+
+Usage:
+    python3 local-machine/benchmarks/bench_sender_e2e.py [--frames 300] [--rate 0]
+        [--width 1280 --height 720] [--boxes 3] [--workers 4]
+        [--s3-latency-ms 30 --s3-jitter-ms 20 --s3-failure-rate 0.01]
+        [--ddb-latency-ms 10 --ddb-failure-rate 0] [--batch] [--no-spool] [--json out.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, HERE)
+
+
+class FrameGenerator:
+    """
+    Camera-like frames (smooth belt background, texture, dark impurities) with
+    matching detections and an annotated copy. A fixed pool of distinct frames
+    is generated up front and cycled, so generation never shows up in the timings.
+    """
+
+    def __init__(self, width, height, boxes, distinct=8, seed=0):
+        import cv2
+        rng = np.random.default_rng(seed)
+        self.frames = []
+        yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+        for _ in range(max(1, distinct)):
+            base = 140 + 40 * np.sin(xx / width * 6.28 + rng.uniform(0, 6.28)) * np.cos(yy / height * 3.14)
+            noise = rng.normal(0, 6, (height, width))
+            gray = np.clip(base + noise, 0, 255).astype(np.uint8)
+            raw = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+            raw[..., 1] = np.clip(raw[..., 1].astype(np.int16) + 25, 0, 255).astype(np.uint8)
+            detections = []
+            for _ in range(boxes):
+                w = int(rng.integers(24, max(25, width // 8)))
+                h = int(rng.integers(24, max(25, height // 8)))
+                x = int(rng.integers(0, max(1, width - w)))
+                y = int(rng.integers(0, max(1, height - h)))
+                cv2.ellipse(raw, (x + w // 2, y + h // 2), (w // 3, h // 3), 0, 0, 360, (30, 40, 35), -1)
+                detections.append({
+                    'label': 'impurity',
+                    'confidence': round(float(rng.uniform(0.3, 0.99)), 2),
+                    'bbox': {'x': x, 'y': y, 'width': w, 'height': h},
+                })
+            annotated = raw.copy()
+            for d in detections:
+                box = d['bbox']
+                cv2.rectangle(annotated, (box['x'], box['y']),
+                              (box['x'] + box['width'], box['y'] + box['height']), (0, 255, 0), 2)
+            self.frames.append((annotated, raw, detections))
+
+    def get(self, i):
+        annotated, raw, detections = self.frames[i % len(self.frames)]
+        # send_detection annotates the detection dicts, so every call gets fresh copies
+        return annotated, raw, [dict(d, bbox=dict(d['bbox'])) for d in detections]
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return float('nan')
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def _cpu_seconds(who):
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run(args):
+    # Configuration is read from the environment when the sender module is imported
+    os.environ['MOZUKU_BATCH_ENABLED'] = 'true' if args.batch else 'false'
+    os.environ['MOZUKU_UPLOAD_FANOUT_THREADS'] = str(args.fanout)
+    os.environ['MOZUKU_LOG_LEVEL'] = args.log_level
+    if args.encode_processes is not None:
+        os.environ['MOZUKU_ENCODE_PROCESSES'] = str(args.encode_processes)
+    spool_dir = tempfile.mkdtemp(prefix='mozuku-bench-spool-')
+    os.environ['MOZUKU_SPOOL_ENABLED'] = 'false' if args.no_spool else 'true'
+    os.environ['MOZUKU_SPOOL_PATH'] = os.path.join(spool_dir, 'spool.db')
+
+    import mozuku_detection_sender as sender_module
+    from local_aws import FaultInjector, install
+
+    s3, dynamodb = install(
+        sender_module,
+        s3_faults=FaultInjector(args.s3_latency_ms, args.s3_jitter_ms, args.s3_failure_rate, seed=args.seed),
+        dynamodb_faults=FaultInjector(args.ddb_latency_ms, args.ddb_jitter_ms, args.ddb_failure_rate, seed=args.seed + 1),
+    )
+    generator = FrameGenerator(args.width, args.height, args.boxes, seed=args.seed)
+    sender = sender_module.DetectionSender()
+
+    # Warm up the encoder processes and thread pools outside the measurement
+    for i in range(args.warmup):
+        sender.send_detection(*generator.get(i))
+
+    latencies = []
+    results = {'ok': 0, 'failed': 0}
+    lock = threading.Lock()
+    s3_calls, s3_bytes, ddb_calls = s3.faults.calls, s3.bytes_put, dynamodb.faults.calls
+
+    def send(i, scheduled):
+        ok = sender.send_detection(*generator.get(i))
+        elapsed = time.perf_counter() - scheduled
+        with lock:
+            latencies.append(elapsed)
+            results['ok' if ok else 'failed'] += 1
+
+    cpu_before = _cpu_seconds(resource.RUSAGE_SELF)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix='bench-upload') as pool:
+        if args.rate > 0:
+            for i in range(args.frames):
+                scheduled = started + i / args.rate
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(send, args.warmup + i, scheduled)
+        else:
+            # Closed loop: every worker sends its next frame as soon as the previous one returns
+            counter = iter(range(args.frames))
+            counter_lock = threading.Lock()
+
+            def worker():
+                while True:
+                    with counter_lock:
+                        i = next(counter, None)
+                    if i is None:
+                        return
+                    send(args.warmup + i, time.perf_counter())
+            for _ in range(args.workers):
+                pool.submit(worker)
+    if sender.batcher is not None:
+        sender.batcher.stop()  # the last partial batch belongs to the run
+    wall = time.perf_counter() - started
+    cpu_self = _cpu_seconds(resource.RUSAGE_SELF) - cpu_before
+
+    if sender.session_stats is not None:
+        sender.session_stats.stop()
+    if sender.spool is not None:
+        sender.spool.stop()
+    children_before = _cpu_seconds(resource.RUSAGE_CHILDREN)
+    sender.encoder.shutdown()
+    for process in multiprocessing.active_children():
+        process.join(timeout=10)  # children's usage is only accounted once they are reaped
+    cpu_children = _cpu_seconds(resource.RUSAGE_CHILDREN) - children_before
+
+    latencies.sort()
+    stage = sender_module.STAGE_SECONDS
+    report = {
+        'config': {k: v for k, v in vars(args).items() if k != 'json'},
+        'frames': args.frames,
+        'ok': results['ok'],
+        'failed': results['failed'],
+        'wall_sec': wall,
+        'fps': results['ok'] / wall if wall > 0 else 0.0,
+        'latency_ms': {
+            'p50': percentile(latencies, 0.50) * 1000,
+            'p90': percentile(latencies, 0.90) * 1000,
+            'p99': percentile(latencies, 0.99) * 1000,
+            'max': (latencies[-1] if latencies else float('nan')) * 1000,
+        },
+        'stage_p50_ms': {name: (stage.quantile(0.5, stage=name) or 0.0) * 1000
+                         for name in ('encode', 's3_put', 'dynamodb_put')},
+        'cpu': {
+            'process_sec': cpu_self,
+            'encoder_processes_sec': cpu_children,
+            'cores_used': (cpu_self + cpu_children) / wall if wall > 0 else 0.0,
+        },
+        'peak_rss_mb': {
+            'process': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            'largest_child': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+        },
+        's3': {
+            'calls': s3.faults.calls - s3_calls,
+            'injected_failures': s3.faults.failures,
+            'mb_put': (s3.bytes_put - s3_bytes) / (1024 * 1024),
+        },
+        'dynamodb': {
+            'calls': dynamodb.faults.calls - ddb_calls,
+            'injected_failures': dynamodb.faults.failures,
+        },
+        'spool': sender.spool.stats() if sender.spool is not None else None,
+    }
+    return report
+
+
+def print_report(report):
+    config = report['config']
+    print(f"\n📊 send_detection: {config['width']}x{config['height']}, {config['boxes']} box(es)/frame, "
+          f"{config['workers']} worker(s), rate {config['rate'] or 'max'} fps"
+          f"{', batch mode' if config['batch'] else ''}")
+    print(f"   frames      {report['ok']} ok / {report['failed']} failed in {report['wall_sec']:.2f}s "
+          f"-> {report['fps']:.1f} fps")
+    latency = report['latency_ms']
+    print(f"   latency     p50 {latency['p50']:.1f} ms | p90 {latency['p90']:.1f} ms | "
+          f"p99 {latency['p99']:.1f} ms | max {latency['max']:.1f} ms")
+    stages = report['stage_p50_ms']
+    print(f"   stage p50   encode {stages['encode']:.1f} ms | s3_put {stages['s3_put']:.1f} ms | "
+          f"dynamodb_put {stages['dynamodb_put']:.1f} ms")
+    cpu = report['cpu']
+    print(f"   cpu         {cpu['process_sec']:.2f}s sender + {cpu['encoder_processes_sec']:.2f}s encoders "
+          f"= {cpu['cores_used']:.2f} cores")
+    rss = report['peak_rss_mb']
+    print(f"   peak rss    {rss['process']:.0f} MB sender, {rss['largest_child']:.0f} MB largest encoder")
+    print(f"   s3          {report['s3']['calls']} calls, {report['s3']['mb_put']:.1f} MB, "
+          f"{report['s3']['injected_failures']} injected failure(s)")
+    print(f"   dynamodb    {report['dynamodb']['calls']} calls, "
+          f"{report['dynamodb']['injected_failures']} injected failure(s)")
+    if report['spool']:
+        print(f"   spool       {report['spool']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end DetectionSender throughput benchmark')
+    parser.add_argument('--frames', type=int, default=300, help='Measured frames')
+    parser.add_argument('--warmup', type=int, default=10, help='Frames sent before measuring')
+    parser.add_argument('--rate', type=float, default=0.0, help='Arrival rate in fps (0 = as fast as possible)')
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--boxes', type=int, default=3, help='Detections per frame')
+    parser.add_argument('--workers', type=int, default=4, help='Threads calling send_detection (MOZUKU_UPLOAD_WORKERS)')
+    parser.add_argument('--fanout', type=int, default=16, help='MOZUKU_UPLOAD_FANOUT_THREADS')
+    parser.add_argument('--encode-processes', type=int, default=None, help='MOZUKU_ENCODE_PROCESSES (default: sender default)')
+    parser.add_argument('--s3-latency-ms', type=float, default=30.0)
+    parser.add_argument('--s3-jitter-ms', type=float, default=20.0)
+    parser.add_argument('--s3-failure-rate', type=float, default=0.0)
+    parser.add_argument('--ddb-latency-ms', type=float, default=10.0)
+    parser.add_argument('--ddb-jitter-ms', type=float, default=10.0)
+    parser.add_argument('--ddb-failure-rate', type=float, default=0.0)
+    parser.add_argument('--batch', action='store_true', help='Enable batch mode (MOZUKU_BATCH_ENABLED)')
+    parser.add_argument('--no-spool', action='store_true', help='Disable the upload spool')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--log-level', default='ERROR', help='Sender log level during the run')
+    parser.add_argument('--json', help='Also write the report to this file')
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Report written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
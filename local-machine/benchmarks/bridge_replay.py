@@ -0,0 +1,583 @@
+#!/usr/bin/env python3
+"""
+Record/replay harness for the detection bridge
+
+Records the three topics the bridge subscribes to (camera, annotated image,
+detections) and replays them into the bridge's callbacks, so its
+synchronization, tracking, buffering and upload hand-off can be load-tested
+and profiled without the camera or the YOLO node.
+
+A recording is a directory:
+
+    meta.json    format version, topics, labels, event count, duration
+    events.bin   one fixed-size record per message (EVENT_DTYPE), in arrival order
+    frames.bin   raw bgr8 frames, each starting on a page boundary
+
+Frames are stored undecoded and memory-mapped on replay, so playback hands
+the bridge zero-copy views and measures the bridge, not JPEG/PNG decoding.
+
+Replay drives DetectionBridgeCore directly (no rclpy needed) or, with --node
+and ROS2 installed, the real ROS2DetectionBridge with genuine messages. The
+callbacks and send_buffered() run on one thread as under the node's executor,
+at --speed 1 (recorded timing), N (N times faster) or 0 (as fast as possible).
+Uploads go to the in-process stand-ins of local_aws.py unless --aws is given.
+
+Usage:
+    python3 local-machine/benchmarks/bridge_replay.py record rec/ --duration 60     # needs ROS2
+    python3 local-machine/benchmarks/bridge_replay.py synth rec/ --frames 600 --fps 30
+    python3 local-machine/benchmarks/bridge_replay.py info rec/
+    python3 local-machine/benchmarks/bridge_replay.py replay rec/ --speed 0 --loops 3
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import threading
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, HERE)
+
+FORMAT_VERSION = 1
+PAGE = 4096
+KIND_CAMERA, KIND_ANNOTATED, KIND_DETECTION = 0, 1, 2
+KIND_NAMES = ('camera', 'annotated', 'detections')
+NO_STAMP = -1
+
+EVENT_DTYPE = np.dtype([
+    ('arrival_ns', '<i8'),  # since the start of the recording
+    ('stamp_ns', '<i8'),  # header stamp, NO_STAMP if the message had no header
+    ('kind', 'u1'),
+    ('channels', 'u1'),
+    ('label', '<u2'),  # index into meta['labels'] (detections)
+    ('height', '<u4'),
+    ('width', '<u4'),
+    ('offset', '<i8'),  # into frames.bin (images)
+    ('confidence', '<f4'),
+    ('center_x', '<f4'),
+    ('center_y', '<f4'),
+    ('box_width', '<f4'),
+    ('box_height', '<f4'),
+])
+
+
+class RecordingWriter:
+    """Appends messages to a recording directory; close() writes meta.json"""
+
+    def __init__(self, path, topics=None):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.topics = topics or {}
+        self.labels = []
+        self._label_ids = {}
+        self._events = open(os.path.join(path, 'events.bin'), 'wb')
+        self._frames = open(os.path.join(path, 'frames.bin'), 'wb')
+        self._frames_size = 0
+        self.counts = [0, 0, 0]
+        self.last_arrival_ns = 0
+        self._lock = threading.Lock()  # ROS2 callbacks may come from several threads
+
+    def _write_event(self, **fields):
+        record = np.zeros(1, dtype=EVENT_DTYPE)
+        for name, value in fields.items():
+            record[name] = value
+        self._events.write(record.tobytes())
+        self.counts[fields['kind']] += 1
+        self.last_arrival_ns = max(self.last_arrival_ns, fields['arrival_ns'])
+
+    def add_image(self, kind, arrival_ns, stamp_ns, frame):
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        if frame.ndim == 2:
+            frame = frame[:, :, None]
+        with self._lock:
+            offset = self._frames_size
+            self._frames.write(frame.tobytes())
+            padding = -frame.nbytes % PAGE
+            if padding:
+                self._frames.write(b'\0' * padding)
+            self._frames_size += frame.nbytes + padding
+            self._write_event(arrival_ns=arrival_ns, stamp_ns=NO_STAMP if stamp_ns is None else stamp_ns,
+                              kind=kind, channels=frame.shape[2], height=frame.shape[0], width=frame.shape[1],
+                              offset=offset)
+
+    def add_detection(self, arrival_ns, stamp_ns, label, confidence, center_x, center_y, width, height):
+        with self._lock:
+            if label not in self._label_ids:
+                self._label_ids[label] = len(self.labels)
+                self.labels.append(label)
+            self._write_event(arrival_ns=arrival_ns, stamp_ns=NO_STAMP if stamp_ns is None else stamp_ns,
+                              kind=KIND_DETECTION, label=self._label_ids[label], confidence=confidence,
+                              center_x=center_x, center_y=center_y, box_width=width, box_height=height)
+
+    def close(self):
+        with self._lock:
+            self._events.close()
+            self._frames.close()
+            meta = {
+                'version': FORMAT_VERSION,
+                'topics': self.topics,
+                'labels': self.labels,
+                'events': sum(self.counts),
+                'counts': dict(zip(KIND_NAMES, self.counts)),
+                'duration_sec': self.last_arrival_ns / 1e9,
+                'frames_mb': self._frames_size / (1024 * 1024),
+            }
+            with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+                json.dump(meta, f, indent=2)
+        return meta
+
+
+class Recording:
+    """Read side: events as a NumPy record array, frames as views into a read-only memory map"""
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json'), 'r') as f:
+            self.meta = json.load(f)
+        if self.meta.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported recording version {self.meta.get('version')} in {path}")
+        self.events = np.fromfile(os.path.join(path, 'events.bin'), dtype=EVENT_DTYPE)
+        frames_path = os.path.join(path, 'frames.bin')
+        self.frames = np.memmap(frames_path, dtype=np.uint8, mode='r') if os.path.getsize(frames_path) else None
+        self.labels = self.meta['labels']
+
+    def frame(self, event):
+        height, width, channels = int(event['height']), int(event['width']), int(event['channels'])
+        offset = int(event['offset'])
+        view = self.frames[offset:offset + height * width * channels].reshape(height, width, channels)
+        return view if channels > 1 else view[:, :, 0]
+
+    def stamp_span_ns(self):
+        """Stamp range plus one frame period: the stamp offset between replay loops"""
+        stamps = self.events['stamp_ns'][self.events['stamp_ns'] != NO_STAMP]
+        if stamps.size == 0:
+            return 0
+        camera = np.unique(self.events['stamp_ns'][(self.events['kind'] == KIND_CAMERA)
+                                                   & (self.events['stamp_ns'] != NO_STAMP)])
+        period = int(np.median(np.diff(camera))) if camera.size > 1 else 33_000_000
+        return int(stamps.max() - stamps.min()) + period
+
+
+# ------------------------------------------------------------------ messages
+
+class _Stamp:
+    __slots__ = ('sec', 'nanosec')
+
+    def __init__(self, stamp_ns):
+        self.sec, self.nanosec = divmod(int(stamp_ns), 1_000_000_000)
+
+
+class _Header:
+    __slots__ = ('stamp', 'frame_id')
+
+    def __init__(self, stamp_ns):
+        self.stamp = _Stamp(stamp_ns)
+        self.frame_id = ''
+
+
+class ReplayImage:
+    """Stand-in for sensor_msgs/Image carrying an already decoded bgr8 frame"""
+    __slots__ = ('header', 'frame', 'encoding')
+
+    def __init__(self, header, frame):
+        self.header = header
+        self.frame = frame
+        self.encoding = 'bgr8'
+
+
+class ReplayDetection:
+    """Stand-in for detection_msgs/Detection2D"""
+    __slots__ = ('header', 'class_name', 'confidence', 'center_x', 'center_y', 'width', 'height')
+
+    def __init__(self, header, class_name, confidence, center_x, center_y, width, height):
+        self.header = header
+        self.class_name = class_name
+        self.confidence = confidence
+        self.center_x = center_x
+        self.center_y = center_y
+        self.width = width
+        self.height = height
+
+
+class ArrayImageBridge:
+    """CvBridge stand-in for ReplayImage: the frame is the message's memory-mapped view"""
+
+    def imgmsg_to_cv2(self, msg, desired_encoding='bgr8'):
+        return msg.frame
+
+
+def _core_messages(recording):
+    """Build replay messages for DetectionBridgeCore"""
+    def build(event, stamp_ns):
+        header = _Header(stamp_ns) if stamp_ns is not None else None
+        if event['kind'] == KIND_DETECTION:
+            return ReplayDetection(header, recording.labels[int(event['label'])], float(event['confidence']),
+                                   float(event['center_x']), float(event['center_y']),
+                                   float(event['box_width']), float(event['box_height']))
+        return ReplayImage(header, recording.frame(event))
+    return build
+
+
+def _ros_messages(recording):
+    """Build genuine ROS2 messages for ROS2DetectionBridge"""
+    from cv_bridge import CvBridge
+    from detection_msgs.msg import Detection2D
+    cv_bridge = CvBridge()
+
+    def build(event, stamp_ns):
+        if event['kind'] == KIND_DETECTION:
+            msg = Detection2D()
+            for name, value in (('class_name', recording.labels[int(event['label'])]),
+                                ('confidence', float(event['confidence'])),
+                                ('center_x', float(event['center_x'])), ('center_y', float(event['center_y'])),
+                                ('width', float(event['box_width'])), ('height', float(event['box_height']))):
+                if hasattr(msg, name):
+                    setattr(msg, name, value)
+        else:
+            msg = cv_bridge.cv2_to_imgmsg(np.ascontiguousarray(recording.frame(event)), encoding='bgr8')
+        if stamp_ns is not None and hasattr(msg, 'header'):
+            msg.header.stamp.sec, msg.header.stamp.nanosec = divmod(int(stamp_ns), 1_000_000_000)
+        return msg
+    return build
+
+
+# ------------------------------------------------------------------ record
+
+def record(args):
+    """Subscribe to the bridge's topics and write everything received to a recording"""
+    import mozuku_detection_sender as sender_module
+    if not sender_module.ROS2_AVAILABLE:
+        print("❌ Recording needs ROS2 (rclpy, cv_bridge, detection_msgs); use 'synth' to generate a recording")
+        return 1
+    import rclpy
+    from rclpy.node import Node
+    from sensor_msgs.msg import Image
+    from detection_msgs.msg import Detection2D
+    from cv_bridge import CvBridge
+
+    topics = {'camera': sender_module.CAMERA_TOPIC, 'annotated': sender_module.ANNOTATED_IMAGE_TOPIC,
+              'detections': sender_module.DETECTIONS_TOPIC}
+    writer = RecordingWriter(args.path, topics)
+    started = time.monotonic_ns()
+
+    def stamp_of(msg):
+        header = getattr(msg, 'header', None)
+        return None if header is None else int(header.stamp.sec) * 1_000_000_000 + int(header.stamp.nanosec)
+
+    class Recorder(Node):
+        def __init__(self):
+            super().__init__('mozuku_bridge_recorder')
+            self.cv_bridge = CvBridge()
+            self.create_subscription(Image, topics['camera'], lambda m: self.image(KIND_CAMERA, m), 10)
+            self.create_subscription(Image, topics['annotated'], lambda m: self.image(KIND_ANNOTATED, m), 10)
+            self.create_subscription(Detection2D, topics['detections'], self.detection, 10)
+
+        def image(self, kind, msg):
+            arrival = time.monotonic_ns() - started
+            writer.add_image(kind, arrival, stamp_of(msg), self.cv_bridge.imgmsg_to_cv2(msg, desired_encoding='bgr8'))
+
+        def detection(self, msg):
+            arrival = time.monotonic_ns() - started
+            writer.add_detection(arrival, stamp_of(msg), getattr(msg, 'class_name', 'unknown'),
+                                 float(getattr(msg, 'confidence', getattr(msg, 'score', 0.0))),
+                                 float(getattr(msg, 'center_x', 0.0)), float(getattr(msg, 'center_y', 0.0)),
+                                 float(getattr(msg, 'width', 0.0)), float(getattr(msg, 'height', 0.0)))
+
+    rclpy.init()
+    node = Recorder()
+    print(f"⏺️  Recording {', '.join(topics.values())} to {args.path}"
+          + (f" for {args.duration:.0f}s" if args.duration else " (Ctrl+C to stop)"))
+    try:
+        while rclpy.ok() and (not args.duration or time.monotonic_ns() - started < args.duration * 1e9):
+            rclpy.spin_once(node, timeout_sec=0.1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        node.destroy_node()
+        rclpy.shutdown()
+        meta = writer.close()
+    print(f"💾 {meta['events']} messages ({meta['counts']}), {meta['duration_sec']:.1f}s, "
+          f"{meta['frames_mb']:.0f} MB of frames")
+    return 0
+
+
+# ------------------------------------------------------------------ synth
+
+def synth(args):
+    """Generate a recording of impurities moving along a belt, with YOLO-like inference delay"""
+    import cv2
+    rng = np.random.default_rng(args.seed)
+    width, height, fps = args.width, args.height, args.fps
+    period_ns = int(1e9 / fps)
+    belt = rng.normal(150, 8, (height, width * 2)).astype(np.float32)
+    belt = cv2.GaussianBlur(belt, (0, 0), 3)
+    belt = cv2.cvtColor(np.clip(belt, 0, 255).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+    belt[..., 1] = np.clip(belt[..., 1].astype(np.int16) + 25, 0, 255).astype(np.uint8)
+
+    writer = RecordingWriter(args.path, {'camera': 'synthetic', 'annotated': 'synthetic', 'detections': 'synthetic'})
+    impurities = []  # [x, y, w, h, confidence]
+    stamp0 = 1_700_000_000 * 1_000_000_000
+    for i in range(args.frames):
+        # Impurities enter on the left and move with the belt
+        for _ in range(rng.poisson(args.spawn_rate)):
+            w, h = int(rng.integers(20, 90)), int(rng.integers(20, 90))
+            impurities.append([-float(w), float(rng.uniform(0, height - h)), w, h, float(rng.uniform(0.35, 0.95))])
+        for impurity in impurities:
+            impurity[0] += args.belt_px
+        impurities = [imp for imp in impurities if imp[0] < width]
+
+        shift = int(i * args.belt_px) % width
+        raw = np.ascontiguousarray(belt[:, width - shift:2 * width - shift])
+        visible = []
+        for x, y, w, h, confidence in impurities:
+            cx, cy = x + w / 2.0, y + h / 2.0
+            if 0 <= cx < width:
+                cv2.ellipse(raw, (int(cx), int(cy)), (w // 3, h // 3), 0, 0, 360, (30, 40, 35), -1)
+                visible.append((cx, cy, w, h, float(np.clip(confidence + rng.normal(0, 0.03), 0.05, 0.99))))
+        annotated = raw.copy()
+        for cx, cy, w, h, _ in visible:
+            cv2.rectangle(annotated, (int(cx - w / 2), int(cy - h / 2)), (int(cx + w / 2), int(cy + h / 2)), (0, 255, 0), 2)
+
+        stamp = stamp0 + i * period_ns
+        arrival = i * period_ns + int(rng.uniform(0, args.jitter_ms) * 1e6)
+        writer.add_image(KIND_CAMERA, arrival, stamp, raw)
+        inferred = arrival + int((args.inference_ms + rng.uniform(0, args.jitter_ms)) * 1e6)
+        writer.add_image(KIND_ANNOTATED, inferred, stamp, annotated)
+        for n, (cx, cy, w, h, confidence) in enumerate(visible):
+            writer.add_detection(inferred + n * 100_000, stamp, 'impurity', confidence, cx, cy, w, h)
+    meta = writer.close()
+    # Messages of different topics interleave, so put the events into arrival order
+    events = np.fromfile(os.path.join(args.path, 'events.bin'), dtype=EVENT_DTYPE)
+    events[np.argsort(events['arrival_ns'], kind='stable')].tofile(os.path.join(args.path, 'events.bin'))
+    print(f"💾 Synthesized {meta['events']} messages ({meta['counts']}), {meta['duration_sec']:.1f}s, "
+          f"{meta['frames_mb']:.0f} MB of frames in {args.path}")
+    return 0
+
+
+# ------------------------------------------------------------------ replay
+
+class CallbackTimer:
+    """Per-callback durations, kept in memory for exact percentiles"""
+
+    def __init__(self):
+        self.samples = {}
+
+    def time(self, name, fn, *args):
+        start = time.perf_counter()
+        fn(*args)
+        self.samples.setdefault(name, []).append(time.perf_counter() - start)
+
+    def summary(self, name):
+        values = sorted(self.samples.get(name, []))
+        if not values:
+            return None
+        pick = lambda q: values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+        return {'count': len(values), 'p50_ms': pick(0.5) * 1000, 'p99_ms': pick(0.99) * 1000,
+                'max_ms': values[-1] * 1000, 'total_sec': sum(values)}
+
+
+def replay(args):
+    os.environ.setdefault('MOZUKU_LOG_LEVEL', args.log_level)
+    if not args.aws:
+        os.environ.setdefault('MOZUKU_SPOOL_ENABLED', 'false')
+        os.environ.setdefault('MOZUKU_SESSION_STATS_ENABLED', 'false')
+    import mozuku_detection_sender as sender_module
+
+    recording = Recording(args.path)
+    if not args.aws:
+        from local_aws import FaultInjector, install
+        install(sender_module,
+                s3_faults=FaultInjector(args.s3_latency_ms, args.s3_jitter_ms, args.s3_failure_rate, seed=args.seed),
+                dynamodb_faults=FaultInjector(args.ddb_latency_ms, args.ddb_jitter_ms, seed=args.seed + 1))
+    sender = sender_module.DetectionSender()
+    sender_module.sending_enabled = True
+
+    if args.node:
+        if not sender_module.ROS2_AVAILABLE:
+            print("❌ --node needs ROS2 (rclpy, cv_bridge, detection_msgs)")
+            return 1
+        import rclpy
+        rclpy.init()
+        bridge = sender_module.ROS2DetectionBridge(sender)  # its timer never fires: nothing spins the node
+        build = _ros_messages(recording)
+    else:
+        bridge = sender_module.DetectionBridgeCore(sender, ArrayImageBridge())
+        bridge._register_metrics()
+        build = _core_messages(recording)
+    callbacks = (bridge.camera_callback, bridge.annotated_image_callback, bridge.detection_callback)
+
+    timer = CallbackTimer()
+    events = recording.events
+    duration = recording.meta['duration_sec']
+    span_ns = recording.stamp_span_ns()
+    tick = sender_module.DRAIN_TICK_SEC
+    max_lag = 0.0
+    delivered = 0
+    print(f"▶️  Replaying {len(events)} messages ({duration:.1f}s) x{args.loops} at "
+          f"{'%gx' % args.speed if args.speed > 0 else 'max speed'} into "
+          f"{'ROS2DetectionBridge' if args.node else 'DetectionBridgeCore'}")
+
+    started = time.perf_counter()
+    next_tick = started + tick
+    for loop in range(args.loops):
+        loop_offset = loop * (duration + tick)
+        for event in events:
+            target = started + (loop_offset + event['arrival_ns'] / 1e9) / args.speed if args.speed > 0 else 0.0
+            while True:
+                now = time.perf_counter()
+                if now >= next_tick:
+                    timer.time('send_buffered', bridge.send_buffered)
+                    next_tick = max(next_tick + tick, time.perf_counter())
+                    continue
+                if now >= target:
+                    break
+                time.sleep(min(target, next_tick) - now)
+            if args.speed > 0:
+                max_lag = max(max_lag, now - target)
+            stamp = int(event['stamp_ns'])
+            msg = build(event, None if stamp == NO_STAMP else stamp + loop * span_ns)
+            kind = int(event['kind'])
+            timer.time(KIND_NAMES[kind], callbacks[kind], msg)
+            delivered += 1
+    replay_wall = time.perf_counter() - started
+
+    # Let the bridge hand over what it still buffers and the workers finish
+    deadline = time.perf_counter() + args.drain_timeout
+    queue = bridge.upload_queue
+    while time.perf_counter() < deadline:
+        timer.time('send_buffered', bridge.send_buffered)
+        stats = queue.stats()
+        if not len(bridge.drain_scheduler) and not bridge.tracker.active_tracks() \
+                and stats['depth'] == 0 and stats['in_flight'] == 0:
+            break
+        time.sleep(tick)
+    bridge.shutdown(timeout=args.drain_timeout)
+    total_wall = time.perf_counter() - started
+    sender_module.shutdown_pipeline(sender)
+    if args.node:
+        bridge.destroy_node()
+        rclpy.shutdown()
+
+    report = {
+        'recording': args.path,
+        'messages': delivered,
+        'replay_sec': replay_wall,
+        'total_sec': total_wall,
+        'messages_per_sec': delivered / replay_wall if replay_wall > 0 else 0.0,
+        'achieved_speed': duration * args.loops / replay_wall if replay_wall > 0 else 0.0,
+        'max_lag_ms': max_lag * 1000,
+        'callbacks': {name: timer.summary(name) for name in KIND_NAMES + ('send_buffered',)},
+        'sync': {'bundles': bridge.synchronizer.bundles, 'frames_dropped': bridge.synchronizer.frames_dropped,
+                 'detections_dropped': bridge.synchronizer.detections_dropped},
+        'tracks': bridge.tracker.tracks_started,
+        'frame_store': bridge.frame_store.stats(),
+        'upload_queue': queue.stats(),
+        'frames': {
+            'uploaded': sender_module.FRAMES_UPLOADED.value(),
+            'failed': sender_module.FRAMES_FAILED.value(),
+            'suppressed_track': sender_module.FRAMES_SUPPRESSED.value(reason='track'),
+            'suppressed_near_duplicate': sender_module.FRAMES_SUPPRESSED.value(reason='near_duplicate'),
+            'dropped_queue_full': sender_module.FRAMES_DROPPED.value(reason='queue_full'),
+            'dropped_missing_frame': sender_module.FRAMES_DROPPED.value(reason='missing_frame'),
+            'dropped_store_full': sender_module.FRAMES_DROPPED.value(reason='store_full'),
+            'dropped_stale': sender_module.FRAMES_DROPPED.value(reason='stale'),
+        },
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Report written to {args.json}")
+    return 0
+
+
+def print_report(report):
+    lag = f", max lag {report['max_lag_ms']:.1f} ms" if report['max_lag_ms'] else ''
+    print(f"\n📊 {report['messages']} messages in {report['replay_sec']:.2f}s "
+          f"({report['messages_per_sec']:.0f} msg/s, {report['achieved_speed']:.2f}x recorded speed{lag}), "
+          f"{report['total_sec']:.2f}s until uploads finished")
+    print(f"   {'callback':<14} {'count':>7} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} {'total s':>9}")
+    for name, summary in report['callbacks'].items():
+        if summary:
+            print(f"   {name:<14} {summary['count']:>7} {summary['p50_ms']:>9.3f} {summary['p99_ms']:>9.3f} "
+                  f"{summary['max_ms']:>9.2f} {summary['total_sec']:>9.2f}")
+    sync = report['sync']
+    print(f"   sync          {sync['bundles']} bundles, {sync['frames_dropped']} frames and "
+          f"{sync['detections_dropped']} detections dropped unmatched, {report['tracks']} tracks")
+    print(f"   frame store   {report['frame_store']}")
+    print(f"   upload queue  {report['upload_queue']}")
+    print(f"   frames        {report['frames']}")
+    print(f"   peak rss      {report['peak_rss_mb']:.0f} MB")
+
+
+def info(args):
+    recording = Recording(args.path)
+    meta = recording.meta
+    events = recording.events
+    print(f"📼 {args.path}: {meta['events']} messages over {meta['duration_sec']:.1f}s, "
+          f"{meta['frames_mb']:.0f} MB of frames")
+    for kind, name in enumerate(KIND_NAMES):
+        selected = events[events['kind'] == kind]
+        if not selected.size:
+            continue
+        rate = selected.size / meta['duration_sec'] if meta['duration_sec'] else 0.0
+        shape = f", {selected[0]['width']}x{selected[0]['height']}" if kind != KIND_DETECTION else ''
+        print(f"   {name:<11} {selected.size:>7} ({rate:.1f}/s{shape}) <- {meta['topics'].get(name, '?')}")
+    if meta['labels']:
+        print(f"   labels      {', '.join(meta['labels'])}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record and replay the detection bridge topics')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('record', help='Record the live topics (needs ROS2)')
+    p.add_argument('path')
+    p.add_argument('--duration', type=float, default=0, help='Seconds to record (0 = until Ctrl+C)')
+    p.set_defaults(func=record)
+
+    p = sub.add_parser('synth', help='Generate a synthetic recording (no camera or ROS2 needed)')
+    p.add_argument('path')
+    p.add_argument('--frames', type=int, default=300)
+    p.add_argument('--fps', type=float, default=30.0)
+    p.add_argument('--width', type=int, default=1280)
+    p.add_argument('--height', type=int, default=720)
+    p.add_argument('--spawn-rate', type=float, default=0.1, help='New impurities per frame (Poisson mean)')
+    p.add_argument('--belt-px', type=float, default=12.0, help='Belt motion per frame in pixels')
+    p.add_argument('--inference-ms', type=float, default=40.0, help='Delay of annotated image and detections')
+    p.add_argument('--jitter-ms', type=float, default=5.0)
+    p.add_argument('--seed', type=int, default=0)
+    p.set_defaults(func=synth)
+
+    p = sub.add_parser('info', help='Summarize a recording')
+    p.add_argument('path')
+    p.set_defaults(func=info)
+
+    p = sub.add_parser('replay', help='Replay a recording into the bridge callbacks')
+    p.add_argument('path')
+    p.add_argument('--speed', type=float, default=1.0, help='1 = recorded timing, N = N times faster, 0 = max')
+    p.add_argument('--loops', type=int, default=1, help='Play the recording this many times (stamps keep increasing)')
+    p.add_argument('--node', action='store_true', help='Replay into ROS2DetectionBridge with real messages (needs ROS2)')
+    p.add_argument('--aws', action='store_true', help='Upload to the real AWS resources instead of local stand-ins')
+    p.add_argument('--s3-latency-ms', type=float, default=30.0)
+    p.add_argument('--s3-jitter-ms', type=float, default=20.0)
+    p.add_argument('--s3-failure-rate', type=float, default=0.0)
+    p.add_argument('--ddb-latency-ms', type=float, default=10.0)
+    p.add_argument('--ddb-jitter-ms', type=float, default=10.0)
+    p.add_argument('--drain-timeout', type=float, default=30.0, help='Seconds to wait for uploads after the replay')
+    p.add_argument('--log-level', default='ERROR', help='Sender log level during the replay')
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--json', help='Also write the report to this file')
+    p.set_defaults(func=replay)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+In-process stand-ins for the S3 and DynamoDB calls mozuku_detection_sender.py makes
+
+LocalS3 and LocalDynamoDB keep everything in memory and can inject latency
+(fixed + uniform jitter, per call) and failures (a probability per call), so
+the sender can be benchmarked or replayed without network access or AWS
+credentials. install() swaps them in for the sender's module-level clients.
+
+Only the calls the sender uses are implemented: S3 put_object/get_object/
+delete_object/head_object, DynamoDB put_item/update_item/query/get_item.
+"""
+import io
+import time
+import random
+import threading
+from botocore.exceptions import ClientError
+
+
+class FaultInjector:
+    """
+    Args:
+        latency_ms: fixed delay per call
+        jitter_ms: extra uniform delay in [0, jitter_ms)
+        failure_rate: probability that a call raises ClientError (after its delay)
+        seed: makes the failure sequence repeatable
+    """
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, failure_rate=0.0, seed=None):
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+
+    def __call__(self, operation):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + (self._rng.random() * self.jitter if self.jitter else 0.0)
+            fail = self.failure_rate > 0 and self._rng.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise ClientError({'Error': {'Code': 'ServiceUnavailable', 'Message': 'Injected failure'}}, operation)
+
+
+class LocalS3:
+    def __init__(self, faults=None):
+        self.faults = faults or FaultInjector()
+        self.objects = {}  # (bucket, key) -> bytes
+        self.bytes_put = 0
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.faults('PutObject')
+        body = Body if isinstance(Body, bytes) else bytes(Body)
+        with self._lock:
+            self.objects[(Bucket, Key)] = body
+            self.bytes_put += len(body)
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}, 'ETag': '"local"'}
+
+    def _get(self, Bucket, Key, operation):
+        with self._lock:
+            body = self.objects.get((Bucket, Key))
+        if body is None:
+            raise ClientError({'Error': {'Code': 'NoSuchKey', 'Message': 'Not found'}}, operation)
+        return body
+
+    def get_object(self, Bucket, Key, Range=None, **kwargs):
+        self.faults('GetObject')
+        body = self._get(Bucket, Key, 'GetObject')
+        if Range:
+            first, _, last = Range[len('bytes='):].partition('-')
+            body = body[int(first):int(last) + 1]
+        return {'Body': io.BytesIO(body), 'ContentLength': len(body)}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self.faults('HeadObject')
+        return {'ContentLength': len(self._get(Bucket, Key, 'HeadObject')), 'ETag': '"local"'}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self.faults('DeleteObject')
+        with self._lock:
+            self.objects.pop((Bucket, Key), None)
+        return {}
+
+
+class LocalTable:
+    """
+    put_item/get_item keyed by the first two attributes of key_names.
+    update_item understands the "ADD a :x, b :y SET c = :z" expressions the
+    session aggregator writes; query returns query_items (e.g. open sessions).
+    """
+
+    def __init__(self, name, key_names, faults=None, query_items=None):
+        self.name = name
+        self.key_names = key_names
+        self.faults = faults or FaultInjector()
+        self.items = {}
+        self.query_items = list(query_items or [])
+        self._lock = threading.Lock()
+
+    def _key(self, item):
+        return tuple(item.get(k) for k in self.key_names)
+
+    def put_item(self, Item, **kwargs):
+        self.faults('PutItem')
+        with self._lock:
+            self.items[self._key(Item)] = dict(Item)
+        return {}
+
+    def get_item(self, Key, **kwargs):
+        self.faults('GetItem')
+        with self._lock:
+            item = self.items.get(self._key(Key))
+        return {'Item': dict(item)} if item else {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues=None, ReturnValues=None, **kwargs):
+        self.faults('UpdateItem')
+        values = ExpressionAttributeValues or {}
+        with self._lock:
+            item = self.items.setdefault(self._key(Key), dict(Key))
+            clause = None
+            for token in UpdateExpression.replace(',', ' , ').split():
+                if token in ('ADD', 'SET'):
+                    clause, pending = token, []
+                    continue
+                pending.append(token)
+                if token == ',' or not token.startswith(':'):
+                    continue
+                if clause == 'ADD' and len(pending) == 2:
+                    item[pending[0]] = item.get(pending[0], 0) + values[token]
+                elif clause == 'SET' and len(pending) == 3:
+                    item[pending[0]] = values[token]
+                pending = []
+            updated = dict(item)
+        return {'Attributes': updated} if ReturnValues else {}
+
+    def query(self, **kwargs):
+        self.faults('Query')
+        return {'Items': [dict(item) for item in self.query_items]}
+
+
+class LocalDynamoDB:
+    """Resource-like: Table(name) returns the same LocalTable every time"""
+
+    KEYS = {
+        'FrameDetections-dev': ['frameId'],
+        'ImpurityData-dev': ['impurityId'],
+        'DetectionStats-dev': ['userId', 'timePeriod'],
+        'ROS2LaunchJobs-dev': ['jobId'],
+    }
+
+    def __init__(self, faults=None):
+        self.faults = faults or FaultInjector()
+        self.tables = {}
+        self._lock = threading.Lock()
+
+    def Table(self, name):
+        with self._lock:
+            if name not in self.tables:
+                self.tables[name] = LocalTable(name, self.KEYS.get(name, ['id']), self.faults)
+            return self.tables[name]
+
+
+def install(sender_module, s3_faults=None, dynamodb_faults=None, user_id='web-user'):
+    """
+    Point the sender module's clients and tables at fresh stand-ins (before
+    DetectionSender() is created). One open session covering all time is
+    returned to the session aggregator's queries. Returns (s3, dynamodb).
+    """
+    s3 = LocalS3(s3_faults)
+    dynamodb = LocalDynamoDB(dynamodb_faults)
+    stats = dynamodb.Table('DetectionStats-dev')
+    stats.items[(user_id, 'session#local')] = {'userId': user_id, 'timePeriod': 'session#local',
+                                                'periodType': 'session', 'startTime': 0, 'endTime': 0}
+    stats.query_items = [{'timePeriod': 'session#local', 'startTime': 0, 'endTime': 0}]
+    sender_module.s3_client = s3
+    sender_module.dynamodb = dynamodb
+    sender_module.frame_table = dynamodb.Table('FrameDetections-dev')
+    sender_module.impurity_table = dynamodb.Table('ImpurityData-dev')
+    sender_module.stats_table = stats
+    sender_module.launch_jobs_table = dynamodb.Table('ROS2LaunchJobs-dev')
+    return s3, dynamodb
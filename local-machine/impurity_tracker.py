@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Cross-frame impurity tracking for mozuku_detection_sender.py
+
+One impurity passing under the camera is detected on every frame it is
+visible in. The tracker links those detections into tracks (IoU on the
+motion-predicted box, falling back to centroid distance) and holds back each
+track's frames so that only its best frame - or its first and best frame - is
+uploaded, instead of one FrameDetections item, crop and frame pair per frame.
+
+Motion between frames is compensated with the belt velocity: taken from the
+configured belt speed and mm_per_px when known, otherwise estimated from the
+displacement of matched tracks.
+
+Kept free of boto3/ROS2 imports so it can be exercised on its own.
+"""
+
+import math
+import time
+import logging
+
+logger = logging.getLogger('mozuku_sender.tracker')
+
+POLICIES = ('off', 'best', 'first_and_best')
+
+
+def _corners(detection):
+    bbox = detection.get('bbox', {})
+    x = float(bbox.get('x', 0))
+    y = float(bbox.get('y', 0))
+    return (x, y, x + float(bbox.get('width', 0)), y + float(bbox.get('height', 0)))
+
+
+def _iou(a, b):
+    inter_w = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    inter_h = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = inter_w * inter_h
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _center(box):
+    return ((box[0] + box[2]) / 2.0, (box[1] + box[3]) / 2.0)
+
+
+class _HeldFrame:
+    """A frame's detections kept back while tracks may still choose it"""
+    __slots__ = ('detections', 'refs', 'emitted')
+
+    def __init__(self, detections):
+        self.detections = detections
+        self.refs = 0
+        self.emitted = False
+
+
+class Track:
+    __slots__ = ('track_id', 'label', 'box', 'stamp', 'velocity', 'last_seen', 'started',
+                 'hits', 'best', 'best_score', 'uploaded')
+
+    def __init__(self, track_id, label, box, stamp, now):
+        self.track_id = track_id
+        self.label = label
+        self.box = box
+        self.stamp = stamp
+        self.velocity = None  # px/s, own estimate
+        self.last_seen = now
+        self.started = now
+        self.hits = 0
+        self.best = None  # _HeldFrame
+        self.best_score = -1.0
+        self.uploaded = False  # 'best' policy: frame already sent, later frames are not uploaded for this track
+
+
+class ImpurityTracker:
+    """
+    Args:
+        release: release(detections) frees the frame-store references of a frame that will not be uploaded
+        policy: 'best' uploads one frame per track, 'first_and_best' also sends the
+                first frame right away, 'off' passes every frame through
+        iou_threshold: minimum IoU between the predicted track box and a detection
+        max_distance_px: centroid distance accepted when boxes do not overlap enough
+        max_gap_sec: a track ends when it has not been seen for this long
+        max_track_sec: a track is uploaded after this long even if still visible
+        mm_per_px: camera scale, used with belt_speed_mm_s
+        belt_speed_mm_s: known belt speed (0 = estimate motion from the tracks)
+        belt_direction: unit vector of belt motion in image coordinates
+    """
+
+    def __init__(self, release, policy='best', iou_threshold=0.3, max_distance_px=80.0, max_gap_sec=0.3,
+                 max_track_sec=5.0, mm_per_px=0.25, belt_speed_mm_s=0.0, belt_direction=(1.0, 0.0)):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown track policy: {policy} (expected one of {POLICIES})")
+        self.release = release
+        self.policy = policy
+        self.iou_threshold = iou_threshold
+        self.max_distance_px = max_distance_px
+        self.max_gap_sec = max_gap_sec
+        self.max_track_sec = max_track_sec
+        self._belt_velocity = None
+        if belt_speed_mm_s > 0 and mm_per_px > 0:
+            norm = math.hypot(*belt_direction) or 1.0
+            speed_px = belt_speed_mm_s / mm_per_px
+            self._belt_velocity = (speed_px * belt_direction[0] / norm, speed_px * belt_direction[1] / norm)
+        self._estimated_velocity = None
+        self._tracks = []
+        self._next_id = 1
+        self.tracks_started = 0
+        self.frames_suppressed = 0
+
+    def active_tracks(self):
+        return len(self._tracks)
+
+    def _velocity(self, track):
+        if self._belt_velocity is not None:
+            return self._belt_velocity
+        return track.velocity or self._estimated_velocity or (0.0, 0.0)
+
+    def _predict(self, track, stamp):
+        dt = max(0.0, stamp - track.stamp)
+        vx, vy = self._velocity(track)
+        return (track.box[0] + vx * dt, track.box[1] + vy * dt, track.box[2] + vx * dt, track.box[3] + vy * dt)
+
+    def _match(self, detections, boxes, stamp):
+        """Greedy one-to-one assignment of detections to tracks; returns {detection index: track}"""
+        candidates = []
+        for track in self._tracks:
+            predicted = self._predict(track, stamp)
+            pc = _center(predicted)
+            for i, detection in enumerate(detections):
+                if detection.get('label') != track.label:
+                    continue
+                iou = _iou(predicted, boxes[i])
+                dc = _center(boxes[i])
+                distance = math.hypot(dc[0] - pc[0], dc[1] - pc[1])
+                if iou >= self.iou_threshold or distance <= self.max_distance_px:
+                    candidates.append((-iou, distance, i, track))
+        candidates.sort(key=lambda c: (c[0], c[1]))
+        matched, used = {}, set()
+        for _, _, i, track in candidates:
+            if i in matched or id(track) in used:
+                continue
+            matched[i] = track
+            used.add(id(track))
+        return matched
+
+    def _observe(self, track, box, stamp, now):
+        dt = stamp - track.stamp
+        if dt > 0:
+            (ox, oy), (nx, ny) = _center(track.box), _center(box)
+            velocity = ((nx - ox) / dt, (ny - oy) / dt)
+            track.velocity = velocity
+            if self._estimated_velocity is None:
+                self._estimated_velocity = velocity
+            else:
+                ex, ey = self._estimated_velocity
+                self._estimated_velocity = (0.8 * ex + 0.2 * velocity[0], 0.8 * ey + 0.2 * velocity[1])
+        track.box = box
+        track.stamp = stamp
+        track.last_seen = now
+        track.hits += 1
+
+    def _unref(self, held):
+        held.refs -= 1
+        if held.refs <= 0 and not held.emitted:
+            self.frames_suppressed += 1
+            self.release(held.detections)
+
+    def _emit(self, held, out):
+        """Send a held frame; crops are made only for the detections whose track chose it"""
+        if held.emitted:
+            return
+        held.emitted = True
+        for detection in held.detections:
+            track = detection.pop('_track', None)
+            detection['track_best'] = track is not None and track.best is held
+            if detection['track_best'] and self.policy == 'best':
+                track.uploaded = True
+        out.append(held.detections)
+
+    def update(self, detections, stamp=None, now=None):
+        """Track one frame's detections; returns the frames (detection lists) to upload now"""
+        now = time.time() if now is None else now
+        stamp = now if stamp is None else stamp
+        if self.policy == 'off' or not detections:
+            return [detections] if detections else []
+
+        boxes = [_corners(d) for d in detections]
+        matched = self._match(detections, boxes, stamp)
+        held = _HeldFrame(detections)
+        out = []
+        new_tracks = []
+        for i, detection in enumerate(detections):
+            track = matched.get(i)
+            if track is None:
+                # A second box on the same impurity in this frame joins that impurity's track
+                for j, other in matched.items():
+                    if other.label == detection.get('label') and _iou(boxes[i], boxes[j]) >= self.iou_threshold:
+                        detection['track_id'] = other.track_id
+                        detection['_track'] = None
+                        break
+                else:
+                    track = Track(self._next_id, detection.get('label'), boxes[i], stamp, now)
+                    self._next_id += 1
+                    self.tracks_started += 1
+                    self._tracks.append(track)
+                    new_tracks.append(track)
+                    matched[i] = track
+                if track is None:
+                    continue
+            else:
+                self._observe(track, boxes[i], stamp, now)
+            detection['track_id'] = track.track_id
+            detection['_track'] = track
+
+            # On ties prefer a frame another track already chose, so fewer frames are uploaded
+            score = float(detection.get('confidence', 0.0))
+            if not track.uploaded and (score > track.best_score or (score == track.best_score and held.refs > 0)):
+                if track.best is not None:
+                    self._unref(track.best)
+                track.best = held
+                track.best_score = score
+                held.refs += 1
+
+        if self.policy == 'first_and_best' and new_tracks:
+            self._emit(held, out)
+
+        if held.refs == 0 and not held.emitted:
+            self.frames_suppressed += 1
+            self.release(detections)
+
+        out.extend(self.poll(now))
+        return out
+
+    def poll(self, now=None):
+        """End tracks that left the view (or ran too long); returns their frames to upload"""
+        now = time.time() if now is None else now
+        out = []
+        remaining = []
+        for track in self._tracks:
+            if now - track.last_seen > self.max_gap_sec or now - track.started > self.max_track_sec:
+                self._finish(track, out)
+            else:
+                remaining.append(track)
+        self._tracks = remaining
+        return out
+
+    def flush(self):
+        """End every track (shutdown / sending disabled)"""
+        out = []
+        for track in self._tracks:
+            self._finish(track, out)
+        self._tracks = []
+        return out
+
+    def _finish(self, track, out):
+        held = track.best
+        if held is not None:
+            if not track.uploaded:
+                self._emit(held, out)
+            track.best = None
+            self._unref(held)
+        logger.debug("🧭 Track %d ended after %d frame(s)", track.track_id, track.hits + 1)
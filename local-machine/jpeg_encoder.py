@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+JPEG encoding off the upload threads for mozuku_detection_sender.py
+
+Large frames are copied once into a multiprocessing.shared_memory block and
+encoded by a pool of worker processes, so encoding scales across cores and
+does not compete with the ROS2 executor for the GIL. Only the (small) encoded
+bytes travel back through the pool's pipe. Small images such as crops are
+encoded in the calling thread, where the shared-memory round trip would cost
+more than it saves.
+
+This module is kept free of boto3/ROS2 imports because every worker process
+imports it.
+"""
+
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger('mozuku_sender.encoder')
+
+
+def _attach_shared_memory(name):
+    """
+    Attach to a block created (and later unlinked) by the parent process.
+    Spawned workers share the parent's resource tracker, where registering
+    the same name twice is a no-op, so attaching does not take ownership.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def _encode_shared(name, shape, dtype, quality):
+    """Worker: encode the frame stored in shared memory block `name`"""
+    shm = _attach_shared_memory(name)
+    try:
+        frame = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        del frame
+        return buffer.tobytes() if ok else None
+    finally:
+        shm.close()
+
+
+def encode_jpeg(frame, quality=90):
+    """Encode in the calling thread"""
+    ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes() if ok else None
+
+
+class JpegEncoderPool:
+    """
+    Process pool for JPEG encoding with shared-memory frame handoff.
+
+    processes=0 disables the pool and encodes every image in the calling thread.
+    If the pool breaks (e.g. a worker is killed), encoding falls back to the
+    calling thread instead of failing uploads.
+    """
+
+    def __init__(self, processes, min_shared_bytes=256 * 1024):
+        self.processes = max(0, int(processes))
+        self.min_shared_bytes = min_shared_bytes
+        self._pool = None
+        if self.processes > 0:
+            # spawn: the sender process runs boto3/ROS2 threads, which must not be forked
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+
+    def encode(self, frame, quality=90):
+        """Return JPEG bytes for frame, or None if encoding failed"""
+        if self._pool is None or frame.nbytes < self.min_shared_bytes:
+            return encode_jpeg(frame, quality)
+
+        frame = np.ascontiguousarray(frame)
+        shm = shared_memory.SharedMemory(create=True, size=frame.nbytes)
+        try:
+            np.ndarray(frame.shape, dtype=frame.dtype, buffer=shm.buf)[...] = frame
+            future = self._pool.submit(_encode_shared, shm.name, frame.shape, frame.dtype.str, quality)
+            return future.result()
+        except Exception as e:
+            logger.warning("   ⚠️ Encoder pool error (%s: %s), encoding in-thread", type(e).__name__, e)
+            return encode_jpeg(frame, quality)
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+def default_process_count():
+    """Leave one core for the ROS2 executor and the upload threads"""
+    return max(1, min(4, (os.cpu_count() or 2) - 1))
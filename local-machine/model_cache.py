@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Content-addressed YOLO model cache for mozuku_detection_sender.py
+
+Models are stored as <cache>/objects/<sha256><ext> and looked up through an
+index keyed by source (s3://bucket/key, or the presigned URL without its
+signature). A cached model is reused only while the source ETag and size are
+unchanged, so switching back to a model that was seen before is instant and a
+replaced model is never served stale. If the source cannot be reached (uplink
+down), the model last cached for it is used instead.
+
+Downloads use parallel ranged GETs into a temporary file, are verified (size,
+MD5 for single-part ETags of unencrypted or SSE-S3 objects, SHA-256 for the
+content address) and only then renamed into place, so an interrupted download
+never leaves a corrupt model. The cache is bounded by size and evicts
+least-recently-used models, except those pinned by a running launch.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger('mozuku_sender.models')
+
+HASH_CHUNK = 8 * 1024 * 1024
+MD5_ETAG_ENCRYPTION = (None, 'AES256')  # SSE-KMS and SSE-C ETags are not the MD5 of the object
+
+
+def etag_is_md5(etag, encryption=None, customer_algorithm=None):
+    """True if etag is the MD5 of the object: single-part upload, no KMS or customer-key encryption"""
+    return (bool(etag) and len(etag) == 32 and '-' not in etag
+            and encryption in MD5_ETAG_ENCRYPTION and not customer_algorithm)
+
+
+class ModelSource:
+    """Where a model lives and what it currently looks like (ETag/size)"""
+
+    def __init__(self, url, cache_key, etag, size, ext, supports_ranges=True, md5_etag=False):
+        self.url = url
+        self.cache_key = cache_key
+        self.etag = etag
+        self.size = size
+        self.ext = ext
+        self.supports_ranges = supports_ranges
+        self.md5_etag = md5_etag  # etag can be checked against the MD5 of the download
+
+
+class ModelCache:
+    """
+    Args:
+        cache_dir: root directory of the cache
+        s3_client: boto3 S3 client used for s3:// URLs
+        max_bytes: size bound for all cached models (LRU eviction)
+        threads: parallel ranged GETs per download
+        part_size: bytes per ranged GET
+    """
+
+    def __init__(self, cache_dir, s3_client, max_bytes, threads=8, part_size=16 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.s3_client = s3_client
+        self.max_bytes = max_bytes
+        self.threads = max(1, int(threads))
+        self.part_size = max(1024 * 1024, int(part_size))
+        self._lock = threading.Lock()
+        self._pins = {}  # sha256 -> number of running launches using it
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._index = self._load_index()
+
+    # ------------------------------------------------------------------ index
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+            return {'sources': index.get('sources', {}), 'objects': index.get('objects', {})}
+        except (OSError, ValueError):
+            return {'sources': {}, 'objects': {}}
+
+    def _save_index(self):
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._index, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.index_path)
+
+    def _object_path(self, digest, ext):
+        return os.path.join(self.objects_dir, f"{digest}{ext}")
+
+    # ---------------------------------------------------------------- sources
+
+    def resolve(self, url):
+        """Look up the current ETag/size of url without downloading it"""
+        path = urllib.parse.urlparse(url).path
+        ext = os.path.splitext(path)[1] or '.pt'
+
+        if url.startswith('s3://'):
+            bucket, _, key = url[len('s3://'):].partition('/')
+            head = self.s3_client.head_object(Bucket=bucket, Key=key)
+            etag = head.get('ETag', '').strip('"')
+            md5_etag = etag_is_md5(etag, head.get('ServerSideEncryption'), head.get('SSECustomerAlgorithm'))
+            return ModelSource(url, url, etag, int(head['ContentLength']), ext, md5_etag=md5_etag)
+
+        # Presigned URLs are signed for GET only, so probe with a one-byte ranged GET
+        request = urllib.request.Request(url, headers={'Range': 'bytes=0-0'})
+        with urllib.request.urlopen(request, timeout=30) as response:
+            etag = (response.headers.get('ETag') or '').strip('"')
+            md5_etag = etag_is_md5(etag, response.headers.get('x-amz-server-side-encryption'),
+                                   response.headers.get('x-amz-server-side-encryption-customer-algorithm'))
+            content_range = response.headers.get('Content-Range')
+            if response.status == 206 and content_range and '/' in content_range:
+                size = int(content_range.rsplit('/', 1)[1])
+                supports_ranges = True
+            else:
+                size = int(response.headers.get('Content-Length') or 0)
+                supports_ranges = False
+        return ModelSource(url, self.cache_key(url), etag, size, ext, supports_ranges, md5_etag)
+
+    @staticmethod
+    def cache_key(url):
+        """Index key of url: s3:// URLs as is, presigned URLs without their signature"""
+        if url.startswith('s3://'):
+            return url
+        parsed = urllib.parse.urlparse(url)
+        return f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
+
+    def lookup(self, source):
+        """Return the cached path for source if its ETag and size still match"""
+        with self._lock:
+            entry = self._index['sources'].get(source.cache_key)
+            if not entry or entry.get('etag') != source.etag or entry.get('size') != source.size:
+                return None
+            obj = self._index['objects'].get(entry['sha256'])
+            if not obj:
+                return None
+            path = self._object_path(entry['sha256'], obj['ext'])
+            if not os.path.exists(path) or os.path.getsize(path) != source.size:
+                return None
+            obj['last_used'] = time.time()
+            self._save_index()
+            return path
+
+    def latest(self, cache_key):
+        """Return the path of the model most recently cached for cache_key, without checking the source"""
+        with self._lock:
+            entry = self._index['sources'].get(cache_key)
+            obj = self._index['objects'].get(entry['sha256']) if entry else None
+            if not obj:
+                return None
+            path = self._object_path(entry['sha256'], obj['ext'])
+            if not os.path.exists(path) or os.path.getsize(path) != obj['size']:
+                return None
+            obj['last_used'] = time.time()
+            self._save_index()
+            return path
+
+    # --------------------------------------------------------------- download
+
+    def get(self, url, force_download=False, progress=None):
+        """
+        Return a local path for the model at url, downloading it if needed.
+        progress(done_bytes, total_bytes) is called during downloads.
+        """
+        try:
+            source = self.resolve(url)
+        except Exception as e:
+            path = self.latest(self.cache_key(url))
+            if not path:
+                raise
+            logger.warning("⚠️ Could not check model source (%s: %s) - using cached model: %s",
+                           type(e).__name__, e, path)
+            return path
+        if not force_download:
+            path = self.lookup(source)
+            if path:
+                logger.info("✅ Using cached model: %s (etag %s)", path, source.etag)
+                return path
+        return self._download(source, progress)
+
+    def _fetch_range(self, source, start, end):
+        if source.url.startswith('s3://'):
+            bucket, _, key = source.url[len('s3://'):].partition('/')
+            kwargs = {'Bucket': bucket, 'Key': key, 'Range': f"bytes={start}-{end}"}
+            if source.etag:
+                kwargs['IfMatch'] = source.etag  # fail instead of mixing two versions
+            return self.s3_client.get_object(**kwargs)['Body'].read()
+        request = urllib.request.Request(source.url, headers={'Range': f"bytes={start}-{end}"})
+        with urllib.request.urlopen(request, timeout=60) as response:
+            if response.status != 206:
+                raise IOError(f"Server ignored range request (HTTP {response.status})")
+            return response.read()
+
+    def _download_single_stream(self, source, tmp_path, progress):
+        if source.url.startswith('s3://'):
+            bucket, _, key = source.url[len('s3://'):].partition('/')
+            done = [0]
+
+            def callback(n):
+                done[0] += n
+                if progress:
+                    progress(done[0], source.size)
+            self.s3_client.download_file(bucket, key, tmp_path, Callback=callback)
+            return
+        with urllib.request.urlopen(source.url, timeout=60) as response, open(tmp_path, 'wb') as f:
+            done = 0
+            while True:
+                chunk = response.read(HASH_CHUNK)
+                if not chunk:
+                    break
+                f.write(chunk)
+                done += len(chunk)
+                if progress:
+                    progress(done, source.size)
+
+    def _download(self, source, progress):
+        tmp_path = os.path.join(self.objects_dir, f".download-{os.getpid()}-{threading.get_ident()}{source.ext}")
+        logger.info("📥 Downloading model (%.1f MB, %d stream(s))...",
+                    source.size / (1024 * 1024), self.threads if source.supports_ranges else 1)
+        started = time.time()
+        try:
+            if source.supports_ranges and source.size > self.part_size:
+                self._download_ranged(source, tmp_path, progress)
+            else:
+                self._download_single_stream(source, tmp_path, progress)
+            digest = self._verify(source, tmp_path)
+
+            path = self._object_path(digest, source.ext)
+            os.replace(tmp_path, path)  # atomic: readers see the old state or a complete file
+            with self._lock:
+                now = time.time()
+                self._index['objects'][digest] = {'ext': source.ext, 'size': source.size, 'last_used': now}
+                self._index['sources'][source.cache_key] = {
+                    'etag': source.etag, 'size': source.size, 'sha256': digest
+                }
+                self._evict(keep=digest)
+                self._save_index()
+            elapsed = max(time.time() - started, 1e-6)
+            logger.info("✅ Model downloaded to: %s (%.1f MB/s)", path, source.size / (1024 * 1024) / elapsed)
+            return path
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _download_ranged(self, source, tmp_path, progress):
+        ranges = [(start, min(start + self.part_size, source.size) - 1)
+                  for start in range(0, source.size, self.part_size)]
+        done = [0]
+        done_lock = threading.Lock()
+        fd = os.open(tmp_path, os.O_CREAT | os.O_TRUNC | os.O_WRONLY, 0o644)
+        try:
+            os.ftruncate(fd, source.size)
+
+            def fetch(byte_range):
+                start, end = byte_range
+                data = self._fetch_range(source, start, end)
+                if len(data) != end - start + 1:
+                    raise IOError(f"Short read for bytes {start}-{end}: got {len(data)}")
+                os.pwrite(fd, data, start)
+                with done_lock:
+                    done[0] += len(data)
+                    if progress:
+                        progress(done[0], source.size)
+
+            with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='model-dl') as pool:
+                for _ in pool.map(fetch, ranges):
+                    pass
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _verify(self, source, path):
+        """Check size (and MD5 where the ETag is one); return the SHA-256 content address"""
+        size = os.path.getsize(path)
+        if source.size and size != source.size:
+            raise IOError(f"Downloaded {size} bytes, expected {source.size}")
+        sha256 = hashlib.sha256()
+        md5 = hashlib.md5() if source.md5_etag else None
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(HASH_CHUNK)
+                if not chunk:
+                    break
+                sha256.update(chunk)
+                if md5:
+                    md5.update(chunk)
+        if md5 and md5.hexdigest() != source.etag.lower():
+            raise IOError(f"MD5 mismatch: got {md5.hexdigest()}, ETag {source.etag}")
+        return sha256.hexdigest()
+
+    # --------------------------------------------------------------- eviction
+
+    def owns(self, path):
+        """True if path is (or was) a model object of this cache"""
+        return os.path.dirname(os.path.abspath(path)) == os.path.abspath(self.objects_dir)
+
+    def pin(self, path):
+        """
+        Keep the model at path from being evicted until unpin(path), e.g. while a launch
+        uses it. Returns False for paths outside the cache or already evicted.
+        """
+        if not self.owns(path):
+            return False
+        digest = os.path.splitext(os.path.basename(path))[0]
+        with self._lock:
+            if digest not in self._index['objects'] or not os.path.exists(path):
+                return False
+            self._pins[digest] = self._pins.get(digest, 0) + 1
+            return True
+
+    def unpin(self, path):
+        if not self.owns(path):
+            return
+        digest = os.path.splitext(os.path.basename(path))[0]
+        with self._lock:
+            count = self._pins.get(digest, 0) - 1
+            if count > 0:
+                self._pins[digest] = count
+            else:
+                self._pins.pop(digest, None)
+
+    def _evict(self, keep):
+        """Drop least-recently-used unpinned models until the cache fits in max_bytes (lock held)"""
+        objects = self._index['objects']
+        total = sum(obj['size'] for obj in objects.values())
+        for digest, obj in sorted(objects.items(), key=lambda item: item[1]['last_used']):
+            if total <= self.max_bytes:
+                break
+            if digest == keep or digest in self._pins:
+                continue
+            try:
+                os.remove(self._object_path(digest, obj['ext']))
+            except OSError:
+                pass
+            total -= obj['size']
+            del objects[digest]
+            for key in [k for k, src in self._index['sources'].items() if src['sha256'] == digest]:
+                del self._index['sources'][key]
+            logger.info("🗑️ Evicted cached model %s (%.1f MB)", digest[:12], obj['size'] / (1024 * 1024))
@@ -26,6 +26,15 @@ import subprocess
 import signal
 import boto3
 import uuid
+import sqlite3
+import logging
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from jpeg_encoder import JpegEncoderPool, default_process_count
+from sender_metrics import MetricsRegistry
+from model_cache import ModelCache
+from impurity_tracker import ImpurityTracker
+from batch_archive import BatchArchive, member_url
 
 # ROS2 imports
 try:
@@ -38,11 +47,22 @@ try:
     ROS2_AVAILABLE = True
 except ImportError:
     ROS2_AVAILABLE = False
-    print("⚠️ ROS2 not available - running in demo mode only")
 
 # Load environment variables
 load_dotenv()
 
+# Logging - MOZUKU_LOG_LEVEL=DEBUG enables per-upload / per-message diagnostics
+LOG_LEVEL = os.getenv('MOZUKU_LOG_LEVEL', 'INFO').upper()
+logging.basicConfig(
+    level=logging.INFO,  # third-party libraries (boto3, urllib3) stay at INFO
+    format=os.getenv('MOZUKU_LOG_FORMAT', '%(asctime)s [%(levelname)s] %(message)s')
+)
+logger = logging.getLogger('mozuku_sender')
+logger.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+
+if not ROS2_AVAILABLE:
+    logger.warning("⚠️ ROS2 not available - running in demo mode only")
+
 API_BASE_URL = os.getenv('REACT_APP_API_BASE_URL', 'https://9wowpm4mm0.execute-api.ap-northeast-1.amazonaws.com/dev')
 COGNITO_USER_POOL_ID = os.getenv('REACT_APP_COGNITO_USER_POOL_ID', 'ap-northeast-1_N0LUX9VXD')
 COGNITO_CLIENT_ID = os.getenv('REACT_APP_COGNITO_CLIENT_ID', 'hga8jtohtcv20lop0djlauqsv')
@@ -54,18 +74,111 @@ TEST_PASSWORD = os.getenv('TEST_PASSWORD', 'Rgk20231201@')
 CAMERA_TOPIC = '/camera/camera/color/image_raw'
 DETECTIONS_TOPIC = '/yolov8/detections'
 
+# Upload worker pool
+UPLOAD_WORKERS = int(os.getenv('MOZUKU_UPLOAD_WORKERS', '4'))
+UPLOAD_QUEUE_SIZE = int(os.getenv('MOZUKU_UPLOAD_QUEUE_SIZE', '32'))
+UPLOAD_DROP_POLICY = os.getenv('MOZUKU_UPLOAD_DROP_POLICY', 'oldest')  # 'oldest' or 'lowest_confidence'
+UPLOAD_ENQUEUE_TIMEOUT = float(os.getenv('MOZUKU_UPLOAD_ENQUEUE_TIMEOUT', '0.05'))  # seconds to wait for a free slot
+UPLOAD_FANOUT_THREADS = int(os.getenv('MOZUKU_UPLOAD_FANOUT_THREADS', '16'))  # parallel PUTs shared by all workers
+SHUTDOWN_TIMEOUT_SEC = float(os.getenv('MOZUKU_SHUTDOWN_TIMEOUT_SEC', '10'))  # wait for the executor and queued uploads on exit
+
+# Drain scheduler between the synchronizer and the upload queue
+DRAIN_TICK_SEC = float(os.getenv('MOZUKU_DRAIN_TICK_SEC', '0.05'))  # how often buffered frames are handed to the queue
+DRAIN_MODE = os.getenv('MOZUKU_DRAIN_MODE', 'throughput')  # 'throughput' (oldest first) or 'latency' (newest first)
+DRAIN_MAX_FRAMES = int(os.getenv('MOZUKU_DRAIN_MAX_FRAMES', '64'))  # buffered frame groups before the oldest is dropped
+DRAIN_MAX_AGE_SEC = float(os.getenv('MOZUKU_DRAIN_MAX_AGE_SEC', '10.0'))  # drop frame groups older than this
+DRAIN_TARGET_LATENCY_SEC = float(os.getenv('MOZUKU_DRAIN_TARGET_LATENCY_SEC', '2.0'))  # 'latency' mode only
+
+# Cross-frame tracking: upload each impurity once instead of on every frame it is visible in
+TRACK_POLICY = os.getenv('MOZUKU_TRACK_POLICY', 'best')  # 'best', 'first_and_best' or 'off'
+TRACK_IOU_THRESHOLD = float(os.getenv('MOZUKU_TRACK_IOU_THRESHOLD', '0.3'))
+TRACK_MAX_DISTANCE_PX = float(os.getenv('MOZUKU_TRACK_MAX_DISTANCE_PX', '80'))  # centroid gate after motion compensation
+TRACK_MAX_GAP_SEC = float(os.getenv('MOZUKU_TRACK_MAX_GAP_SEC', '0.3'))  # track ends when unseen this long
+TRACK_MAX_SEC = float(os.getenv('MOZUKU_TRACK_MAX_SEC', '5.0'))  # upload long-lived tracks after this
+MM_PER_PX = float(os.getenv('MOZUKU_MM_PER_PX', '0.25'))  # matches mm_per_px_x/y of the camera_bringup launch
+BELT_SPEED_MM_S = float(os.getenv('MOZUKU_BELT_SPEED_MM_S', '0'))  # 0 = estimate belt motion from the tracks
+BELT_DIRECTION = tuple(float(v) for v in os.getenv('MOZUKU_BELT_DIRECTION', '1,0').split(','))  # image x,y
+
+# Near-duplicate suppression: skip frames that look like a recently uploaded one (e.g. belt paused)
+NEAR_DUP_ENABLED = os.getenv('MOZUKU_NEAR_DUP_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+NEAR_DUP_MAX_DISTANCE = int(os.getenv('MOZUKU_NEAR_DUP_MAX_DISTANCE', '4'))  # differing bits of the 64-bit dHash
+NEAR_DUP_BOX_IOU = float(os.getenv('MOZUKU_NEAR_DUP_BOX_IOU', '0.5'))  # detections must also line up this well
+NEAR_DUP_WINDOW = int(os.getenv('MOZUKU_NEAR_DUP_WINDOW', '16'))  # recently uploaded frames compared against
+NEAR_DUP_MAX_AGE_SEC = float(os.getenv('MOZUKU_NEAR_DUP_MAX_AGE_SEC', '60'))  # re-upload an unchanged scene after this
+
+# Batch mode: frames, crops and labels of several frames go into one S3 object (one PUT per batch).
+# Items then reference s3://bucket/key#bytes=first-last ranges, which readers must fetch with ranged GETs
+# (src/s3Media.js in the web app).
+BATCH_ENABLED = os.getenv('MOZUKU_BATCH_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+BATCH_MAX_FRAMES = int(os.getenv('MOZUKU_BATCH_MAX_FRAMES', '50'))
+BATCH_MAX_MB = float(os.getenv('MOZUKU_BATCH_MAX_MB', '32'))
+BATCH_MAX_SEC = float(os.getenv('MOZUKU_BATCH_MAX_SEC', '10'))  # upload a partly filled batch after this
+
+# Shared frame store (raw + annotated frames referenced by buffered detections).
+# Frames stay in the store until their upload finishes, so the default covers the drain buffer,
+# the upload queue, the frames being uploaded and headroom for frames held by impurity tracks.
+FRAME_STORE_TRACK_HEADROOM = 16
+FRAME_STORE_MIN_FRAMES = DRAIN_MAX_FRAMES + UPLOAD_QUEUE_SIZE + UPLOAD_WORKERS
+FRAME_STORE_MAX_FRAMES = int(os.getenv('MOZUKU_FRAME_STORE_MAX_FRAMES',
+                                       str(FRAME_STORE_MIN_FRAMES + FRAME_STORE_TRACK_HEADROOM)))
+FRAME_STORE_MAX_MB = float(os.getenv('MOZUKU_FRAME_STORE_MAX_MB', '512'))
+
+# Header-stamp synchronization of camera, annotated image and detections
+ANNOTATED_IMAGE_TOPIC = '/yolov8/detections_image'
+SYNC_SLOP_SEC = float(os.getenv('MOZUKU_SYNC_SLOP_SEC', '0.01'))  # max stamp difference to pair messages (< half a frame period)
+SYNC_GRACE_SEC = float(os.getenv('MOZUKU_SYNC_GRACE_SEC', '0.1'))  # wait for late detections of an inference
+SYNC_MAX_AGE_SEC = float(os.getenv('MOZUKU_SYNC_MAX_AGE_SEC', '1.0'))  # give up on incomplete bundles after this
+
+# JPEG encoding process pool (0 = encode on the upload threads)
+ENCODE_PROCESSES = int(os.getenv('MOZUKU_ENCODE_PROCESSES', str(default_process_count())))
+JPEG_QUALITY = int(os.getenv('MOZUKU_JPEG_QUALITY', '90'))
+
+# Below this many boxes the pure-Python NMS loop beats NumPy's call overhead
+DEDUPE_NUMPY_MIN_BOXES = int(os.getenv('MOZUKU_DEDUPE_NUMPY_MIN_BOXES', '16'))
+
+# Metrics (Prometheus text format on localhost; 0 disables the endpoint)
+METRICS_PORT = int(os.getenv('MOZUKU_METRICS_PORT', '9108'))
+METRICS_SUMMARY_SEC = float(os.getenv('MOZUKU_METRICS_SUMMARY_SEC', '60'))  # 0 disables the summary line
+
+METRICS = MetricsRegistry()
+MESSAGES_RECEIVED = METRICS.counter('mozuku_messages_received_total', 'ROS2 messages received by topic')
+DETECTIONS_BUFFERED = METRICS.counter('mozuku_detections_buffered_total', 'Synchronized detections added to the upload buffer')
+FRAMES_UPLOADED = METRICS.counter('mozuku_frames_uploaded_total', 'Frames fully uploaded (S3 + DynamoDB)')
+FRAMES_FAILED = METRICS.counter('mozuku_frames_failed_total', 'Frames whose upload failed')
+FRAMES_SUPPRESSED = METRICS.counter('mozuku_frames_suppressed_total', 'Frame groups not uploaded because another frame covers them, by reason')
+FRAMES_DROPPED = METRICS.counter('mozuku_frames_dropped_total', 'Frame groups dropped before upload, by reason')
+BYTES_SENT = METRICS.counter('mozuku_bytes_sent_total', 'Bytes PUT to S3, by kind')
+STAGE_SECONDS = METRICS.histogram('mozuku_stage_seconds', 'Latency of upload pipeline stages')
+SESSION_RATE_FAILURES = METRICS.counter('mozuku_session_rate_update_failures_total',
+                                        'Session detectionRate/avgDetectionsPerFrame updates not applied, by reason')
+
 # DynamoDB for Job Control
 dynamodb = boto3.resource('dynamodb', region_name=COGNITO_REGION)
 launch_jobs_table = dynamodb.Table('ROS2LaunchJobs-dev')
 impurity_table = dynamodb.Table('ImpurityData-dev')
 frame_table = dynamodb.Table('FrameDetections-dev')
+stats_table = dynamodb.Table('DetectionStats-dev')
+
+# Live session aggregates in DetectionStats-dev, coalesced in memory and flushed with atomic ADDs
+SESSION_STATS_ENABLED = os.getenv('MOZUKU_SESSION_STATS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+SESSION_STATS_FLUSH_SEC = float(os.getenv('MOZUKU_SESSION_STATS_FLUSH_SEC', '5'))
+SESSION_STATS_REFRESH_SEC = float(os.getenv('MOZUKU_SESSION_STATS_REFRESH_SEC', '30'))  # re-read session list
+
+# Job monitor: pending jobs come from a status GSI (falls back to a paginated scan if it is missing)
+JOBS_STATUS_INDEX = os.getenv('MOZUKU_JOBS_STATUS_INDEX', 'status-timestamp-index')
+JOBS_POLL_MIN_SEC = float(os.getenv('MOZUKU_JOBS_POLL_MIN_SEC', '1.0'))  # right after a command
+JOBS_POLL_MAX_SEC = float(os.getenv('MOZUKU_JOBS_POLL_MAX_SEC', '10.0'))  # when idle
+JOBS_POLL_BACKOFF = float(os.getenv('MOZUKU_JOBS_POLL_BACKOFF', '1.5'))
+JOBS_PROCESSED_MAX = int(os.getenv('MOZUKU_JOBS_PROCESSED_MAX', '1000'))  # remembered job IDs
 
 # S3 for Image Storage - using existing buckets with timeout
 from botocore.config import Config
+from botocore.exceptions import ClientError
 s3_config = Config(
     connect_timeout=10,
     read_timeout=10,
-    retries={'max_attempts': 2, 'mode': 'standard'}
+    retries={'max_attempts': 2, 'mode': 'standard'},
+    max_pool_connections=max(10, UPLOAD_FANOUT_THREADS)
 )
 s3_client = boto3.client('s3', region_name=COGNITO_REGION, config=s3_config)
 FRAMES_WITH_BBOX_BUCKET = 'mozuku-frames-dev-with-bbox'
@@ -73,9 +186,30 @@ FRAMES_WITHOUT_BBOX_BUCKET = 'mozuku-frames-dev-without-bbox'
 IMPURITIES_BUCKET = 'mozuku-impurities-dev'
 S3_REGION = COGNITO_REGION
 
+# Durable upload spool (failed S3/DynamoDB writes are kept here and replayed)
+SPOOL_ENABLED = os.getenv('MOZUKU_SPOOL_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+SPOOL_PATH = os.path.expanduser(os.getenv('MOZUKU_SPOOL_PATH', '~/.mozuku_spool/spool.db'))
+SPOOL_MAX_MB = float(os.getenv('MOZUKU_SPOOL_MAX_MB', '2048'))
+SPOOL_DRAIN_RATE = float(os.getenv('MOZUKU_SPOOL_DRAIN_RATE', '10'))  # replayed operations per second
+SPOOL_MAX_ATTEMPTS = int(os.getenv('MOZUKU_SPOOL_MAX_ATTEMPTS', '50'))
+
 # Model cache directory
 MODEL_CACHE_DIR = os.path.expanduser('~/.mozuku_models')
 os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+MODEL_CACHE_MAX_GB = float(os.getenv('MOZUKU_MODEL_CACHE_MAX_GB', '5'))
+MODEL_DOWNLOAD_THREADS = int(os.getenv('MOZUKU_MODEL_DOWNLOAD_THREADS', '8'))
+MODEL_DOWNLOAD_PART_MB = int(os.getenv('MOZUKU_MODEL_DOWNLOAD_PART_MB', '16'))
+model_cache = ModelCache(
+    MODEL_CACHE_DIR,
+    s3_client,
+    max_bytes=int(MODEL_CACHE_MAX_GB * 1024 * 1024 * 1024),
+    threads=MODEL_DOWNLOAD_THREADS,
+    part_size=MODEL_DOWNLOAD_PART_MB * 1024 * 1024
+)
+# Models to fetch at startup, before any job asks for them (comma-separated s3:// or https:// URLs)
+MODEL_PREFETCH_URLS = [u.strip() for u in os.getenv('MOZUKU_PREFETCH_MODELS', '').split(',') if u.strip()]
+MODEL_PREFETCH_WORKERS = int(os.getenv('MOZUKU_MODEL_PREFETCH_WORKERS', '2'))
+MODEL_PROGRESS_INTERVAL_SEC = float(os.getenv('MOZUKU_MODEL_PROGRESS_INTERVAL_SEC', '2.0'))
 
 # ROS2 Launch Commands (model path will be injected dynamically)
 ROS2_LAUNCH_COMMANDS = {
@@ -85,19 +219,23 @@ ROS2_LAUNCH_COMMANDS = {
 
 # Global state
 ros2_processes = {}
+launch_models = {}  # command_key -> cached model path pinned while that launch runs
+pending_launches = {}  # command_key -> cancel Event for launches waiting on a model download
+pending_launches_lock = threading.Lock()
 sending_enabled = False
 current_job_id = None
 downloaded_model_path = None  # Cache the model path
 
 
-def download_model_from_s3(s3_url, force_download=False):
+def download_model_from_s3(s3_url, force_download=False, progress=None):
     """
     Download YOLOv8 model from S3 URL
-    Caches locally to avoid re-downloading
+    Cached by content (see model_cache.ModelCache): reused while the source ETag is unchanged
     
     Args:
         s3_url: S3 URL (s3://bucket/key or https://presigned-url)
         force_download: Force re-download even if cached
+        progress: Optional callback(done_bytes, total_bytes) during downloads
     
     Returns:
         Local file path to the model
@@ -105,63 +243,671 @@ def download_model_from_s3(s3_url, force_download=False):
     global downloaded_model_path
     
     if not s3_url:
-        print("⚠️ No model URL provided, using default 'best.pt'")
+        logger.warning("⚠️ No model URL provided, using default 'best.pt'")
         return 'best.pt'
     
     try:
-        # Generate cache filename from S3 URL
-        if s3_url.startswith('s3://'):
-            # Parse S3 URL: s3://bucket/key
-            parts = s3_url.replace('s3://', '').split('/', 1)
-            model_filename = os.path.basename(parts[1]) if len(parts) > 1 else 'best.pt'
-        else:
-            # Presigned HTTPS URL
-            model_filename = 'best.pt'
-        
-        local_model_path = os.path.join(MODEL_CACHE_DIR, model_filename)
-        
-        # If already cached and not forcing download, use cached version
-        if os.path.exists(local_model_path) and not force_download:
-            print(f"✅ Using cached model: {local_model_path}")
-            downloaded_model_path = local_model_path
-            return local_model_path
-        
-        print(f"📥 Downloading model from S3...")
-        print(f"   URL: {s3_url[:60]}...")
-        
-        if s3_url.startswith('s3://'):
-            # Download from S3 using boto3
-            parts = s3_url.replace('s3://', '').split('/', 1)
-            bucket = parts[0]
-            key = parts[1] if len(parts) > 1 else ''
-            
-            print(f"   Bucket: {bucket}")
-            print(f"   Key: {key}")
-            
-            # Get file size first
-            response = s3_client.head_object(Bucket=bucket, Key=key)
-            file_size_mb = response['ContentLength'] / (1024 * 1024)
-            print(f"   Size: {file_size_mb:.1f} MB")
-            
-            # Download with progress
-            s3_client.download_file(bucket, key, local_model_path)
-            
-        else:
-            # Download from presigned HTTPS URL
-            import urllib.request
-            print(f"   Downloading from presigned URL...")
-            urllib.request.urlretrieve(s3_url, local_model_path)
-        
-        print(f"✅ Model downloaded to: {local_model_path}")
+        logger.info("📦 Resolving model: %s...", s3_url[:60])
+        local_model_path = model_cache.get(s3_url, force_download=force_download, progress=progress)
         downloaded_model_path = local_model_path
         return local_model_path
         
     except Exception as e:
-        print(f"❌ Failed to download model: {str(e)}")
-        print(f"⚠️ Falling back to default 'best.pt'")
+        logger.error("❌ Failed to download model: %s", e)
+        logger.warning("⚠️ Falling back to default 'best.pt'")
         return 'best.pt'
 
 
+class ModelPrefetcher:
+    """
+    Downloads models in the background so the job monitor never blocks on them.
+
+    Each URL is fetched at most once at a time; later requests for the same URL
+    share the running download. Jobs waiting on a download get its progress
+    written to their status record every MODEL_PROGRESS_INTERVAL_SEC.
+    """
+
+    def __init__(self, workers=MODEL_PREFETCH_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='model-prefetch')
+        self._lock = threading.Lock()
+        self._futures = {}  # url -> Future[model path]
+        self._watchers = {}  # url -> [(job_id, user_id), ...]
+        self._last_report = {}  # url -> wall time
+
+    def prefetch(self, url, job_id=None, user_id='web-user'):
+        """Start (or join) the download of url; returns a Future with the local model path"""
+        with self._lock:
+            if job_id is not None:
+                watchers = self._watchers.setdefault(url, [])
+                if (job_id, user_id) not in watchers:
+                    watchers.append((job_id, user_id))
+            future = self._futures.get(url)
+            # download_model_from_s3 returns the 'best.pt' fallback on failure - retry those
+            if future is None or (future.done() and future.result() == 'best.pt'):
+                logger.info("📥 Prefetching model: %s...", url[:60])
+                future = self._pool.submit(self._download, url)
+                self._futures[url] = future
+            return future
+
+    def _download(self, url):
+        try:
+            return download_model_from_s3(url, progress=lambda done, total: self._report(url, done, total))
+        finally:
+            with self._lock:
+                self._watchers.pop(url, None)
+                self._last_report.pop(url, None)
+
+    def _report(self, url, done, total):
+        now = time.time()
+        with self._lock:
+            if done < total and now - self._last_report.get(url, 0) < MODEL_PROGRESS_INTERVAL_SEC:
+                return
+            self._last_report[url] = now
+            watchers = list(self._watchers.get(url, []))
+        percent = (done / total * 100) if total else 0
+        message = f"Downloading model: {percent:.0f}% ({done / (1024 * 1024):.0f}/{total / (1024 * 1024):.0f} MB)"
+        for job_id, user_id in watchers:
+            update_job_status(job_id, 'downloading', message, user_id)
+
+
+model_prefetcher = ModelPrefetcher()
+
+
+def prefetch_registered_models():
+    """Warm the model cache with MOZUKU_PREFETCH_MODELS"""
+    for url in MODEL_PREFETCH_URLS:
+        model_prefetcher.prefetch(url)
+
+
+class _SpoolJSONEncoder(json.JSONEncoder):
+    """JSON encoder that keeps DynamoDB Decimals exact"""
+
+    def default(self, o):
+        if isinstance(o, Decimal):
+            return {'__decimal__': str(o)}
+        return super().default(o)
+
+
+def _spool_json_hook(obj):
+    if len(obj) == 1 and '__decimal__' in obj:
+        return Decimal(obj['__decimal__'])
+    return obj
+
+
+class UploadSpool:
+    """
+    Durable on-disk queue of S3 PUTs and DynamoDB put_items that could not be
+    delivered, stored in SQLite (WAL mode) so it survives crashes and restarts.
+
+    A background drainer replays operations strictly in insertion order at up to
+    drain_rate ops/sec. When the head operation fails the drainer backs off and
+    retries it, so a DynamoDB item is never written before S3 objects spooled
+    ahead of it. When the spool exceeds max_bytes the oldest operations are evicted.
+    discard() cancels a pending S3 PUT, e.g. when its frame is rolled back.
+    """
+
+    def __init__(self, path=SPOOL_PATH, max_mb=SPOOL_MAX_MB, drain_rate=SPOOL_DRAIN_RATE,
+                 max_attempts=SPOOL_MAX_ATTEMPTS):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.drain_rate = drain_rate
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._running = False
+        self._thread = None
+        self._replaying = None  # (op id, target) of the operation the drainer is executing
+        self._cancelled = set()  # ids of replaying operations discarded meanwhile
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS ops ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' kind TEXT NOT NULL,'  # 's3' or 'dynamodb'
+            ' target TEXT NOT NULL,'  # 'bucket/key' or table name
+            ' payload BLOB NOT NULL,'
+            ' meta TEXT NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' attempts INTEGER NOT NULL DEFAULT 0,'
+            ' created REAL NOT NULL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS ops_target ON ops (target)')
+        count, total = self._db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ops').fetchone()
+        self._bytes = total
+
+        # Counters
+        self.spooled = 0
+        self.replayed = 0
+        self.evicted = 0
+        self.abandoned = 0
+        self.discarded = 0
+
+        if count:
+            logger.info("📦 Upload spool has %d pending operation(s) (%.1f MB) from a previous run",
+                        count, total / (1024 * 1024))
+
+    def put_s3(self, bucket, key, body, content_type, metadata):
+        meta = json.dumps({'content_type': content_type, 'metadata': metadata})
+        self._append('s3', f"{bucket}/{key}", body, meta)
+
+    def put_item(self, table_name, item):
+        payload = json.dumps(item, cls=_SpoolJSONEncoder).encode('utf-8')
+        self._append('dynamodb', table_name, payload, '{}')
+
+    def contains_s3(self, s3_url):
+        """True if the object behind s3_url is still waiting in the spool"""
+        target = s3_url.replace('s3://', '', 1)
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM ops WHERE target = ? AND kind = 's3' LIMIT 1", (target,)
+            ).fetchone() is not None
+
+    def discard(self, s3_url):
+        """
+        Cancel the pending PUT(s) of s3_url so a replay does not re-create an object
+        that was rolled back. Returns False if nothing was pending. If the drainer is
+        replaying it right now, the object is deleted again once that PUT completes.
+        """
+        target = s3_url.replace('s3://', '', 1)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, size FROM ops WHERE target = ? AND kind = 's3'", (target,)
+            ).fetchall()
+            for op_id, size in rows:
+                self._db.execute('DELETE FROM ops WHERE id = ?', (op_id,))
+                self._bytes -= size
+                if self._replaying == (op_id, target):
+                    self._cancelled.add(op_id)
+            self.discarded += len(rows)
+        if rows:
+            logger.info("   🗑️ Discarded %d spooled write(s) to %s", len(rows), target)
+        return bool(rows)
+
+    def _remove(self, op_id, size):
+        """Delete a finished operation unless discard() already did. Call with the lock held"""
+        if self._db.execute('DELETE FROM ops WHERE id = ?', (op_id,)).rowcount:
+            self._bytes -= size
+
+    def backlog(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM ops').fetchone()[0]
+
+    def stats(self):
+        return {
+            'backlog': self.backlog(),
+            'mb': self._bytes / (1024 * 1024),
+            'spooled': self.spooled,
+            'replayed': self.replayed,
+            'evicted': self.evicted,
+            'abandoned': self.abandoned,
+            'discarded': self.discarded,
+        }
+
+    def start(self):
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._drain_loop, name='spool-drainer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wakeup.set()
+
+    def _append(self, kind, target, payload, meta):
+        size = len(payload)
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                self._db.execute(
+                    'INSERT INTO ops (kind, target, payload, meta, size, created) VALUES (?, ?, ?, ?, ?, ?)',
+                    (kind, target, sqlite3.Binary(payload), meta, size, time.time())
+                )
+                self._bytes += size
+                # Oldest-first eviction once over the size cap (never evict the row just written)
+                while self._bytes > self.max_bytes:
+                    row = self._db.execute(
+                        'SELECT id, size FROM ops WHERE id < (SELECT MAX(id) FROM ops) ORDER BY id LIMIT 1'
+                    ).fetchone()
+                    if row is None:
+                        break
+                    self._db.execute('DELETE FROM ops WHERE id = ?', (row[0],))
+                    self._bytes -= row[1]
+                    self.evicted += 1
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+            self.spooled += 1
+        logger.warning("   💾 Spooled %s write to %s (%d bytes) for replay", kind, target, size)
+        self._wakeup.set()
+
+    def _execute(self, kind, target, payload, meta):
+        if kind == 's3':
+            bucket, key = target.split('/', 1)
+            meta = json.loads(meta)
+            s3_client.put_object(
+                Bucket=bucket,
+                Key=key,
+                Body=bytes(payload),
+                ContentType=meta['content_type'],
+                Metadata=meta['metadata']
+            )
+        elif kind == 'dynamodb':
+            item = json.loads(bytes(payload).decode('utf-8'), object_hook=_spool_json_hook)
+            dynamodb.Table(target).put_item(Item=item)
+        else:
+            raise ValueError(f"Unknown spool operation: {kind}")
+
+    def _drain_loop(self):
+        backoff = 1.0
+        while self._running:
+            with self._lock:
+                row = self._db.execute(
+                    'SELECT id, kind, target, payload, meta, size, attempts FROM ops ORDER BY id LIMIT 1'
+                ).fetchone()
+                if row is not None:
+                    self._replaying = (row[0], row[2])
+            if row is None:
+                self._wakeup.wait(timeout=5.0)
+                self._wakeup.clear()
+                continue
+
+            op_id, kind, target, payload, meta, size, attempts = row
+            try:
+                self._execute(kind, target, payload, meta)
+            except Exception as e:
+                attempts += 1
+                with self._lock:
+                    self._replaying = None
+                    self._cancelled.discard(op_id)
+                    if attempts >= self.max_attempts:
+                        self._remove(op_id, size)
+                        self.abandoned += 1
+                        logger.error("❌ Spool: giving up on %s write to %s after %d attempts: %s",
+                                     kind, target, attempts, e)
+                    else:
+                        self._db.execute('UPDATE ops SET attempts = ? WHERE id = ?', (attempts, op_id))
+                # Service is probably still down - back off before retrying the head of the queue
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60.0)
+                continue
+
+            with self._lock:
+                self._replaying = None
+                cancelled = op_id in self._cancelled
+                self._cancelled.discard(op_id)
+                self._remove(op_id, size)
+            if cancelled:
+                # Discarded while its PUT was in flight: take the object down again
+                bucket, key = target.split('/', 1)
+                try:
+                    s3_client.delete_object(Bucket=bucket, Key=key)
+                except Exception as e:
+                    logger.warning("   ⚠️ Spool: could not delete discarded %s: %s: %s", target, type(e).__name__, e)
+                continue
+            self.replayed += 1
+            backoff = 1.0
+            if self.drain_rate > 0:
+                time.sleep(1.0 / self.drain_rate)
+
+
+class SessionStatsAggregator:
+    """
+    Keeps the session rows of DetectionStats-dev current while frames are written.
+
+    record() only appends to an in-memory list; every flush_interval a background
+    thread assigns the recorded frames to the user's sessions (startTime..endTime,
+    open sessions run until now), coalesces them per session and applies one
+    UpdateItem ADD per session for totalFrames/totalDetections/impuritiesFound.
+    detectionRate and avgDetectionsPerFrame are then set from the totals the ADD
+    returned, conditional on no other writer having moved them in between.
+    Deltas that fail to apply are kept for the next flush; recalculate_session_stats.py
+    remains the tool to repair a session from the frame table.
+    """
+
+    def __init__(self, table=None, flush_interval=SESSION_STATS_FLUSH_SEC,
+                 refresh_interval=SESSION_STATS_REFRESH_SEC):
+        self.table = table if table is not None else stats_table
+        self.flush_interval = flush_interval
+        self.refresh_interval = refresh_interval
+        self._recorded = []  # (user_id, timestamp_ms, detection_count)
+        self._pending = {}  # (user_id, timePeriod) -> [frames, detections]
+        self._sessions = {}  # user_id -> (loaded_at, [(start, end, timePeriod)])
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self.updates = 0
+        self.unassigned = 0
+        self._thread = threading.Thread(target=self._flush_loop, name='session-stats', daemon=True)
+        self._thread.start()
+
+    def record(self, user_id, timestamp, detection_count):
+        with self._lock:
+            self._recorded.append((user_id, int(timestamp), int(detection_count)))
+
+    def _load_sessions(self, user_id):
+        sessions = []
+        kwargs = {
+            'KeyConditionExpression': 'userId = :uid',
+            'FilterExpression': 'periodType = :ptype',
+            'ExpressionAttributeValues': {':uid': user_id, ':ptype': 'session'},
+            'ProjectionExpression': 'timePeriod, startTime, endTime',
+        }
+        while True:
+            response = self.table.query(**kwargs)
+            for item in response.get('Items', []):
+                sessions.append((int(item.get('startTime', 0)), int(item.get('endTime', 0)), item['timePeriod']))
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        self._sessions[user_id] = (time.time(), sessions)
+        return sessions
+
+    def _sessions_for(self, user_id, timestamp, now_ms):
+        loaded_at, sessions = self._sessions.get(user_id, (0, None))
+        stale = time.time() - loaded_at > self.refresh_interval
+        matches = [period for start, end, period in sessions or [] if start <= timestamp <= (end or now_ms)]
+        # A frame outside every known session may belong to one started since the last read
+        if sessions is None or stale or (not matches and time.time() - loaded_at > self.flush_interval):
+            sessions = self._load_sessions(user_id)
+            matches = [period for start, end, period in sessions if start <= timestamp <= (end or now_ms)]
+        return matches
+
+    def flush(self):
+        """Apply recorded frames to their sessions"""
+        with self._flush_lock:
+            with self._lock:
+                recorded, self._recorded = self._recorded, []
+            now_ms = int(time.time() * 1000)
+            for user_id, timestamp, detection_count in recorded:
+                try:
+                    periods = self._sessions_for(user_id, timestamp, now_ms)
+                except Exception as e:
+                    logger.warning("⚠️ Could not read sessions for %s: %s", user_id, e)
+                    with self._lock:
+                        self._recorded.append((user_id, timestamp, detection_count))
+                    continue
+                if not periods:
+                    self.unassigned += 1
+                for period in periods:
+                    delta = self._pending.setdefault((user_id, period), [0, 0])
+                    delta[0] += 1
+                    delta[1] += detection_count
+            
+            for key, (frames, detections) in list(self._pending.items()):
+                if self._apply(key, frames, detections):
+                    del self._pending[key]
+
+    def _apply(self, key, frames, detections):
+        """One coalesced update for a session; returns False to retry the delta later"""
+        user_id, period = key
+        try:
+            response = self.table.update_item(
+                Key={'userId': user_id, 'timePeriod': period},
+                UpdateExpression=('ADD totalFrames :frames, totalDetections :detections, '
+                                  'impuritiesFound :detections SET updatedAt = :updated'),
+                ConditionExpression='attribute_exists(userId)',  # never create rows for deleted sessions
+                ExpressionAttributeValues={
+                    ':frames': frames,
+                    ':detections': detections,
+                    ':updated': datetime.now().isoformat()
+                },
+                ReturnValues='UPDATED_NEW'
+            )
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                logger.warning("⚠️ Session %s/%s no longer exists, dropping %d frame(s)", user_id, period, frames)
+                return True
+            logger.warning("⚠️ Session stats update failed (%s), will retry: %s", period, e)
+            return False
+        except Exception as e:
+            logger.warning("⚠️ Session stats update failed (%s), will retry: %s", period, e)
+            return False
+        self.updates += 1
+        
+        totals = response.get('Attributes', {})
+        total_frames = int(totals.get('totalFrames', 0))
+        total_detections = int(totals.get('totalDetections', 0))
+        if total_frames > 0:
+            try:
+                self.table.update_item(
+                    Key={'userId': user_id, 'timePeriod': period},
+                    UpdateExpression='SET detectionRate = :rate, avgDetectionsPerFrame = :avg',
+                    ConditionExpression='totalFrames = :frames',
+                    ExpressionAttributeValues={
+                        ':rate': Decimal(str(round(total_detections / total_frames * 100, 2))),
+                        ':avg': Decimal(str(round(total_detections / total_frames, 2))),
+                        ':frames': total_frames
+                    }
+                )
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                    # A newer ADD landed first; its flush sets the rates
+                    SESSION_RATE_FAILURES.inc(reason='superseded')
+                else:
+                    SESSION_RATE_FAILURES.inc(reason='error')
+                    logger.warning("⚠️ Session rate update failed (%s): %s", period, e)
+            except Exception as e:
+                SESSION_RATE_FAILURES.inc(reason='error')
+                logger.warning("⚠️ Session rate update failed (%s): %s", period, e)
+        logger.debug("📊 Session %s: +%d frame(s), +%d detection(s) -> %d frames",
+                     period, frames, detections, total_frames)
+        return True
+
+    def _flush_loop(self):
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning("⚠️ Session stats flush failed: %s", e)
+
+    def stop(self):
+        self._stop_event.set()
+        self.flush()
+
+
+class NearDuplicateFilter:
+    """
+    Remembers a 64-bit difference hash (dHash) and the detection boxes of recently
+    uploaded frames. A frame whose hash is within max_distance bits of one of them,
+    with the same number of detections each overlapping a remembered box, adds
+    nothing new and is not uploaded again. The hash is computed on a 9x8 grayscale
+    thumbnail, so it costs a single resize of the full frame.
+    """
+
+    def __init__(self, max_distance=NEAR_DUP_MAX_DISTANCE, box_iou=NEAR_DUP_BOX_IOU,
+                 window=NEAR_DUP_WINDOW, max_age=NEAR_DUP_MAX_AGE_SEC):
+        self.max_distance = max_distance
+        self.box_iou = box_iou
+        self.max_age = max_age
+        self._recent = deque(maxlen=max(1, window))  # [hash, boxes, uploaded_at]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def frame_hash(frame):
+        thumb = cv2.resize(frame, (9, 8), interpolation=cv2.INTER_AREA)
+        if thumb.ndim == 3:
+            thumb = cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY)
+        bits = (thumb[:, 1:] > thumb[:, :-1]).flatten()
+        return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+    @staticmethod
+    def _boxes(detections):
+        boxes = []
+        for detection in detections:
+            bbox = detection.get('bbox', {})
+            x, y = float(bbox.get('x', 0)), float(bbox.get('y', 0))
+            boxes.append((x, y, x + float(bbox.get('width', 0)), y + float(bbox.get('height', 0))))
+        return boxes
+
+    @staticmethod
+    def _iou(a, b):
+        inter = max(0.0, min(a[2], b[2]) - max(a[0], b[0])) * max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+        union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+        return inter / union if union > 0 else 0.0
+
+    def _same_boxes(self, a, b):
+        if len(a) != len(b):
+            return False
+        return all(any(self._iou(box, other) >= self.box_iou for other in b) for box in a)
+
+    def admit(self, frame, detections):
+        """
+        Return None if the frame is a near-duplicate of a recent upload, otherwise
+        remember it and return a token for forget() in case its upload fails.
+        """
+        frame_hash = self.frame_hash(frame)
+        boxes = self._boxes(detections)
+        now = time.time()
+        with self._lock:
+            for entry in self._recent:
+                if now - entry[2] > self.max_age:
+                    continue
+                if bin(frame_hash ^ entry[0]).count('1') <= self.max_distance and self._same_boxes(boxes, entry[1]):
+                    return None
+            entry = [frame_hash, boxes, now]
+            self._recent.append(entry)
+            return entry
+
+    def forget(self, token):
+        with self._lock:
+            try:
+                self._recent.remove(token)
+            except ValueError:
+                pass
+
+
+class BatchedFrame:
+    """Encoded objects of one frame waiting in a batch"""
+
+    def __init__(self, frame_id, timestamp, with_bbox, without_bbox, labels, crops, detections):
+        self.frame_id = frame_id
+        self.timestamp = timestamp
+        self.with_bbox = with_bbox
+        self.without_bbox = without_bbox
+        self.labels = labels  # YOLO label bytes or None
+        self.crops = crops  # [(idx, detection, jpeg bytes)]
+        self.detections = detections  # normalized, as stored in the frame item
+
+    def nbytes(self):
+        return (len(self.with_bbox) + len(self.without_bbox) + len(self.labels or b'')
+                + sum(len(body) for _, _, body in self.crops))
+
+
+class BatchUploader:
+    """
+    Collects encoded frames, crops and labels and writes them as one batch archive
+    (see batch_archive.py) with a single PUT once max_frames, max_bytes or max_age
+    is reached. The DynamoDB items of the batch are written after the archive is
+    stored (or spooled, in which case the items are spooled behind it) and point
+    at byte ranges inside it.
+    """
+
+    def __init__(self, sender, bucket=FRAMES_WITHOUT_BBOX_BUCKET, max_frames=BATCH_MAX_FRAMES,
+                 max_bytes=int(BATCH_MAX_MB * 1024 * 1024), max_age=BATCH_MAX_SEC):
+        self.sender = sender
+        self.bucket = bucket
+        self.max_frames = max(1, int(max_frames))
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._frames = []
+        self._bytes = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self.batches = 0
+        self._thread = threading.Thread(target=self._age_loop, name='batch-uploader', daemon=True)
+        self._thread.start()
+
+    def add(self, frame):
+        with self._lock:
+            if not self._frames:
+                self._opened_at = time.time()
+            self._frames.append(frame)
+            self._bytes += frame.nbytes()
+            full = len(self._frames) >= self.max_frames or self._bytes >= self.max_bytes
+            batch = self._take() if full else None
+        if batch:
+            self._upload(batch)
+
+    def _take(self):
+        """Detach the current batch (lock held)"""
+        batch, self._frames, self._bytes = self._frames, [], 0
+        return batch
+
+    def flush(self):
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._upload(batch)
+
+    def stop(self):
+        self._stop_event.set()
+        self.flush()
+
+    def _age_loop(self):
+        while not self._stop_event.wait(min(1.0, max(0.1, self.max_age / 4))):
+            with self._lock:
+                expired = self._frames and time.time() - self._opened_at >= self.max_age
+                batch = self._take() if expired else None
+            if batch:
+                self._upload(batch)
+
+    def _upload(self, batch):
+        sender = self.sender
+        user_id = sender.user_id
+        archive = BatchArchive()
+        members = []
+        for frame in batch:
+            prefix = sender.frame_prefix(frame.timestamp, frame.frame_id)
+            with_range = archive.add(f"{prefix}/frame-with-bbox.jpg", frame.with_bbox, 'image/jpeg')
+            without_range = archive.add(f"{prefix}/frame-no-bbox.jpg", frame.without_bbox, 'image/jpeg')
+            labels_range = archive.add(f"{prefix}/frame-no-bbox.txt", frame.labels, 'text/plain') if frame.labels else None
+            crop_ranges = [(idx, detection, archive.add(f"{prefix}/cropped_impurity_{idx}.jpg", body, 'image/jpeg'))
+                           for idx, detection, body in frame.crops]
+            members.append((frame, with_range, without_range, labels_range, crop_ranges))
+        
+        key = f"{user_id}/batches/{batch[0].timestamp}-{uuid.uuid4().hex[:8]}.mzb"
+        body = archive.to_bytes()
+        metadata = {'timestamp': datetime.utcnow().isoformat(), 'frames': str(len(batch)), 'format': 'mzb1'}
+        archive_url = None
+        try:
+            with STAGE_SECONDS.time(stage='s3_put'):
+                s3_client.put_object(Bucket=self.bucket, Key=key, Body=body,
+                                     ContentType='application/octet-stream', Metadata=metadata)
+            BYTES_SENT.inc(len(body), kind='batch')
+            archive_url = f"s3://{self.bucket}/{key}"
+        except Exception as e:
+            logger.error("   ❌ Batch Upload Error: %s: %s", type(e).__name__, e)
+            archive_url = sender._spool_s3(self.bucket, key, body, 'application/octet-stream', metadata)
+        if not archive_url:
+            logger.error("❌ Lost batch of %d frame(s): archive could be neither uploaded nor spooled", len(batch))
+            return False
+        
+        deferred = sender.is_deferred(archive_url)
+        for frame, with_range, without_range, labels_range, crop_ranges in members:
+            for idx, detection, crop_range in crop_ranges:
+                sender.save_impurity_to_dynamodb(str(uuid.uuid4()), frame.timestamp,
+                                                 member_url(archive_url, *crop_range), detection, defer=deferred)
+            sender.save_frame_to_dynamodb(
+                frame.frame_id,
+                frame.timestamp,
+                member_url(archive_url, *with_range),
+                member_url(archive_url, *without_range),
+                len(frame.detections),
+                frame.detections,
+                defer=deferred,
+                labels_url=member_url(archive_url, *labels_range) if labels_range else None
+            )
+        self.batches += 1
+        logger.info("📦 Batch saved: %d frame(s), %d object(s), %.1f MB -> %s",
+                    len(batch), len(archive), len(body) / (1024 * 1024), archive_url)
+        return True
+
+
 class DetectionSender:
     """Handles AWS integration for detections - S3 uploads and DynamoDB storage"""
     
@@ -170,53 +916,162 @@ class DetectionSender:
         self.auth_token = None
         self.session = requests.Session()
         self.user_id = 'web-user'
+        # Shared pool for the independent S3 PUTs of a frame (frames, crops, labels)
+        self.io_pool = ThreadPoolExecutor(max_workers=UPLOAD_FANOUT_THREADS, thread_name_prefix='s3-put')
+        # JPEG encoding runs in worker processes, frames are handed over via shared memory
+        self.encoder = JpegEncoderPool(ENCODE_PROCESSES)
+        self.near_duplicates = NearDuplicateFilter() if NEAR_DUP_ENABLED else None
+        self.session_stats = SessionStatsAggregator() if SESSION_STATS_ENABLED else None
+        self.batcher = None
+        if BATCH_ENABLED:
+            self.batcher = BatchUploader(self)
+            METRICS.callback_counter('mozuku_batches_uploaded_total', 'Batch archives written to S3',
+                                     lambda: self.batcher.batches)
+        self.spool = None
+        if SPOOL_ENABLED:
+            try:
+                self.spool = UploadSpool()
+                self.spool.start()
+                METRICS.gauge('mozuku_spool_backlog', 'Operations waiting in the upload spool', self.spool.backlog)
+                METRICS.callback_counter('mozuku_spool_spooled_total', 'Writes diverted to the upload spool',
+                                         lambda: self.spool.spooled)
+                METRICS.callback_counter('mozuku_spool_replayed_total', 'Spooled writes replayed successfully',
+                                         lambda: self.spool.replayed)
+                METRICS.callback_counter('mozuku_spool_discarded_total', 'Spooled writes cancelled by a rollback',
+                                         lambda: self.spool.discarded)
+            except Exception as e:
+                logger.warning("⚠️ Upload spool unavailable, failed uploads will be lost: %s", e)
         
     def authenticate(self):
         """Get ID token from Cognito - using browser token or skip if not available"""
-        print("🔐 Checking for browser Cognito token...")
+        logger.info("🔐 Checking for browser Cognito token...")
         try:
             # Try to read token from ~/.mozuku_auth_token if saved
             token_file = os.path.expanduser('~/.mozuku_auth_token')
             if os.path.exists(token_file):
                 with open(token_file, 'r') as f:
                     self.auth_token = f.read().strip()
-                print("✅ Using saved Cognito token!")
+                logger.info("✅ Using saved Cognito token!")
                 return True
         except Exception as e:
             pass
         
-        print("⚠️ No saved Cognito token found")
-        print("   Continuing with direct S3/DynamoDB uploads\n")
+        logger.warning("⚠️ No saved Cognito token found")
+        logger.info("   Continuing with direct S3/DynamoDB uploads")
         return True
     
+    def _spool_s3(self, bucket, key, body, content_type, metadata):
+        """Hand a failed PUT to the spool. Returns the S3 URL it will eventually have, or None"""
+        if self.spool is None:
+            return None
+        try:
+            self.spool.put_s3(bucket, key, body, content_type, metadata)
+            return f"s3://{bucket}/{key}"
+        except Exception as e:
+            logger.error("   ❌ Spool write failed: %s: %s", type(e).__name__, e)
+            return None
+
+    def _spool_item(self, table, item):
+        """Hand a DynamoDB item to the spool. Returns True if it was stored"""
+        if self.spool is None:
+            return False
+        try:
+            self.spool.put_item(table.name, item)
+            return True
+        except Exception as e:
+            logger.error("   ❌ Spool write failed: %s: %s", type(e).__name__, e)
+            return False
+
+    def _put_item(self, table, item, defer=False):
+        """put_item with spool fallback; defer=True spools it directly (keeps it behind spooled S3 objects)"""
+        if defer and self._spool_item(table, item):
+            return True
+        try:
+            with STAGE_SECONDS.time(stage='dynamodb_put'):
+                table.put_item(Item=item)
+            return True
+        except Exception as e:
+            logger.error("❌ DynamoDB Save Error (%s): %s", table.name, e)
+            return self._spool_item(table, item)
+
+    def is_deferred(self, s3_url):
+        """True if s3_url was spooled and has not been replayed yet"""
+        return bool(s3_url) and self.spool is not None and self.spool.contains_s3(s3_url)
+
+    def encode_frame(self, frame, name=''):
+        """JPEG-encode a frame; returns the bytes, or None if encoding failed"""
+        try:
+            with STAGE_SECONDS.time(stage='encode'):
+                body = self.encoder.encode(frame, JPEG_QUALITY)
+        except Exception as e:
+            logger.error("   ❌ JPEG Encode Error: %s: %s", type(e).__name__, e)
+            return None
+        if body is None:
+            logger.error("   ❌ JPEG Encode Error: cv2.imencode failed for %s", name)
+        return body
+
     def upload_to_s3(self, frame, bucket, key):
-        """Upload image to S3 and return the S3 URL"""
+        """Upload image to S3 and return the S3 URL (spooled for replay if the PUT fails)"""
+        body = self.encode_frame(frame, f"{bucket}/{key}")
+        if body is None:
+            return None
+        metadata = {'timestamp': datetime.utcnow().isoformat()}
+        logger.debug("   📤 Encoded frame: %d bytes", len(body))
         try:
-            _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 90])
-            print(f"   📤 Encoding frame: {len(buffer.tobytes())} bytes")
-            
-            response = s3_client.put_object(
-                Bucket=bucket,
-                Key=key,
-                Body=buffer.tobytes(),
-                ContentType='image/jpeg',
-                Metadata={'timestamp': datetime.utcnow().isoformat()}
-            )
-            print(f"   ✅ S3 upload response: {response.get('ResponseMetadata', {}).get('HTTPStatusCode')}")
+            with STAGE_SECONDS.time(stage='s3_put'):
+                response = s3_client.put_object(
+                    Bucket=bucket,
+                    Key=key,
+                    Body=body,
+                    ContentType='image/jpeg',
+                    Metadata=metadata
+                )
+            BYTES_SENT.inc(len(body), kind='image')
+            logger.debug("   ✅ S3 upload response: %s", response.get('ResponseMetadata', {}).get('HTTPStatusCode'))
             
             s3_url = f"s3://{bucket}/{key}"
             return s3_url
         except Exception as e:
-            print(f"   ❌ S3 Upload Error: {type(e).__name__}: {str(e)}")
-            import traceback
-            print(f"   Traceback: {traceback.format_exc()}")
-            return None
+            logger.error("   ❌ S3 Upload Error: %s: %s", type(e).__name__, e, exc_info=logger.isEnabledFor(logging.DEBUG))
+            return self._spool_s3(bucket, key, body, 'image/jpeg', metadata)
 
     def upload_yolo_labels_to_s3(self, detections, bucket, key):
         """
         Upload YOLO labels to S3
         Format: class x_center y_center width height (normalized 0-1)
         """
+        lines = self.format_yolo_labels(detections)
+        if not lines:
+            return None
+        
+        body = '\n'.join(lines).encode('utf-8')
+        metadata = {
+            'timestamp': datetime.utcnow().isoformat(),
+            'detection_count': str(len(lines)),
+            'format': 'yolo'
+        }
+        try:
+            logger.debug("   📝 Uploading %d YOLO labels to S3", len(lines))
+            
+            with STAGE_SECONDS.time(stage='s3_put'):
+                response = s3_client.put_object(
+                    Bucket=bucket,
+                    Key=key,
+                    Body=body,
+                    ContentType='text/plain',
+                    Metadata=metadata
+                )
+            BYTES_SENT.inc(len(body), kind='labels')
+            logger.debug("   ✅ Coordinates uploaded: %s", response.get('ResponseMetadata', {}).get('HTTPStatusCode'))
+            
+            s3_url = f"s3://{bucket}/{key}"
+            return s3_url
+        except Exception as e:
+            logger.error("   ❌ Upload Error: %s: %s", type(e).__name__, e)
+            return self._spool_s3(bucket, key, body, 'text/plain', metadata)
+
+    def format_yolo_labels(self, detections):
+        """YOLO label lines for normalized detections (None if there is nothing to save)"""
         try:
             lines = []
             for det in detections:
@@ -229,31 +1084,29 @@ class DetectionSender:
                 lines.append(line)
             
             if not lines:
-                print(f"   ℹ️ No bboxes to save")
+                logger.debug("   ℹ️ No bboxes to save")
                 return None
-            
-            content = '\n'.join(lines)
-            print(f"   📝 Uploading {len(lines)} YOLO labels to S3")
-            
-            response = s3_client.put_object(
-                Bucket=bucket,
-                Key=key,
-                Body=content.encode('utf-8'),
-                ContentType='text/plain',
-                Metadata={
-                    'timestamp': datetime.utcnow().isoformat(),
-                    'detection_count': str(len(lines)),
-                    'format': 'yolo'
-                }
-            )
-            print(f"   ✅ Coordinates uploaded: {response.get('ResponseMetadata', {}).get('HTTPStatusCode')}")
-            
-            s3_url = f"s3://{bucket}/{key}"
-            return s3_url
+            return lines
         except Exception as e:
-            print(f"   ❌ Upload Error: {type(e).__name__}: {str(e)}")
+            logger.error("   ❌ Label Format Error: %s: %s", type(e).__name__, e)
             return None
 
+    def delete_from_s3(self, s3_url):
+        """Best-effort delete of an uploaded object, used to roll back partial uploads"""
+        try:
+            bucket, key = s3_url.replace('s3://', '').split('/', 1)
+            s3_client.delete_object(Bucket=bucket, Key=key)
+            return True
+        except Exception as e:
+            logger.warning("   ⚠️ S3 rollback failed for %s: %s: %s", s3_url, type(e).__name__, e)
+            return False
+
+    def rollback_s3(self, s3_url):
+        """Undo an upload: cancel it if it is still waiting in the spool, otherwise delete the object"""
+        if self.is_deferred(s3_url) and self.spool.discard(s3_url):
+            return True
+        return self.delete_from_s3(s3_url)
+
     def _to_decimal(self, obj):
         if isinstance(obj, float):
             return Decimal(str(obj))
@@ -278,7 +1131,7 @@ class DetectionSender:
             y_center = (y + (h / 2.0)) / frame_height
             w_norm = w / frame_width
             h_norm = h / frame_height
-            normalized.append({
+            entry = {
                 'class': 0,
                 'x': x_center,
                 'y': y_center,
@@ -286,7 +1139,10 @@ class DetectionSender:
                 'h': h_norm,
                 'label': det.get('label', 'unknown'),
                 'confidence': float(det.get('confidence', 0.0))
-            })
+            }
+            if 'track_id' in det:
+                entry['trackId'] = det['track_id']
+            normalized.append(entry)
         return normalized
 
     def _iou(self, a, b):
@@ -305,12 +1161,8 @@ class DetectionSender:
         union = area_a + area_b - inter_area
         return (inter_area / union) if union > 0 else 0.0
 
-    def dedupe_detections(self, detections, iou_threshold=0.7):
-        """Remove near-duplicate detections using IoU NMS."""
-        if not detections:
-            return []
-
-        # Build list with bbox and confidence
+    def _dedupe_candidates(self, detections):
+        """Collect (confidence, (x1, y1, x2, y2), detection) for boxes with positive area."""
         items = []
         for det in detections:
             bbox = det.get('bbox', {})
@@ -323,6 +1175,20 @@ class DetectionSender:
             x1, y1, x2, y2 = x, y, x + w, y + h
             conf = float(det.get('confidence', 0.0))
             items.append((conf, (x1, y1, x2, y2), det))
+        return items
+
+    def dedupe_detections(self, detections, iou_threshold=0.7):
+        """Remove near-duplicate detections using IoU NMS."""
+        if not detections:
+            return []
+        if len(detections) >= DEDUPE_NUMPY_MIN_BOXES:
+            return self.dedupe_detections_numpy(detections, iou_threshold)
+        return self.dedupe_detections_python(detections, iou_threshold)
+
+    def dedupe_detections_python(self, detections, iou_threshold=0.7):
+        """Pure-Python greedy NMS, O(n * kept)."""
+        # Build list with bbox and confidence
+        items = self._dedupe_candidates(detections)
 
         # Sort by confidence desc
         items.sort(key=lambda t: t[0], reverse=True)
@@ -338,35 +1204,67 @@ class DetectionSender:
                 kept.append((conf, bbox, det))
 
         return [det for _, _, det in kept]
+
+    def dedupe_detections_numpy(self, detections, iou_threshold=0.7):
+        """
+        Vectorized greedy NMS with the same result as dedupe_detections_python.
+        Each kept box is compared against all remaining boxes in one array op,
+        and everything it overlaps by >= iou_threshold is suppressed at once.
+        """
+        items = self._dedupe_candidates(detections)
+        if not items:
+            return []
+
+        conf = np.array([t[0] for t in items], dtype=np.float64)
+        boxes = np.array([t[1] for t in items], dtype=np.float64)
+        x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+        areas = (x2 - x1) * (y2 - y1)
+
+        # Stable sort keeps the original order among equal confidences, like list.sort
+        order = np.argsort(-conf, kind='stable')
+        keep = []
+        while order.size > 0:
+            i = order[0]
+            keep.append(i)
+            rest = order[1:]
+            inter_w = np.maximum(0.0, np.minimum(x2[rest], x2[i]) - np.maximum(x1[rest], x1[i]))
+            inter_h = np.maximum(0.0, np.minimum(y2[rest], y2[i]) - np.maximum(y1[rest], y1[i]))
+            inter = inter_w * inter_h
+            union = areas[rest] + areas[i] - inter
+            iou = np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+            order = rest[iou < iou_threshold]
+
+        return [items[i][2] for i in keep]
     
-    def save_impurity_to_dynamodb(self, impurity_id, timestamp, s3_url, detection):
-        """Save impurity metadata to DynamoDB"""
+    def save_impurity_to_dynamodb(self, impurity_id, timestamp, s3_url, detection, defer=False):
+        """Save impurity metadata to DynamoDB (spooled if the write fails or defer is set)"""
         try:
-            impurity_table.put_item(
-                Item={
-                    'impurityId': impurity_id,
-                    'userId': self.user_id,
-                    'timestamp': timestamp,
-                    's3Url': s3_url,
-                    'label': detection.get('label', 'unknown'),
-                    'confidence': Decimal(str(detection.get('confidence', 0.0))),
-                    'bbox': json.dumps(detection.get('bbox', {})),
-                    'ttl': int(datetime.utcnow().timestamp()) + (30 * 24 * 60 * 60)  # 30 days
-                }
-            )
-            return True
+            item = {
+                'impurityId': impurity_id,
+                'userId': self.user_id,
+                'timestamp': timestamp,
+                's3Url': s3_url,
+                'label': detection.get('label', 'unknown'),
+                'confidence': Decimal(str(detection.get('confidence', 0.0))),
+                'bbox': json.dumps(detection.get('bbox', {})),
+                'ttl': int(datetime.utcnow().timestamp()) + (30 * 24 * 60 * 60)  # 30 days
+            }
+            if 'track_id' in detection:
+                item['trackId'] = detection['track_id']
+            return self._put_item(impurity_table, item, defer=defer)
         except Exception as e:
-            print(f"❌ DynamoDB Impurity Save Error: {str(e)}")
+            logger.error("❌ DynamoDB Impurity Save Error: %s", e)
             return False
     
-    def save_frame_to_dynamodb(self, frame_id, timestamp, frame_with_bbox_url, frame_without_bbox_url, detection_count, detections):
-        """Save frame detection metadata to DynamoDB"""
+    def save_frame_to_dynamodb(self, frame_id, timestamp, frame_with_bbox_url, frame_without_bbox_url, detection_count, detections, defer=False, labels_url=None):
+        """Save frame detection metadata to DynamoDB (spooled if the write fails or defer is set)"""
         try:
-            s3_labels_path = ''
-            if frame_without_bbox_url and frame_without_bbox_url.startswith('s3://'):
+            s3_labels_path = labels_url or ''
+            if not labels_url and frame_without_bbox_url and frame_without_bbox_url.startswith('s3://'):
                 s3_labels_path = frame_without_bbox_url.replace('.jpg', '.txt').replace('.png', '.txt')
-            frame_table.put_item(
-                Item={
+            saved = self._put_item(
+                frame_table,
+                {
                     'frameId': frame_id,
                     'userId': self.user_id,
                     'timestamp': timestamp,
@@ -379,17 +1277,25 @@ class DetectionSender:
                     'modelUsed': 'yolov8-best',
                     'motorSpeed': 0,
                     'cameraSettings': json.dumps({'resolution': '1280x720', 'fps': 30})
-                }
+                },
+                defer=defer
             )
-            return True
+            if saved and self.session_stats is not None:
+                self.session_stats.record(self.user_id, timestamp, detection_count)
+            return saved
         except Exception as e:
-            print(f"❌ DynamoDB Frame Save Error: {str(e)}")
+            logger.error("❌ DynamoDB Frame Save Error: %s", e)
             return False
     
-    def extract_and_upload_cropped_images(self, frame, detections, timestamp):
-        """Extract cropped regions and upload them to S3"""
-        cropped_images = []
+    def extract_cropped_regions(self, frame, detections):
+        """Cut padded crops for each detection. Returns a list of (idx, detection, cropped)"""
+        regions = []
         frame_height, frame_width = frame.shape[:2]
+        # Full-frame reductions below are only worth paying for when someone reads them
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("   📊 Frame dtype: %s, shape: %s, min/max pixel values: %s/%s",
+                         frame.dtype, frame.shape, frame.min(), frame.max())
         
         for idx, detection in enumerate(detections):
             try:
@@ -399,8 +1305,8 @@ class DetectionSender:
                 w = int(bbox.get('width', 0))
                 h = int(bbox.get('height', 0))
                 
-                print(f"   📊 Crop {idx}: bbox=({x},{y},{w}x{h}) from frame {frame_width}x{frame_height}")
-                print(f"        Frame dtype: {frame.dtype}, shape: {frame.shape}, min/max pixel values: {frame.min()}/{frame.max()}")
+                logger.debug("   📊 Crop %d: bbox=(%d,%d,%dx%d) from frame %dx%d",
+                             idx, x, y, w, h, frame_width, frame_height)
                 
                 # Add padding around the detection
                 padding = 20
@@ -411,122 +1317,907 @@ class DetectionSender:
                 
                 cropped = frame[y1:y2, x1:x2]
                 cropped_h, cropped_w = cropped.shape[:2]
-                print(f"        -> Cropping region: x1={x1} y1={y1} x2={x2} y2={y2} = {cropped_w}x{cropped_h} pixels")
-                print(f"        Cropped region pixel values: min={cropped.min()}, max={cropped.max()}, mean={cropped.mean():.1f}")
+                logger.debug("        -> Cropping region: x1=%d y1=%d x2=%d y2=%d = %dx%d pixels",
+                             x1, y1, x2, y2, cropped_w, cropped_h)
+                if debug and cropped.size:
+                    logger.debug("        Cropped region pixel values: min=%s, max=%s, mean=%.1f",
+                                 cropped.min(), cropped.max(), cropped.mean())
                 
                 if cropped_w < 10 or cropped_h < 10:
-                    print(f"        ⚠️ Cropped region too small, skipping")
+                    logger.debug("        ⚠️ Cropped region too small, skipping")
                     continue
                 
+                regions.append((idx, detection, cropped))
+            except Exception as e:
+                logger.warning("⚠️ Error cropping detection %d: %s", idx, e)
+                continue
+        
+        return regions
+    
+    def _record_cropped_impurity(self, idx, detection, s3_url, timestamp):
+        """Save impurity metadata for an uploaded crop and return its summary"""
+        impurity_id = str(uuid.uuid4())
+        self.save_impurity_to_dynamodb(impurity_id, timestamp, s3_url, detection, defer=self.is_deferred(s3_url))
+        logger.debug("   📍 Cropped impurity %d: %s (%.1f%%)",
+                     idx + 1, detection.get('label'), float(detection.get('confidence', 0)) * 100)
+        return {
+            'impurityId': impurity_id,
+            'url': s3_url,
+            'label': detection.get('label', 'unknown'),
+            'confidence': detection.get('confidence', 0.0)
+        }
+    
+    def frame_prefix(self, timestamp, frame_id):
+        """S3 key prefix of one frame's objects; the frame id keeps frames started in the same millisecond apart"""
+        return f"{self.user_id}/{timestamp}-{frame_id}"
+    
+    def extract_and_upload_cropped_images(self, frame, detections, timestamp, frame_id=None):
+        """Extract cropped regions and upload them to S3"""
+        prefix = self.frame_prefix(timestamp, frame_id or uuid.uuid4())
+        cropped_images = []
+        for idx, detection, cropped in self.extract_cropped_regions(frame, detections):
+            try:
                 # Upload to impurities bucket
-                impurity_id = str(uuid.uuid4())
-                impurity_key = f"{self.user_id}/{timestamp}/cropped_impurity_{idx}.jpg"
+                impurity_key = f"{prefix}/cropped_impurity_{idx}.jpg"
                 s3_url = self.upload_to_s3(cropped, IMPURITIES_BUCKET, impurity_key)
                 
                 if s3_url:
                     # Save metadata to DynamoDB
-                    self.save_impurity_to_dynamodb(impurity_id, timestamp, s3_url, detection)
-                    cropped_images.append({
-                        'impurityId': impurity_id,
-                        'url': s3_url,
-                        'label': detection.get('label', 'unknown'),
-                        'confidence': detection.get('confidence', 0.0)
-                    })
-                    print(f"   📍 Cropped impurity {idx + 1}: {detection.get('label')} ({detection.get('confidence', 0):.1%})")
+                    cropped_images.append(self._record_cropped_impurity(idx, detection, s3_url, timestamp))
             except Exception as e:
-                print(f"⚠️ Error cropping detection {idx}: {str(e)}")
+                logger.warning("⚠️ Error uploading crop %d: %s", idx, e)
                 continue
         
         return cropped_images
     
-    def send_detection(self, frame_with_bbox, frame_raw, detections):
-        """Upload annotated frame (with bboxes from yolov8_node) and raw frame to S3"""
-        if not detections or len(detections) == 0:
-            print("⚠️ No detections - skipping S3 upload")
+    def _label_detections(self, detections, frame_raw):
+        """De-duplicate detections, keep the most confident one and normalize it to YOLO format"""
+        # De-duplicate detections to avoid repeated boxes across near-identical frames
+        deduped_detections = self.dedupe_detections(detections)
+        if len(deduped_detections) != len(detections):
+            logger.debug("   🔁 Deduped detections: %d -> %d", len(detections), len(deduped_detections))
+
+        # If still multiple detections, keep only the highest confidence
+        if len(deduped_detections) > 1:
+            deduped_detections.sort(key=lambda d: float(d.get('confidence', 0.0)), reverse=True)
+            deduped_detections = [deduped_detections[0]]
+            logger.debug("   ✅ Keeping top-1 detection by confidence")
+
+        # Convert yolov8 detections to YOLO normalized labels
+        frame_h, frame_w = frame_raw.shape[:2]
+        return self.normalize_detections(deduped_detections, frame_w, frame_h)
+
+    def _send_detection_batched(self, frame_with_bbox, frame_raw, detections):
+        """Encode a frame with its crops and labels and add them to the current batch"""
+        detection_frame = detections[0].get('frame_with_bbox')
+        frame_to_use = detection_frame if detection_frame is not None else frame_with_bbox
+        timestamp = int(datetime.utcnow().timestamp() * 1000)
+        
+        # Both full frames are encoded in parallel (the encoder pool does the work)
+        with_future = self.io_pool.submit(self.encode_frame, frame_to_use, 'frame-with-bbox')
+        without_body = self.encode_frame(frame_raw, 'frame-no-bbox')
+        with_body = with_future.result()
+        if with_body is None or without_body is None:
             return False
         
-        try:
-            frame_id = str(uuid.uuid4())
-            timestamp = int(datetime.utcnow().timestamp() * 1000)
-            
-            # Upload raw frame without bbox
-            frame_without_key = f"{self.user_id}/{timestamp}/frame-no-bbox.jpg"
-            frame_without_url = self.upload_to_s3(frame_raw, FRAMES_WITHOUT_BBOX_BUCKET, frame_without_key)
-            
+        to_crop = [d for d in detections if d.get('track_best', True)]
+        crops = []
+        for idx, detection, cropped in self.extract_cropped_regions(frame_raw, to_crop):
+            body = self.encode_frame(cropped, f'cropped_impurity_{idx}')
+            if body is not None:
+                crops.append((idx, detection, body))
+        
+        normalized_detections = self._label_detections(detections, frame_raw)
+        lines = self.format_yolo_labels(normalized_detections)
+        labels = '\n'.join(lines).encode('utf-8') if lines else None
+        
+        self.batcher.add(BatchedFrame(str(uuid.uuid4()), timestamp, with_body, without_body,
+                                      labels, crops, normalized_detections))
+        return True
+
+    def send_detection(self, frame_with_bbox, frame_raw, detections):
+        """
+        Upload annotated frame (with bboxes from yolov8_node), raw frame, crops and
+        YOLO labels to S3 in parallel, then save the frame record to DynamoDB.
+        
+        The DynamoDB writes only happen once both frames are in S3 (or in the upload
+        spool). If either frame can be neither uploaded nor spooled, every object
+        uploaded for this frame is deleted again so no orphaned crops/labels are left behind.
+        """
+        if not detections or len(detections) == 0:
+            logger.warning("⚠️ No detections - skipping S3 upload")
+            return False
+        
+        if self.batcher is not None:
+            try:
+                return self._send_detection_batched(frame_with_bbox, frame_raw, detections)
+            except Exception as e:
+                logger.exception("❌ Error adding frame to batch: %s", e)
+                return False
+        
+        try:
+            frame_id = str(uuid.uuid4())
+            timestamp = int(datetime.utcnow().timestamp() * 1000)
+            
             # Use the frame stored with the detection (synchronized), or fall back to passed frame_with_bbox
             detection_frame = detections[0].get('frame_with_bbox') if detections else None
             frame_to_use = detection_frame if detection_frame is not None else frame_with_bbox
             
-            # Upload annotated frame from yolov8_node (already has correct bboxes drawn)
-            frame_with_key = f"{self.user_id}/{timestamp}/frame-with-bbox.jpg"
-            frame_with_url = self.upload_to_s3(frame_to_use, FRAMES_WITH_BBOX_BUCKET, frame_with_key)
+            prefix = self.frame_prefix(timestamp, frame_id)
+            frame_without_key = f"{prefix}/frame-no-bbox.jpg"
+            frame_with_key = f"{prefix}/frame-with-bbox.jpg"
             
-            if not (frame_without_url and frame_with_url):
-                return False
+            # Raw frame without bbox + annotated frame from yolov8_node (already has correct bboxes drawn)
+            frame_without_future = self.io_pool.submit(
+                self.upload_to_s3, frame_raw, FRAMES_WITHOUT_BBOX_BUCKET, frame_without_key
+            )
+            frame_with_future = self.io_pool.submit(
+                self.upload_to_s3, frame_to_use, FRAMES_WITH_BBOX_BUCKET, frame_with_key
+            )
             
-            # Extract and upload cropped impurities from RAW frame (without bboxes drawn)
-            # This ensures cropped images don't have bounding boxes on them
-            cropped_images = self.extract_and_upload_cropped_images(frame_raw, detections, timestamp)
+            # Extract cropped impurities from RAW frame (without bboxes drawn)
+            # This ensures cropped images don't have bounding boxes on them.
+            # Tracked impurities are cropped only from the frame their track chose.
+            crop_futures = []
+            to_crop = [d for d in detections if d.get('track_best', True)]
+            for idx, detection, cropped in self.extract_cropped_regions(frame_raw, to_crop):
+                impurity_key = f"{prefix}/cropped_impurity_{idx}.jpg"
+                future = self.io_pool.submit(self.upload_to_s3, cropped, IMPURITIES_BUCKET, impurity_key)
+                crop_futures.append((idx, detection, future))
 
-            # De-duplicate detections to avoid repeated boxes across near-identical frames
-            deduped_detections = self.dedupe_detections(detections)
-            if len(deduped_detections) != len(detections):
-                print(f"   🔁 Deduped detections: {len(detections)} -> {len(deduped_detections)}")
-
-            # If still multiple detections, keep only the highest confidence
-            if len(deduped_detections) > 1:
-                deduped_detections.sort(key=lambda d: float(d.get('confidence', 0.0)), reverse=True)
-                deduped_detections = [deduped_detections[0]]
-                print("   ✅ Keeping top-1 detection by confidence")
-
-            # Convert yolov8 detections to YOLO normalized labels
-            frame_h, frame_w = frame_raw.shape[:2]
-            normalized_detections = self.normalize_detections(deduped_detections, frame_w, frame_h)
+            normalized_detections = self._label_detections(detections, frame_raw)
 
             # Upload YOLO labels as txt file (same folder as clean frame)
-            coords_key = f"{self.user_id}/{timestamp}/frame-no-bbox.txt"
-            coords_url = self.upload_yolo_labels_to_s3(
-                normalized_detections,
-                FRAMES_WITHOUT_BBOX_BUCKET,
-                coords_key
+            coords_key = f"{prefix}/frame-no-bbox.txt"
+            coords_future = self.io_pool.submit(
+                self.upload_yolo_labels_to_s3, normalized_detections, FRAMES_WITHOUT_BBOX_BUCKET, coords_key
             )
             
-            # Save frame metadata to DynamoDB
+            wait([frame_without_future, frame_with_future, coords_future] + [f for _, _, f in crop_futures])
+            frame_without_url = frame_without_future.result()
+            frame_with_url = frame_with_future.result()
+            coords_url = coords_future.result()
+            crop_urls = [(idx, detection, future.result()) for idx, detection, future in crop_futures]
+            
+            if not (frame_without_url and frame_with_url):
+                uploaded = [frame_without_url, frame_with_url, coords_url] + [url for _, _, url in crop_urls]
+                uploaded = [url for url in uploaded if url]
+                logger.warning("   ↩️ Frame upload failed - rolling back %d uploaded object(s)", len(uploaded))
+                for url in uploaded:
+                    self.rollback_s3(url)
+                return False
+            
+            # Save cropped impurity metadata now that the frame is known to be stored
+            cropped_images = [
+                self._record_cropped_impurity(idx, detection, url, timestamp)
+                for idx, detection, url in crop_urls if url
+            ]
+            
+            # Save frame metadata to DynamoDB. If any of its objects is waiting in the
+            # spool, spool the item too so it is replayed after them, never before.
+            deferred = any(self.is_deferred(url) for url in (frame_with_url, frame_without_url, coords_url))
             success = self.save_frame_to_dynamodb(
                 frame_id,
                 timestamp,
                 frame_with_url,
                 frame_without_url,
                 len(normalized_detections),
-                normalized_detections
+                normalized_detections,
+                defer=deferred
             )
             
             if success:
-                print(f"✅ Frame saved: {frame_id} with {len(normalized_detections)} detected impurities\n")
+                logger.info("✅ Frame saved: %s with %d detected impurities (%d crops)",
+                            frame_id, len(normalized_detections), len(cropped_images))
                 return True
             else:
                 return False
                 
         except Exception as e:
-            print(f"❌ Error in send_detection: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
+            logger.exception("❌ Error in send_detection: %s", e)
             return False
 
+class FrameStore:
+    """
+    Fixed-capacity, reference-counted store for camera frames.
+
+    Every detection on the same camera/annotated frame pair shares one entry
+    instead of holding its own full-frame copies. Entries are keyed by frame
+    identity and removed as soon as the last detection referencing them is
+    uploaded or dropped. Upload jobs hold the store's frames until they are
+    done, so the store accounts for every buffered frame: a new frame pair that
+    would exceed max_frames or max_bytes is refused (the newest frame is dropped)
+    rather than evicting frames that are still referenced.
+    """
+
+    def __init__(self, max_frames=FRAME_STORE_MAX_FRAMES, max_bytes=int(FRAME_STORE_MAX_MB * 1024 * 1024)):
+        self.max_frames = max(1, int(max_frames))
+        self.max_bytes = max_bytes
+        self._frames = OrderedDict()  # key -> [frame_raw, frame_with_bbox, refcount, nbytes]
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.refused = 0
+
+    def acquire(self, key, frame_raw, frame_with_bbox, count=1):
+        """
+        Add count references to the frame pair stored under key, storing it if new.
+        Returns key, or None if the store is full and the frame pair was not stored.
+        """
+        with self._lock:
+            entry = self._frames.get(key)
+            if entry is not None:
+                entry[2] += count
+                return key
+            nbytes = sum(f.nbytes for f in (frame_raw, frame_with_bbox) if f is not None)
+            if self._frames and (len(self._frames) >= self.max_frames or self._bytes + nbytes > self.max_bytes):
+                self.refused += 1
+                return None
+            self._frames[key] = [frame_raw, frame_with_bbox, count, nbytes]
+            self._bytes += nbytes
+            return key
+
+    def get(self, key):
+        """Return (frame_raw, frame_with_bbox) for key, or (None, None) if evicted"""
+        with self._lock:
+            entry = self._frames.get(key)
+            if entry is None:
+                return None, None
+            return entry[0], entry[1]
+
+    def release(self, key, count=1):
+        """Drop references; the frame is freed once nothing refers to it"""
+        with self._lock:
+            entry = self._frames.get(key)
+            if entry is None:
+                return
+            entry[2] -= count
+            if entry[2] <= 0:
+                del self._frames[key]
+                self._bytes -= entry[3]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'frames': len(self._frames),
+                'mb': self._bytes / (1024 * 1024),
+                'refused': self.refused,
+            }
+
+
+class FrameSynchronizer:
+    """
+    Approximate-time matcher for the camera, annotated image and detection topics.
+
+    Messages are paired by their ROS header stamps (nanoseconds), not by arrival
+    time. Every Detection2D of one inference shares the stamp of its input image,
+    so detections are collected per stamp and emitted as one bundle once both
+    frames within slop of that stamp are present and no more detections are
+    expected for it (a newer detection arrived, or grace seconds passed).
+
+    Frames that cannot be matched any more are dropped right away:
+      - frames older than the newest detection stamp (detections arrive in order)
+      - frames whose inference finished (annotated image settled) without detections
+      - anything older than max_age behind the newest stamp
+    Emitted frames move into the FrameStore, one reference per detection; bundles
+    the store refuses because it is full are dropped.
+    """
+
+    def __init__(self, frame_store, slop=SYNC_SLOP_SEC, grace=SYNC_GRACE_SEC, max_age=SYNC_MAX_AGE_SEC):
+        self.frame_store = frame_store
+        self.slop_ns = int(slop * 1e9)
+        self.max_age_ns = int(max_age * 1e9)
+        self.grace = grace
+        self._raw = OrderedDict()  # stamp -> frame
+        self._annotated = OrderedDict()  # stamp -> frame
+        self._annotated_arrival = {}  # stamp -> wall time
+        self._detections = {}  # stamp -> [detection, ...]
+        self._detection_arrival = {}  # stamp -> wall time of the latest detection
+        self._lock = threading.Lock()
+        self.newest_stamp = 0
+        self.newest_annotated_stamp = 0
+        self.newest_detection_stamp = 0
+
+        # Counters
+        self.bundles = 0
+        self.frames_dropped = 0
+        self.detections_dropped = 0
+
+    def add_raw(self, stamp, frame):
+        with self._lock:
+            self._raw[stamp] = frame
+            self.newest_stamp = max(self.newest_stamp, stamp)
+            return self._assemble()
+
+    def add_annotated(self, stamp, frame):
+        with self._lock:
+            self._annotated[stamp] = frame
+            self._annotated_arrival[stamp] = time.time()
+            self.newest_stamp = max(self.newest_stamp, stamp)
+            self.newest_annotated_stamp = max(self.newest_annotated_stamp, stamp)
+            return self._assemble()
+
+    def add_detection(self, stamp, detection):
+        with self._lock:
+            self._detections.setdefault(stamp, []).append(detection)
+            self._detection_arrival[stamp] = time.time()
+            self.newest_stamp = max(self.newest_stamp, stamp)
+            self.newest_detection_stamp = max(self.newest_detection_stamp, stamp)
+            return self._assemble()
+
+    def poll(self):
+        """Emit bundles whose grace period has expired since the last message"""
+        with self._lock:
+            return self._assemble()
+
+    def pending(self):
+        with self._lock:
+            return {
+                'raw': len(self._raw),
+                'annotated': len(self._annotated),
+                'detections': sum(len(d) for d in self._detections.values()),
+            }
+
+    def _nearest(self, frames, stamp):
+        best, best_dt = None, None
+        for frame_stamp in frames:
+            dt = abs(frame_stamp - stamp)
+            if dt <= self.slop_ns and (best_dt is None or dt < best_dt):
+                best, best_dt = frame_stamp, dt
+        return best
+
+    def _assemble(self):
+        """Return the list of detection groups that became complete bundles"""
+        now = time.time()
+        ready = []
+        for stamp in sorted(self._detections):
+            raw_stamp = self._nearest(self._raw, stamp)
+            annotated_stamp = self._nearest(self._annotated, stamp)
+            if raw_stamp is None or annotated_stamp is None:
+                continue
+            settled = stamp < self.newest_detection_stamp or now - self._detection_arrival[stamp] >= self.grace
+            if not settled:
+                continue
+
+            detections = self._detections.pop(stamp)
+            del self._detection_arrival[stamp]
+            frame_raw = self._raw.pop(raw_stamp)
+            frame_with_bbox = self._annotated.pop(annotated_stamp)
+            self._annotated_arrival.pop(annotated_stamp, None)
+
+            frame_key = (raw_stamp, annotated_stamp)
+            if self.frame_store.acquire(frame_key, frame_raw, frame_with_bbox, len(detections)) is None:
+                FRAMES_DROPPED.inc(reason='store_full')
+                self.detections_dropped += len(detections)
+                continue
+            for detection in detections:
+                detection['frame_key'] = frame_key
+                detection['frame_stamp'] = stamp
+            ready.append(detections)
+            self.bundles += 1
+
+        self._prune(now)
+        return ready
+
+    def _prune(self, now):
+        horizon = self.newest_stamp - self.max_age_ns
+        cutoff = horizon
+        if self.newest_detection_stamp:
+            cutoff = max(cutoff, self.newest_detection_stamp - self.slop_ns)
+        settled_annotated = [s for s, t in self._annotated_arrival.items() if now - t >= self.grace]
+        if settled_annotated:
+            cutoff = max(cutoff, max(settled_annotated) + self.slop_ns)
+        pending = list(self._detections)
+        for frames in (self._raw, self._annotated):
+            for frame_stamp in list(frames):
+                if frame_stamp >= horizon and any(abs(frame_stamp - p) <= self.slop_ns for p in pending):
+                    continue
+                if frame_stamp <= cutoff:
+                    del frames[frame_stamp]
+                    if frames is self._annotated:
+                        del self._annotated_arrival[frame_stamp]
+                    self.frames_dropped += 1
+
+        for stamp in list(self._detections):
+            if stamp < horizon:
+                self.detections_dropped += len(self._detections.pop(stamp))
+                del self._detection_arrival[stamp]
+
+
+class UploadJob:
+    """One frame worth of detections waiting to be uploaded"""
+
+    def __init__(self, frame_with_bbox, frame_raw, detections, on_done=None):
+        self.frame_with_bbox = frame_with_bbox
+        self.frame_raw = frame_raw
+        self.detections = detections
+        self.enqueued_at = time.time()
+        self.confidence = max((float(d.get('confidence', 0.0)) for d in detections), default=0.0)
+        self._on_done = on_done
+
+    def done(self):
+        """Called once the job is uploaded, failed or dropped"""
+        if self._on_done is not None:
+            self._on_done()
+            self._on_done = None
+
+
+class UploadQueue:
+    """
+    Bounded queue of frame upload jobs drained by a pool of worker threads.
+
+    When the queue is full, put() waits up to enqueue_timeout for a free slot
+    (backpressure), then evicts a job according to drop_policy:
+      - 'oldest': drop the job that has been waiting longest
+      - 'lowest_confidence': drop the job whose best detection is weakest
+        (the incoming job itself is dropped if it is the weakest)
+    """
+
+    DROP_POLICIES = ('oldest', 'lowest_confidence')
+
+    def __init__(self, sender, num_workers=UPLOAD_WORKERS, max_size=UPLOAD_QUEUE_SIZE,
+                 drop_policy=UPLOAD_DROP_POLICY, enqueue_timeout=UPLOAD_ENQUEUE_TIMEOUT):
+        if drop_policy not in self.DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {drop_policy} (expected one of {self.DROP_POLICIES})")
+        self.sender = sender
+        self.max_size = max(1, int(max_size))
+        self.drop_policy = drop_policy
+        self.enqueue_timeout = enqueue_timeout
+        self._jobs = deque()
+        self._cond = threading.Condition()
+        self._running = True
+        self._in_flight = 0
+        self._service_time = None  # EWMA of send_detection seconds
+
+        # Counters
+        self.submitted = 0
+        self.dropped = 0
+        self.completed = 0
+        self.failed = 0
+        self.suppressed = 0
+
+        self._workers = []
+        for i in range(max(1, int(num_workers))):
+            worker = threading.Thread(target=self._worker_loop, name=f'upload-worker-{i}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def depth(self):
+        """Number of jobs waiting in the queue (not counting in-flight uploads)"""
+        with self._cond:
+            return len(self._jobs)
+
+    def is_full(self):
+        with self._cond:
+            return len(self._jobs) >= self.max_size
+
+    def free_slots(self):
+        with self._cond:
+            return max(0, self.max_size - len(self._jobs))
+
+    def expected_wait(self):
+        """Estimated seconds until a job enqueued now is picked up and uploaded"""
+        with self._cond:
+            if self._service_time is None:
+                return 0.0
+            return (len(self._jobs) / len(self._workers) + 1) * self._service_time
+
+    def stats(self):
+        with self._cond:
+            return {
+                'depth': len(self._jobs),
+                'in_flight': self._in_flight,
+                'submitted': self.submitted,
+                'dropped': self.dropped,
+                'completed': self.completed,
+                'failed': self.failed,
+                'suppressed': self.suppressed,
+            }
+
+    def put(self, job):
+        """
+        Enqueue a job. Returns the job that was dropped to make room
+        (possibly the new job itself), or None if nothing was dropped.
+        """
+        with self._cond:
+            if not self._running:
+                self.dropped += 1
+                return job
+            if len(self._jobs) >= self.max_size and self.enqueue_timeout > 0:
+                self._cond.wait_for(lambda: len(self._jobs) < self.max_size or not self._running,
+                                    timeout=self.enqueue_timeout)
+
+            dropped = None
+            if len(self._jobs) >= self.max_size:
+                if self.drop_policy == 'oldest':
+                    dropped = self._jobs.popleft()
+                else:
+                    weakest = min(self._jobs, key=lambda j: j.confidence)
+                    if job.confidence <= weakest.confidence:
+                        self.dropped += 1
+                        return job
+                    self._jobs.remove(weakest)
+                    dropped = weakest
+                self.dropped += 1
+
+            self._jobs.append(job)
+            self.submitted += 1
+            self._cond.notify_all()
+            return dropped
+
+    def stop(self, timeout=5.0):
+        """Stop accepting jobs and wait briefly for workers to finish queued uploads"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        deadline = time.time() + timeout
+        for worker in self._workers:
+            worker.join(max(0.0, deadline - time.time()))
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._jobs or not self._running)
+                if not self._jobs:
+                    return
+                job = self._jobs.popleft()
+                self._in_flight += 1
+                self._cond.notify_all()
+
+            ok = False
+            suppressed = False
+            started = time.time()
+            STAGE_SECONDS.observe(started - job.enqueued_at, stage='queue_wait')
+            try:
+                near_duplicates = self.sender.near_duplicates
+                token = near_duplicates.admit(job.frame_raw, job.detections) if near_duplicates else None
+                if near_duplicates and token is None:
+                    suppressed = True
+                    logger.debug("🪞 Skipping near-duplicate frame with %d detection(s)", len(job.detections))
+                else:
+                    with STAGE_SECONDS.time(stage='send_detection'):
+                        ok = self.sender.send_detection(job.frame_with_bbox, job.frame_raw, job.detections)
+                    if not ok and token is not None:
+                        near_duplicates.forget(token)
+            except Exception as e:
+                logger.exception("❌ Upload worker error: %s: %s", type(e).__name__, e)
+            finally:
+                job.done()
+                with self._cond:
+                    self._in_flight -= 1
+                    if suppressed:
+                        self.suppressed += 1
+                    else:
+                        elapsed = time.time() - started
+                        self._service_time = elapsed if self._service_time is None else 0.8 * self._service_time + 0.2 * elapsed
+                        if ok:
+                            self.completed += 1
+                        else:
+                            self.failed += 1
+                if suppressed:
+                    FRAMES_SUPPRESSED.inc(reason='near_duplicate')
+                else:
+                    (FRAMES_UPLOADED if ok else FRAMES_FAILED).inc()
+
+
+class DrainScheduler:
+    """
+    Bounded buffer of synchronized frame groups waiting for the upload queue.
+
+    Each drain() hands over as many groups as the queue has free slots, so the
+    buffer empties as fast as uploads absorb work and put() never blocks the
+    ROS2 executor. Groups older than max_age are dropped, and the oldest group
+    is dropped when more than max_frames are buffered.
+
+    In 'latency' mode the newest groups are sent first and a group is dropped
+    once its age plus the queue's expected wait would exceed target_latency,
+    trading upload rate for freshness on the dashboard.
+
+    Ages count from the hand-off to the scheduler, so the time an impurity
+    track held a frame back to pick its best one is not held against it.
+    """
+
+    MODES = ('throughput', 'latency')
+
+    def __init__(self, upload_queue, release, mode=DRAIN_MODE, max_frames=DRAIN_MAX_FRAMES,
+                 max_age=DRAIN_MAX_AGE_SEC, target_latency=DRAIN_TARGET_LATENCY_SEC):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown drain mode: {mode} (expected one of {self.MODES})")
+        self.upload_queue = upload_queue
+        self.release = release  # release(detections) frees a dropped group's frame-store references
+        self.mode = mode
+        self.max_frames = max(1, int(max_frames))
+        self.max_age = max_age
+        self.target_latency = target_latency
+        self._groups = deque()  # (hand-off time, detections), oldest first
+        self._detections = 0
+        self.dropped_stale = 0
+        self.dropped_overflow = 0
+
+    def __len__(self):
+        return len(self._groups)
+
+    def detection_count(self):
+        return self._detections
+
+    def add(self, detections, now=None):
+        """Buffer one frame's detections"""
+        self._groups.append((time.time() if now is None else now, detections))
+        self._detections += len(detections)
+        while len(self._groups) > self.max_frames:
+            self._drop(self._groups.popleft()[1], 'buffer_full')
+            self.dropped_overflow += 1
+
+    def _drop(self, detections, reason):
+        self._detections -= len(detections)
+        FRAMES_DROPPED.inc(reason=reason)
+        self.release(detections)
+
+    def _cutoff(self):
+        if self.mode == 'latency':
+            return min(self.max_age, max(0.0, self.target_latency - self.upload_queue.expected_wait()))
+        return self.max_age
+
+    def expire(self, now=None):
+        """Drop groups past the age cutoff; returns how many were dropped"""
+        now = time.time() if now is None else now
+        cutoff = self._cutoff()
+        expired = 0
+        while self._groups and now - self._groups[0][0] > cutoff:
+            self._drop(self._groups.popleft()[1], 'stale')
+            expired += 1
+        self.dropped_stale += expired
+        return expired
+
+    def drain(self, now=None):
+        """Expire stale groups, then return the groups the upload queue can take right now"""
+        now = time.time() if now is None else now
+        expired = self.expire(now)
+        cutoff = self._cutoff()
+        ready = []
+        slots = self.upload_queue.free_slots()
+        while self._groups and len(ready) < slots:
+            arrived, detections = self._groups.pop() if self.mode == 'latency' else self._groups.popleft()
+            if now - arrived > cutoff:  # arrived out of order behind fresher groups
+                self._drop(detections, 'stale')
+                self.dropped_stale += 1
+                expired += 1
+                continue
+            self._detections -= len(detections)
+            ready.append(detections)
+        if expired:
+            logger.warning("⚠️ Dropped %d stale frame group(s) from the upload buffer [%s]", expired, self.mode)
+        return ready
+
+
+class DetectionBridgeCore:
+    """
+    Message handling of the detection bridge: synchronization, tracking, buffering
+    and the hand-off to the upload queue. Kept free of ROS2 so recorded topics can
+    be replayed into it without rclpy (benchmarks/bridge_replay.py).
+    
+    image_bridge converts image messages with imgmsg_to_cv2() (CvBridge under ROS2).
+    The callbacks and send_buffered() must not run concurrently.
+    """
+    
+    def __init__(self, sender, image_bridge):
+        self.sender = sender
+        self.bridge = image_bridge
+        self.frame_store = FrameStore()
+        if self.frame_store.max_frames < FRAME_STORE_MIN_FRAMES:
+            logger.warning("⚠️ MOZUKU_FRAME_STORE_MAX_FRAMES=%d is below drain buffer + upload queue + workers (%d); "
+                           "new frames will be dropped while those are full",
+                           self.frame_store.max_frames, FRAME_STORE_MIN_FRAMES)
+        # Pairs raw frames, annotated frames (with bboxes from yolov8_node) and detections by header stamp
+        self.synchronizer = FrameSynchronizer(self.frame_store)
+        self.upload_queue = UploadQueue(sender)
+        self.drain_scheduler = DrainScheduler(self.upload_queue, lambda detections: self._frame_releaser(detections)())
+        self.tracker = ImpurityTracker(
+            self._suppress_frame, policy=TRACK_POLICY, iou_threshold=TRACK_IOU_THRESHOLD,
+            max_distance_px=TRACK_MAX_DISTANCE_PX, max_gap_sec=TRACK_MAX_GAP_SEC, max_track_sec=TRACK_MAX_SEC,
+            mm_per_px=MM_PER_PX, belt_speed_mm_s=BELT_SPEED_MM_S, belt_direction=BELT_DIRECTION
+        )
+        self._was_sending = False
+    
+    def _stamp_ns(self, msg):
+        """Header stamp of a message in nanoseconds, or None if it has no header"""
+        header = getattr(msg, 'header', None)
+        if header is None:
+            return None
+        return int(header.stamp.sec) * 1_000_000_000 + int(header.stamp.nanosec)
+    
+    def _buffer_bundles(self, bundles):
+        """Track synchronized frame bundles (one per frame) and buffer the frames chosen for upload"""
+        for detections in bundles:
+            DETECTIONS_BUFFERED.inc(len(detections))
+            frame_key = detections[0].get('frame_key')
+            stamp = frame_key[0] / 1e9 if frame_key and frame_key[0] is not None else None
+            for frame in self.tracker.update(detections, stamp):
+                self.drain_scheduler.add(frame)
+    
+    def _suppress_frame(self, detections):
+        """Tracker callback for frames whose impurities are uploaded from another frame"""
+        FRAMES_SUPPRESSED.inc(reason='track')
+        self._frame_releaser(detections)()
+    
+    def _register_metrics(self):
+        """Expose bridge/queue state that is kept outside the metrics registry"""
+        queue = self.upload_queue
+        METRICS.gauge('mozuku_detections_buffer_size', 'Detections waiting in the bridge buffer',
+                      self.drain_scheduler.detection_count)
+        METRICS.gauge('mozuku_drain_buffer_frames', 'Frame groups waiting in the drain scheduler',
+                      lambda: len(self.drain_scheduler))
+        METRICS.gauge('mozuku_upload_expected_wait_seconds', 'Estimated wait for a newly enqueued frame',
+                      queue.expected_wait)
+        METRICS.gauge('mozuku_upload_queue_depth', 'Frame jobs waiting for an upload worker', queue.depth)
+        METRICS.gauge('mozuku_upload_in_flight', 'Frame jobs being uploaded', lambda: queue.stats()['in_flight'])
+        METRICS.gauge('mozuku_frame_store_frames', 'Frames held in the frame store',
+                      lambda: self.frame_store.stats()['frames'])
+        METRICS.gauge('mozuku_frame_store_bytes', 'Bytes held in the frame store',
+                      lambda: self.frame_store.stats()['mb'] * 1024 * 1024)
+        METRICS.gauge('mozuku_tracks_active', 'Impurity tracks waiting for their best frame',
+                      self.tracker.active_tracks)
+        METRICS.callback_counter('mozuku_tracks_total', 'Impurity tracks started',
+                                 lambda: self.tracker.tracks_started)
+        METRICS.callback_counter('mozuku_frame_store_refused_total',
+                                 'Frame pairs not stored because the frame store was full',
+                                 lambda: self.frame_store.refused)
+        METRICS.callback_counter('mozuku_sync_bundles_total', 'Frame bundles assembled by the synchronizer',
+                                 lambda: self.synchronizer.bundles)
+        METRICS.callback_counter('mozuku_sync_frames_dropped_total', 'Frames dropped without a matching detection',
+                                 lambda: self.synchronizer.frames_dropped)
+        METRICS.callback_counter('mozuku_sync_detections_dropped_total', 'Detections dropped without matching frames',
+                                 lambda: self.synchronizer.detections_dropped)
+    
+    def camera_callback(self, msg):
+        """Capture camera frame"""
+        try:
+            MESSAGES_RECEIVED.inc(topic='camera')
+            frame = self.bridge.imgmsg_to_cv2(msg, desired_encoding='bgr8')
+            self._buffer_bundles(self.synchronizer.add_raw(self._stamp_ns(msg), frame))
+        except Exception as e:
+            logger.error("Frame conversion error: %s", e)
+    
+    def annotated_image_callback(self, msg):
+        """Capture annotated image from yolov8_node (already has correct bboxes)"""
+        try:
+            MESSAGES_RECEIVED.inc(topic='annotated')
+            annotated = self.bridge.imgmsg_to_cv2(msg, desired_encoding='bgr8')
+            if annotated is not None:
+                self._buffer_bundles(self.synchronizer.add_annotated(self._stamp_ns(msg), annotated))
+                logger.debug("✅ Captured annotated frame: %s", annotated.shape)
+            else:
+                logger.warning("⚠️ Annotated frame conversion returned None")
+        except Exception as e:
+            logger.exception("❌ Annotated image conversion error: %s", e)
+    
+    def detection_callback(self, msg):
+        """Buffer detection data from yolov8_node"""
+        try:
+            MESSAGES_RECEIVED.inc(topic='detections')
+            # Detection2D message from yolov8_node contains:
+            # msg.class_name, msg.score (confidence)
+            # msg.center_x, msg.center_y (pixel coords of center)
+            # msg.width, msg.height (width/height in pixels)
+            
+            label = getattr(msg, 'class_name', 'unknown')
+            confidence = float(getattr(msg, 'confidence', 0.0))
+            
+            # Calculate bbox from center + width/height
+            center_x = float(getattr(msg, 'center_x', 0.0))
+            center_y = float(getattr(msg, 'center_y', 0.0))
+            width = float(getattr(msg, 'width', 0.0))
+            height = float(getattr(msg, 'height', 0.0))
+            
+            # Convert center-based bbox to top-left corner (x1, y1)
+            x1 = int(center_x - width / 2.0)
+            y1 = int(center_y - height / 2.0)
+            
+            bbox_data = {
+                'x': x1,
+                'y': y1,
+                'width': int(width),
+                'height': int(height)
+            }
+            
+            # Detections carry the stamp of the image they were inferred on.
+            # Without a header, fall back to the newest annotated image (previous behaviour).
+            stamp = self._stamp_ns(msg)
+            if stamp is None:
+                stamp = self.synchronizer.newest_annotated_stamp
+            
+            detection = {
+                'label': label,
+                'confidence': confidence,
+                'bbox': bbox_data,
+                'frame_timestamp': time.time()  # arrival time
+            }
+            
+            self._buffer_bundles(self.synchronizer.add_detection(stamp, detection))
+            logger.debug("🎯 Received: %s (%.1f%%) bbox=(%d,%d,%dx%d) stamp=%d",
+                         label, confidence * 100, x1, y1, int(width), int(height), stamp)
+        except Exception as e:
+            logger.exception("Detection processing error: %s", e)
+    
+    def send_buffered(self):
+        """Hand buffered frame groups to the upload worker pool as fast as it can take them"""
+        # Flush bundles whose grace period ran out while no messages arrived,
+        # and frames of tracks that left the camera view
+        self._buffer_bundles(self.synchronizer.poll())
+        for frame in self.tracker.poll():
+            self.drain_scheduler.add(frame)
+        
+        if not sending_enabled:
+            if self._was_sending:
+                # Hand over the best frames tracks were holding; they are sent if sending resumes in time
+                for frame in self.tracker.flush():
+                    self.drain_scheduler.add(frame)
+                self._was_sending = False
+            self.drain_scheduler.expire()
+            return
+        self._was_sending = True
+        
+        enqueued = 0
+        for frame_detections in self.drain_scheduler.drain():
+            # Use synchronized frames referenced by the first detection
+            frame_raw, frame_with_bbox = self.frame_store.get(frame_detections[0].get('frame_key'))
+            release = self._frame_releaser(frame_detections)
+            
+            # Frames are captured with the detection, so a missing one will never show up later
+            if frame_with_bbox is None:
+                logger.warning("⚠️ Missing annotated frame from yolov8 node. Dropping frame group.")
+                FRAMES_DROPPED.inc(reason='missing_frame')
+                release()
+                continue
+            if frame_raw is None:
+                logger.warning("⚠️ Missing raw frame. Dropping frame group.")
+                FRAMES_DROPPED.inc(reason='missing_frame')
+                release()
+                continue
+            
+            dropped = self.upload_queue.put(UploadJob(frame_with_bbox, frame_raw, frame_detections, on_done=release))
+            if dropped is not None:
+                dropped.done()
+                FRAMES_DROPPED.inc(reason='queue_full')
+                logger.warning("⚠️ Upload queue full (%d), dropped frame with %d detection(s) [%s]",
+                               self.upload_queue.max_size, len(dropped.detections), self.upload_queue.drop_policy)
+            enqueued += 1
+        
+        if enqueued and logger.isEnabledFor(logging.DEBUG):
+            stats = self.upload_queue.stats()
+            logger.debug(
+                "📤 send_buffered: enqueued %d frame(s) | queue depth=%d in_flight=%d completed=%d "
+                "failed=%d dropped=%d | frame store=%d frame(s) | sync bundles=%d frames_dropped=%d "
+                "detections_dropped=%d",
+                enqueued, stats['depth'], stats['in_flight'], stats['completed'], stats['failed'],
+                stats['dropped'], self.frame_store.stats()['frames'], self.synchronizer.bundles,
+                self.synchronizer.frames_dropped, self.synchronizer.detections_dropped
+            )
+    
+    def shutdown(self, timeout=5.0):
+        """End all tracks, hand over what is still buffered and wait for the upload workers"""
+        deadline = time.time() + timeout
+        for frame in self.tracker.flush():
+            self.drain_scheduler.add(frame)
+        while sending_enabled and len(self.drain_scheduler) and time.time() < deadline:
+            self.send_buffered()
+            time.sleep(DRAIN_TICK_SEC)
+        self.upload_queue.stop(timeout=max(0.0, deadline - time.time()))
+    
+    def _frame_releaser(self, detections):
+        """Callback releasing every frame-store reference held by a group of detections"""
+        def release():
+            for detection in detections:
+                self.frame_store.release(detection.get('frame_key'))
+        return release
+
 
 if ROS2_AVAILABLE:
-    class ROS2DetectionBridge(Node):
+    class ROS2DetectionBridge(Node, DetectionBridgeCore):
         """ROS2 Node that captures camera frames and detections, sends to AWS"""
         
         def __init__(self, sender):
-            super().__init__('mozuku_detection_bridge')
-            self.sender = sender
-            self.bridge = CvBridge()
-            self.last_frame = None
-            self.last_annotated_frame = None  # Frame with bboxes from yolov8_node
-            self.detections_buffer = []
-            self.send_interval = 2.0
-            self.is_sending = False  # Flag to prevent concurrent sends
+            Node.__init__(self, 'mozuku_detection_bridge')
+            DetectionBridgeCore.__init__(self, sender, CvBridge())
             
             # Subscriptions
             self.camera_sub = self.create_subscription(
@@ -534,197 +2225,105 @@ if ROS2_AVAILABLE:
             )
             # Subscribe to yolov8_node's annotated image (already has correct bboxes)
             self.annotated_image_sub = self.create_subscription(
-                Image, '/yolov8/detections_image', self.annotated_image_callback, 10
+                Image, ANNOTATED_IMAGE_TOPIC, self.annotated_image_callback, 10
             )
             self.detection_sub = self.create_subscription(
                 Detection2D, DETECTIONS_TOPIC, self.detection_callback, 10
             )
-            
-            # Timer to send every 2 seconds
-            self.send_timer = self.create_timer(self.send_interval, self.send_buffered)
-            
+        
+            # Short tick: the drain scheduler only hands over what the upload queue can take
+            self.send_timer = self.create_timer(DRAIN_TICK_SEC, self.send_buffered)
+            self._register_metrics()
+        
             # Log available topics on startup
             import subprocess
             try:
-                self.get_logger().info("📡 Available ROS2 topics:")
+                logger.info("📡 Available ROS2 topics:")
                 result = subprocess.run(['ros2', 'topic', 'list'], capture_output=True, text=True, timeout=5)
                 for line in result.stdout.strip().split('\n'):
-                    self.get_logger().info(f"   {line}")
-            except Exception as e:
-                self.get_logger().warn(f"⚠️ Could not list topics: {str(e)}")
-            
-            self.get_logger().info(f"✅ Listening to {CAMERA_TOPIC}, /yolov8/detections_image, and {DETECTIONS_TOPIC}")
-        
-        def camera_callback(self, msg):
-            """Capture camera frame"""
-            try:
-                self.last_frame = self.bridge.imgmsg_to_cv2(msg, desired_encoding='bgr8')
-            except Exception as e:
-                self.get_logger().error(f"Frame conversion error: {str(e)}")
-        
-        def annotated_image_callback(self, msg):
-            """Capture annotated image from yolov8_node (already has correct bboxes)"""
-            try:
-                annotated = self.bridge.imgmsg_to_cv2(msg, desired_encoding='bgr8')
-                if annotated is not None:
-                    self.last_annotated_frame = annotated
-                    self.get_logger().info(f"✅ Captured annotated frame: {annotated.shape}")
-                else:
-                    self.get_logger().warn("⚠️ Annotated frame conversion returned None")
-            except Exception as e:
-                self.get_logger().error(f"❌ Annotated image conversion error: {str(e)}")
-                import traceback
-                self.get_logger().error(traceback.format_exc())
-        
-        def detection_callback(self, msg):
-            """Buffer detection data from yolov8_node"""
-            try:
-                # Detection2D message from yolov8_node contains:
-                # msg.class_name, msg.score (confidence)
-                # msg.center_x, msg.center_y (pixel coords of center)
-                # msg.width, msg.height (width/height in pixels)
-                
-                label = getattr(msg, 'class_name', 'unknown')
-                confidence = float(getattr(msg, 'confidence', 0.0))
-                
-                # Calculate bbox from center + width/height
-                center_x = float(getattr(msg, 'center_x', 0.0))
-                center_y = float(getattr(msg, 'center_y', 0.0))
-                width = float(getattr(msg, 'width', 0.0))
-                height = float(getattr(msg, 'height', 0.0))
-                
-                # Convert center-based bbox to top-left corner (x1, y1)
-                x1 = int(center_x - width / 2.0)
-                y1 = int(center_y - height / 2.0)
-                
-                bbox_data = {
-                    'x': x1,
-                    'y': y1,
-                    'width': int(width),
-                    'height': int(height)
-                }
-                
-                # Store frame timestamp with detection to group by frame later
-                frame_timestamp = time.time()
-                
-                detection = {
-                    'label': label,
-                    'confidence': confidence,
-                    'bbox': bbox_data,
-                    'frame_with_bbox': self.last_annotated_frame.copy() if self.last_annotated_frame is not None else None,
-                    'frame_raw': self.last_frame.copy() if self.last_frame is not None else None,
-                    'frame_timestamp': frame_timestamp
-                }
-                
-                self.detections_buffer.append(detection)
-                self.get_logger().info(f"🎯 Buffered: {label} ({confidence:.1%}) bbox=({x1},{y1},{int(width)}x{int(height)}) | frame_with_bbox={'✅' if detection['frame_with_bbox'] is not None else '❌'}")
+                    logger.info("   %s", line)
             except Exception as e:
-                self.get_logger().error(f"Detection processing error: {str(e)}")
-                import traceback
-                self.get_logger().error(f"   Details: {traceback.format_exc()}")
+                logger.warning("⚠️ Could not list topics: %s", e)
         
-        def send_buffered(self):
-            """Send buffered detections to AWS in background thread"""
-            global sending_enabled
-            
-            # Prevent concurrent sends - only send if not already sending
-            if self.is_sending:
-                self.get_logger().debug(f"⏳ Already sending, skipping...")
-                return
-            
-            if sending_enabled and len(self.detections_buffer) > 0:
-                # Group detections by frame timestamp (detections from same frame should be sent together)
-                # Use 0.1 second window to group detections from same frame
-                if len(self.detections_buffer) > 0:
-                    first_detection = self.detections_buffer[0]
-                    first_timestamp = first_detection.get('frame_timestamp', time.time())
-                    
-                    # Collect all detections within 0.1 seconds of the first detection
-                    frame_detections = []
-                    remaining_detections = []
-                    
-                    for detection in self.detections_buffer:
-                        det_timestamp = detection.get('frame_timestamp', first_timestamp)
-                        if abs(det_timestamp - first_timestamp) < 0.1:  # Within 100ms
-                            frame_detections.append(detection)
-                        else:
-                            remaining_detections.append(detection)
-                    
-                    # Check if all detections have synchronized frames
-                    # Only send if frames are available (don't wait for last_annotated_frame)
-                    first_detection = frame_detections[0]
-                    frame_with_bbox = first_detection.get('frame_with_bbox')
-                    frame_raw = first_detection.get('frame_raw')
-                    
-                    # Skip sending if annotated frame isn't available
-                    if frame_with_bbox is None:
-                        self.get_logger().warn("⚠️ Missing annotated frame from yolov8 node. Skipping upload.")
-                        return
-                    if frame_raw is None:
-                        self.get_logger().warn("⚠️ Missing raw frame. Skipping upload.")
-                        return
-                    
-                    # Update buffer to only keep detections not being sent
-                    self.detections_buffer = remaining_detections
-                    
-                    self.get_logger().info(f"📤 send_buffered triggered: {len(frame_detections)} detections from same frame")
-                    
-                    # Mark as sending
-                    self.is_sending = True
-                    
-                    def send_with_cleanup():
-                        try:
-                            self.get_logger().info(f"🚀 Uploading frame with {len(frame_detections)} detection(s) to S3...")
-                            
-                            # Use synchronized frames stored with the first detection
-                            first_detection = frame_detections[0]
-                            frame_with_bbox = first_detection.get('frame_with_bbox')
-                            frame_raw = first_detection.get('frame_raw')
-                            
-                            self.sender.send_detection(
-                                frame_with_bbox, 
-                                frame_raw, 
-                                frame_detections  # Send all detections from this frame
-                            )
-                            self.get_logger().info(f"✅ Upload complete")
-                        except Exception as e:
-                            self.get_logger().error(f"❌ Error in send_detection: {str(e)}")
-                            import traceback
-                            self.get_logger().error(f"   Traceback: {traceback.format_exc()}")
-                        finally:
-                            self.is_sending = False
-                    
-                    thread = threading.Thread(target=send_with_cleanup)
-                    thread.daemon = True
-                    thread.start()
+            logger.info("✅ Listening to %s, %s, and %s", CAMERA_TOPIC, ANNOTATED_IMAGE_TOPIC, DETECTIONS_TOPIC)
 
 
-def start_ros2_launch(job_id, command_key, user_id='web-user', model_url=None):
-    """Start ROS2 launch process with dynamic model download"""
+def start_ros2_launch_async(job_id, command_key, user_id='web-user', model_url=None, on_started=None):
+    """
+    Start a ROS2 launch without blocking the job monitor on a model download.
+    The launch happens on a background thread once the prefetched model is ready,
+    unless a stop command for the same launch arrives first.
+    on_started() runs right after a successful launch, on whichever thread made it,
+    so follow-up work (and status writes) for the job happen in order.
+    Returns True if the launch was deferred.
+    """
+    if command_key != 'camera_bringup' or not model_url:
+        if start_ros2_launch(job_id, command_key, user_id, model_url) and on_started is not None:
+            on_started()
+        return False
+    
+    cancel = threading.Event()
+    with pending_launches_lock:
+        previous = pending_launches.get(command_key)
+        if previous is not None:
+            previous.set()  # a newer start supersedes a launch still waiting for its model
+        pending_launches[command_key] = cancel
+    
+    future = model_prefetcher.prefetch(model_url, job_id, user_id)
+    update_job_status(job_id, 'downloading', 'Preparing model...', user_id)
+    
+    def launch_when_ready():
+        try:
+            model_path = future.result()
+        except Exception as e:
+            logger.error("❌ Model prefetch failed: %s", e)
+            model_path = 'best.pt'
+        with pending_launches_lock:
+            if pending_launches.get(command_key) is cancel:
+                del pending_launches[command_key]
+        if cancel.is_set():
+            logger.info("⏹️  %s start cancelled while its model was downloading", command_key)
+            update_job_status(job_id, 'stopped', f'{command_key} start cancelled during model download', user_id)
+            return
+        if start_ros2_launch(job_id, command_key, user_id, model_url, model_path=model_path) and on_started is not None:
+            on_started()
+    
+    threading.Thread(target=launch_when_ready, name=f'launch-{command_key}', daemon=True).start()
+    return True
+
+
+def start_ros2_launch(job_id, command_key, user_id='web-user', model_url=None, model_path=None):
+    """
+    Start ROS2 launch process with dynamic model download (skipped if model_path is given).
+    Returns True if the process is running afterwards (started now or already running).
+    """
     global ros2_processes, current_job_id
     
     current_job_id = job_id
     command_template = ROS2_LAUNCH_COMMANDS.get(command_key)
     
     if not command_template:
-        print(f"❌ Unknown command: {command_key}")
+        logger.error("❌ Unknown command: %s", command_key)
         update_job_status(job_id, 'failed', 'Unknown command', user_id)
-        return
+        return False
     
     try:
         # Prevent duplicate launches
         existing = ros2_processes.get(command_key)
         if existing:
             if existing.poll() is None:
-                print(f"⚠️  {command_key} already running (PID: {existing.pid}) - skipping start")
+                logger.warning("⚠️  %s already running (PID: %d) - skipping start", command_key, existing.pid)
                 update_job_status(job_id, 'running', f'{command_key} already running', user_id)
-                return
+                return True
             else:
                 del ros2_processes[command_key]
+                release_launch_model(command_key)
 
         # Download model from S3 if URL provided
-        if command_key == 'camera_bringup' and model_url:
-            print(f"🔄 Preparing model...")
+        if model_path:
+            pass
+        elif command_key == 'camera_bringup' and model_url:
+            logger.info("🔄 Preparing model...")
             model_path = download_model_from_s3(model_url)
         else:
             # Fall back to cached local model if available
@@ -736,60 +2335,90 @@ def start_ros2_launch(job_id, command_key, user_id='web-user', model_url=None):
             else:
                 model_path = 'best.pt'  # Default fallback
         
+        # Keep the cache from evicting the model while the launch uses it
+        pinned = model_cache.pin(model_path)
+        if not pinned and model_url and model_cache.owns(model_path):
+            logger.warning("⚠️ Cached model %s was evicted before launch - fetching it again", model_path)
+            model_path = download_model_from_s3(model_url)
+            pinned = model_cache.pin(model_path)
+        
         # Inject model path into command
         command = command_template.format(model_path=model_path)
         
-        print(f"🚀 Starting: {command}")
-        print(f"📋 ROS2 Launch Logs:")
-        print("=" * 80)
+        logger.info("🚀 Starting: %s", command)
+        logger.info("📋 ROS2 Launch Logs:")
+        logger.info("=" * 80)
         
         # Start process with output visible in real-time
-        process = subprocess.Popen(
-            command,
-            shell=True,
-            stdout=None,           # Show output directly to console
-            stderr=subprocess.STDOUT,  # Combine stderr with stdout
-            preexec_fn=os.setsid
-        )
+        try:
+            process = subprocess.Popen(
+                command,
+                shell=True,
+                stdout=None,           # Show output directly to console
+                stderr=subprocess.STDOUT,  # Combine stderr with stdout
+                preexec_fn=os.setsid
+            )
+        except Exception:
+            if pinned:
+                model_cache.unpin(model_path)
+            raise
         ros2_processes[command_key] = process
+        if pinned:
+            launch_models[command_key] = model_path
         update_job_status(job_id, 'running', f'Started {command_key}', user_id)
-        print("=" * 80)
-        print(f"✅ {command_key} started (PID: {process.pid})")
-        print(f"   • Model: {model_path}")
-        print(f"   • Check logs above for any errors")
-        print(f"   • Use 'ros2 topic list' to verify topics are publishing\n")
+        logger.info("=" * 80)
+        logger.info("✅ %s started (PID: %d)", command_key, process.pid)
+        logger.info("   • Model: %s", model_path)
+        logger.info("   • Check logs above for any errors")
+        logger.info("   • Use 'ros2 topic list' to verify topics are publishing")
+        return True
     except Exception as e:
-        print(f"❌ Failed to start {command_key}: {str(e)}")
+        logger.error("❌ Failed to start %s: %s", command_key, e)
         update_job_status(job_id, 'failed', str(e), user_id)
+        return False
+
+
+def release_launch_model(command_key):
+    """Let the model cache evict the model of a launch that is no longer running"""
+    model_path = launch_models.pop(command_key, None)
+    if model_path:
+        model_cache.unpin(model_path)
 
 
 def stop_ros2_launch(job_id, command_key, user_id='web-user'):
     """Stop ROS2 launch process"""
     global ros2_processes
     
+    # Cancel a start that is still waiting for its model download
+    with pending_launches_lock:
+        pending = pending_launches.pop(command_key, None)
+    if pending is not None:
+        pending.set()
+    
     try:
         if command_key in ros2_processes:
             process = ros2_processes[command_key]
-            print(f"\n⏹️  Stopping {command_key} (PID: {process.pid})...")
+            logger.info("⏹️  Stopping %s (PID: %d)...", command_key, process.pid)
             
             # Send SIGTERM to the entire process group
             os.killpg(os.getpgid(process.pid), signal.SIGTERM)
             try:
                 process.wait(timeout=5)
-                print(f"✅ {command_key} stopped gracefully")
+                logger.info("✅ %s stopped gracefully", command_key)
             except subprocess.TimeoutExpired:
-                print(f"⚠️  {command_key} did not stop, forcing kill...")
+                logger.warning("⚠️  %s did not stop, forcing kill...", command_key)
                 os.killpg(os.getpgid(process.pid), signal.SIGKILL)
-                print(f"✅ {command_key} killed forcefully")
+                logger.info("✅ %s killed forcefully", command_key)
             
             del ros2_processes[command_key]
+            release_launch_model(command_key)
             update_job_status(job_id, 'stopped', f'Stopped {command_key}', user_id)
-            print(f"✅ {command_key} stopped\n")
+            logger.info("✅ %s stopped", command_key)
         else:
-            print(f"ℹ️  {command_key} not running")
+            logger.info("ℹ️  %s not running", command_key)
             update_job_status(job_id, 'stopped', f'{command_key} was not running', user_id)
     except Exception as e:
-        print(f"❌ Error stopping {command_key}: {str(e)}")
+        logger.error("❌ Error stopping %s: %s", command_key, e)
         update_job_status(job_id, 'error', str(e), user_id)
 
 
@@ -810,32 +2439,127 @@ def update_job_status(job_id, status, message, user_id='web-user'):
                 ':timestamp': int(datetime.now().timestamp() * 1000)
             }
         )
-        print(f"📝 Job {job_id}: {status} - {message}")
+        logger.info("📝 Job %s: %s - %s", job_id, status, message)
     except Exception as e:
-        print(f"❌ Failed to update job status: {str(e)}")
+        logger.error("❌ Failed to update job status: %s", e)
 
 
-def check_jobs():
-    """Monitor DynamoDB for job commands"""
+class RecentJobIds:
+    """Insertion-ordered set of job IDs that forgets the oldest beyond max_size"""
+
+    def __init__(self, max_size=JOBS_PROCESSED_MAX):
+        self.max_size = max(1, int(max_size))
+        self._ids = OrderedDict()
+
+    def __contains__(self, job_id):
+        return job_id in self._ids
+
+    def add(self, job_id):
+        self._ids[job_id] = True
+        self._ids.move_to_end(job_id)
+        while len(self._ids) > self.max_size:
+            self._ids.popitem(last=False)
+
+    def __len__(self):
+        return len(self._ids)
+
+
+_jobs_index_available = True
+
+
+def _job_sort_key(item):
+    """Jobs are processed oldest first; items without a numeric timestamp go first"""
+    try:
+        return int(item.get('timestamp', 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def fetch_pending_jobs():
+    """
+    Return every pending job, oldest first.
+
+    Queries the status GSI (JOBS_STATUS_INDEX) so only pending items are read,
+    following LastEvaluatedKey until the result is complete. If the index does
+    not exist, falls back (once, with a warning) to a fully paginated filtered scan.
+    """
+    global _jobs_index_available
+    
+    if _jobs_index_available:
+        try:
+            items = []
+            kwargs = {
+                'IndexName': JOBS_STATUS_INDEX,
+                'KeyConditionExpression': '#s = :pending',
+                'ExpressionAttributeNames': {'#s': 'status'},
+                'ExpressionAttributeValues': {':pending': 'pending'},
+            }
+            while True:
+                response = launch_jobs_table.query(**kwargs)
+                items.extend(response.get('Items', []))
+                if 'LastEvaluatedKey' not in response:
+                    break
+                kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+            items.sort(key=_job_sort_key)
+            return items
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'ValidationException':
+                raise
+            _jobs_index_available = False
+            logger.warning("⚠️ Index %s not found on %s - falling back to a paginated scan. "
+                           "Create a GSI on status (+ timestamp) to avoid full-table reads.",
+                           JOBS_STATUS_INDEX, launch_jobs_table.name)
+    
+    items = []
+    kwargs = {
+        'FilterExpression': '#s = :pending',
+        'ExpressionAttributeNames': {'#s': 'status'},
+        'ExpressionAttributeValues': {':pending': 'pending'},
+    }
+    while True:
+        response = launch_jobs_table.scan(**kwargs)
+        items.extend(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    items.sort(key=_job_sort_key)
+    return items
+
+
+def set_sending_enabled(enabled):
     global sending_enabled
+    sending_enabled = enabled
+
+
+def start_all_nodes(job_id, user_id='web-user'):
+    """Second half of start_all, run once camera_bringup is up (possibly after its model download)"""
+    time.sleep(2)
+    if start_ros2_launch(job_id, 'sdm_bridge', user_id):
+        set_sending_enabled(True)
+        update_job_status(job_id, 'running', 'All ROS2 nodes started', user_id)
+
+
+def check_jobs():
+    """Monitor DynamoDB for job commands, polling faster right after a command and backing off when idle"""
     
-    print("\n📊 Job Monitor Started - Checking DynamoDB every 5 seconds...")
-    print("=" * 60)
+    logger.info("📊 Job Monitor Started - Checking DynamoDB every %.0f-%.0f seconds...",
+                JOBS_POLL_MIN_SEC, JOBS_POLL_MAX_SEC)
+    logger.info("=" * 60)
     
-    processed_jobs = set()  # Track which jobs we've already processed
+    processed_jobs = RecentJobIds()  # Track which jobs we've already processed
+    poll_interval = JOBS_POLL_MIN_SEC
     
     while True:
         try:
-            response = launch_jobs_table.scan(
-                FilterExpression='#s = :pending',
-                ExpressionAttributeNames={'#s': 'status'},
-                ExpressionAttributeValues={':pending': 'pending'}
-            )
-            
-            items = response.get('Items', [])
+            items = [item for item in fetch_pending_jobs() if item.get('jobId') not in processed_jobs]
             
             if items:
-                print(f"\n⏰ [{datetime.now().strftime('%H:%M:%S')}] Found {len(items)} pending job(s)")
+                logger.info("⏰ Found %d pending job(s)", len(items))
+            
+            # Start model downloads right away, before working through the jobs in order
+            for item in items:
+                if item.get('modelUrl') and item.get('command') in ('start_camera_bringup', 'start_all'):
+                    model_prefetcher.prefetch(item['modelUrl'], item.get('jobId'), item.get('userId', 'web-user'))
             
             for item in items:
                 job_id = item.get('jobId')
@@ -849,113 +2573,197 @@ def check_jobs():
                     
                 processed_jobs.add(job_id)
                 
-                print(f"\n🎯 Processing job {job_id}")
-                print(f"   Command: {command}")
-                print(f"   User: {user_id}")
+                logger.info("🎯 Processing job %s", job_id)
+                logger.info("   Command: %s", command)
+                logger.info("   User: %s", user_id)
                 if model_url:
-                    print(f"   Model URL: {model_url}")
+                    logger.info("   Model URL: %s", model_url)
                 
                 if command == 'start_camera_bringup':
-                    start_ros2_launch(job_id, 'camera_bringup', user_id, model_url)
-                    sending_enabled = True
+                    start_ros2_launch_async(job_id, 'camera_bringup', user_id, model_url,
+                                            on_started=lambda: set_sending_enabled(True))
                     
                 elif command == 'start_sdm_bridge':
                     start_ros2_launch(job_id, 'sdm_bridge', user_id, model_url)
                     
                 elif command == 'stop_camera_bringup':
                     stop_ros2_launch(job_id, 'camera_bringup', user_id)
-                    sending_enabled = False
+                    set_sending_enabled(False)
                     
                 elif command == 'stop_sdm_bridge':
                     stop_ros2_launch(job_id, 'sdm_bridge', user_id)
                     
                 elif command == 'start_all':
-                    start_ros2_launch(job_id, 'camera_bringup', user_id, model_url)
-                    time.sleep(2)
-                    start_ros2_launch(job_id, 'sdm_bridge', user_id, model_url)
-                    sending_enabled = True
-                    update_job_status(job_id, 'running', 'All ROS2 nodes started', user_id)
+                    # sdm_bridge follows the camera, so a deferred camera start never sees
+                    # its job status go from running back to downloading
+                    start_ros2_launch_async(job_id, 'camera_bringup', user_id, model_url,
+                                            on_started=lambda job_id=job_id, user_id=user_id:
+                                            start_all_nodes(job_id, user_id))
                     
                 elif command == 'stop_all':
                     stop_ros2_launch(job_id, 'camera_bringup', user_id)
                     stop_ros2_launch(job_id, 'sdm_bridge', user_id)
-                    sending_enabled = False
+                    set_sending_enabled(False)
                     update_job_status(job_id, 'stopped', 'All ROS2 nodes stopped', user_id)
             
-            time.sleep(5)  # Check every 5 seconds
+            # Commands tend to come in bursts (start, then stop a little later)
+            if items:
+                poll_interval = JOBS_POLL_MIN_SEC
+            else:
+                poll_interval = min(JOBS_POLL_MAX_SEC, poll_interval * JOBS_POLL_BACKOFF)
+            time.sleep(poll_interval)
             
         except Exception as e:
-            print(f"⚠️ Job monitor error: {str(e)}")
+            logger.warning("⚠️ Job monitor error: %s", e)
             time.sleep(10)
 
 
+def _format_quantiles(stage):
+    p50 = STAGE_SECONDS.quantile(0.5, stage=stage)
+    p99 = STAGE_SECONDS.quantile(0.99, stage=stage)
+    if p50 is None:
+        return '-'
+    return f"{p50 * 1000:.0f}/{p99 * 1000:.0f}ms"
+
+
+def _make_metrics_summary():
+    """Build the periodic one-line summary, with upload rate since the previous line"""
+    last = {'uploaded': 0}
+
+    def summary(elapsed):
+        uploaded = FRAMES_UPLOADED.value()
+        rate = (uploaded - last['uploaded']) / elapsed if elapsed > 0 else 0.0
+        last['uploaded'] = uploaded
+        queue_depth = METRICS.get('mozuku_upload_queue_depth')
+        return (
+            f"📈 rx camera={MESSAGES_RECEIVED.value(topic='camera')} "
+            f"detections={MESSAGES_RECEIVED.value(topic='detections')} | "
+            f"uploaded={uploaded} ({rate:.2f}/s) failed={FRAMES_FAILED.value()} "
+            f"dropped={FRAMES_DROPPED.value()} suppressed={FRAMES_SUPPRESSED.value()} queue={queue_depth.value() if queue_depth else 0:.0f} | "
+            f"p50/p99 send={_format_quantiles('send_detection')} encode={_format_quantiles('encode')} "
+            f"s3={_format_quantiles('s3_put')} ddb={_format_quantiles('dynamodb_put')} | "
+            f"sent={BYTES_SENT.value() / (1024 * 1024):.1f}MB"
+        )
+    return summary
+
+
+def start_metrics():
+    """Start the /metrics endpoint and the periodic summary line, as configured"""
+    if METRICS_PORT > 0:
+        try:
+            METRICS.start_http_server(METRICS_PORT)
+        except OSError as e:
+            logger.warning("⚠️ Could not start metrics endpoint on port %d: %s", METRICS_PORT, e)
+    if METRICS_SUMMARY_SEC > 0:
+        METRICS.start_summary_logger(METRICS_SUMMARY_SEC, _make_metrics_summary())
+
+
 def run_ros2():
     """Run ROS2 with job monitoring (temp: demo mode for now)"""
-    print("\n🎬 ROS2 MODE - Monitoring DynamoDB for commands\n")
+    logger.info("🎬 ROS2 MODE - Monitoring DynamoDB for commands")
     
     # Initialize ROS2
     rclpy.init()
     
     # Create sender instance
     sender = DetectionSender()
+    start_metrics()
+    prefetch_registered_models()
+    
+    # Create the ROS2 detection bridge node and spin it in a background thread
+    bridge_node = None
+    executor = MultiThreadedExecutor()
+    try:
+        bridge_node = ROS2DetectionBridge(sender)
+        executor.add_node(bridge_node)
+    except Exception as e:
+        logger.exception("❌ ROS2 Node Error: %s", e)
     
-    # Create and spin ROS2 detection bridge node in background thread
     def spin_ros2_node():
         try:
-            bridge_node = ROS2DetectionBridge(sender)
-            executor = MultiThreadedExecutor()
-            executor.add_node(bridge_node)
-            print("✅ ROS2 Detection Bridge initialized - listening for detections\n")
+            logger.info("✅ ROS2 Detection Bridge initialized - listening for detections")
             executor.spin()
         except Exception as e:
-            print(f"❌ ROS2 Node Error: {str(e)}")
-        finally:
-            try:
-                bridge_node.destroy_node()
-            except:
-                pass
+            if rclpy.ok():
+                logger.exception("❌ ROS2 Node Error: %s", e)
     
-    ros2_thread = threading.Thread(target=spin_ros2_node, daemon=True)
-    ros2_thread.start()
+    ros2_thread = None
+    if bridge_node is not None:
+        ros2_thread = threading.Thread(target=spin_ros2_node, daemon=True)
+        ros2_thread.start()
     
     # Start job monitor (this is the important part!)
     monitor_thread = threading.Thread(target=check_jobs, daemon=True)
     monitor_thread.start()
     
-    print("✅ Job monitor started - waiting for commands from dashboard...")
-    print("   Click buttons on website to start/stop ROS2 processes\n")
+    logger.info("✅ Job monitor started - waiting for commands from dashboard...")
+    logger.info("   Click buttons on website to start/stop ROS2 processes")
     
     # Keep script running and listening
     try:
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
-        print("\n⏹️ Shutting down...")
+        logger.info("⏹️ Shutting down...")
         for key in list(ros2_processes.keys()):
             try:
                 os.killpg(os.getpgid(ros2_processes[key].pid), signal.SIGTERM)
             except:
                 pass
-        rclpy.shutdown()
+    finally:
+        # Stop the executor first so no callback runs while the bridge hands over what it buffers
+        if rclpy.ok():
+            rclpy.shutdown()
+        if ros2_thread is not None:
+            ros2_thread.join(SHUTDOWN_TIMEOUT_SEC)
+            if ros2_thread.is_alive():
+                logger.warning("⚠️ ROS2 executor did not stop within %.0fs", SHUTDOWN_TIMEOUT_SEC)
+        shutdown_pipeline(sender, bridge_node)
+        if bridge_node is not None:
+            bridge_node.destroy_node()
+
+
+def shutdown_pipeline(sender, bridge=None, timeout=SHUTDOWN_TIMEOUT_SEC):
+    """
+    Flush and stop everything that still holds detections: the bridge's tracks,
+    buffer and upload queue, then open batches, session aggregates, the spool
+    and the encoder processes.
+    """
+    steps = []
+    if bridge is not None:
+        steps.append(('bridge', lambda: bridge.shutdown(timeout=timeout)))
+    if sender.batcher is not None:
+        steps.append(('batcher', sender.batcher.stop))
+    if sender.session_stats is not None:
+        steps.append(('session stats', sender.session_stats.stop))
+    if sender.spool is not None:
+        steps.append(('spool', sender.spool.stop))
+    steps.append(('encoder', sender.encoder.shutdown))
+    for name, step in steps:
+        try:
+            step()
+        except Exception as e:
+            logger.warning("⚠️ Could not stop %s cleanly: %s", name, e)
 
 
 def run_demo():
     """Demo mode - test without ROS2"""
-    print("\n🎬 DEMO MODE - Monitoring DynamoDB for commands\n")
+    logger.info("🎬 DEMO MODE - Monitoring DynamoDB for commands")
+    prefetch_registered_models()
     
     # Start job monitor (this is the important part!)
     monitor_thread = threading.Thread(target=check_jobs, daemon=True)
     monitor_thread.start()
     
-    print("✅ Waiting for DynamoDB commands from dashboard...")
-    print("   Click 'Start Camera' button on website to test\n")
+    logger.info("✅ Waiting for DynamoDB commands from dashboard...")
+    logger.info("   Click 'Start Camera' button on website to test")
     
     # Keep script running and listening
     try:
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
-        print("\n⏹️ Shutting down...")
+        logger.info("⏹️ Shutting down...")
         for key in list(ros2_processes.keys()):
             try:
                 os.killpg(os.getpgid(ros2_processes[key].pid), signal.SIGTERM)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Minimal in-process metrics for mozuku_detection_sender.py
+
+Counters, latency histograms and callback gauges with Prometheus text-format
+export over a local HTTP endpoint, plus a one-line periodic summary for the log.
+Updating a metric is a dict lookup and an add under a lock, cheap enough to
+leave on in the ROS2 callbacks. No prometheus_client dependency.
+"""
+
+import bisect
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger('mozuku_sender.metrics')
+
+# Seconds; covers encode (ms) through slow S3 PUTs over a bad uplink (10s)
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + (list(extra) if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def value(self, **labels):
+        """Value for one label set, or the sum over all label sets if none given"""
+        with self._lock:
+            if labels:
+                return self._values.get(_label_key(labels), 0)
+            return sum(self._values.values())
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, help_text, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._data = {}  # label key -> [bucket counts..., +Inf count], sum
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                entry = self._data[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][idx] += 1
+            entry[1] += value
+
+    def time(self, **labels):
+        """Context manager observing the elapsed wall time of its block"""
+        return _Timer(self, labels)
+
+    def quantile(self, q, **labels):
+        """Approximate quantile from bucket counts (linear within a bucket)"""
+        with self._lock:
+            entry = self._data.get(_label_key(labels))
+            if entry is None:
+                return None
+            counts = list(entry[0])
+        total = sum(counts)
+        if total == 0:
+            return None
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * ((rank - seen) / count)
+            seen += count
+        return self.buckets[-1]
+
+    def samples(self):
+        out = []
+        with self._lock:
+            items = [(key, list(entry[0]), entry[1]) for key, entry in self._data.items()]
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                out.append((f'{self.name}_bucket', key + (('le', repr(bound)),), cumulative))
+            cumulative += counts[-1]
+            out.append((f'{self.name}_bucket', key + (('le', '+Inf'),), cumulative))
+            out.append((f'{self.name}_sum', key, total))
+            out.append((f'{self.name}_count', key, cumulative))
+        return out
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class CallbackMetric:
+    """Value read from a callable at scrape time (queue depth, counters kept elsewhere...)"""
+
+    def __init__(self, name, help_text, fn, metric_type='gauge'):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        self.type = metric_type
+
+    def value(self):
+        try:
+            return float(self.fn())
+        except Exception:
+            return float('nan')
+
+    def samples(self):
+        return [(self.name, (), self.value())]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def _register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text):
+        return self._register(Counter(name, help_text))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, buckets))
+
+    def gauge(self, name, help_text, fn):
+        """Register (or replace) a gauge backed by fn()"""
+        return self._register(CallbackMetric(name, help_text, fn))
+
+    def callback_counter(self, name, help_text, fn):
+        """Register (or replace) a monotonic counter maintained elsewhere"""
+        return self._register(CallbackMetric(name, help_text, fn, metric_type='counter'))
+
+    def get(self, name):
+        with self._lock:
+            return self._metrics.get(name)
+
+    def render(self):
+        """Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, key, value in metric.samples():
+                lines.append(f'{name}{_format_labels(key)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def start_http_server(self, port, host='127.0.0.1'):
+        """Serve /metrics on a daemon thread"""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='metrics-http', daemon=True).start()
+        logger.info("📈 Metrics available at http://%s:%d/metrics", host, port)
+        return self._server
+
+    def start_summary_logger(self, interval, summary_fn):
+        """Log summary_fn(elapsed_seconds) every interval seconds"""
+        def loop():
+            last = time.time()
+            while True:
+                time.sleep(interval)
+                now = time.time()
+                try:
+                    logger.info("%s", summary_fn(now - last))
+                except Exception as e:
+                    logger.warning("⚠️ Metrics summary failed: %s", e)
+                last = now
+
+        threading.Thread(target=loop, name='metrics-summary', daemon=True).start()
@@ -0,0 +1,16 @@
+"""
+Shared setup for the local-machine tests
+
+Run from the repository root or local-machine/:
+    python3 -m pytest local-machine/tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Keep the sender from starting a spool, encoder processes or stats thread just to be tested
+os.environ.setdefault('MOZUKU_SPOOL_ENABLED', 'false')
+os.environ.setdefault('MOZUKU_ENCODE_PROCESSES', '0')
+os.environ.setdefault('MOZUKU_SESSION_STATS_ENABLED', 'false')
+os.environ.setdefault('MOZUKU_LOG_LEVEL', 'ERROR')
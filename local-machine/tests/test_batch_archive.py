@@ -0,0 +1,78 @@
+"""
+Round trip of the batch archive format: BatchArchive -> read_index -> parse_member_url
+"""
+import pytest
+
+from batch_archive import BatchArchive, TRAILER, member_url, parse_member_url, read_index
+
+ARCHIVE_URL = 's3://mozuku-frames/web-user/batches/1700000000000-abcd1234.mzb'
+MEMBERS = [
+    ('web-user/2023/11/14/f1/frame-with-bbox.jpg', b'\xff\xd8with' * 50, 'image/jpeg'),
+    ('web-user/2023/11/14/f1/frame-no-bbox.jpg', b'\xff\xd8without' * 40, 'image/jpeg'),
+    ('web-user/2023/11/14/f1/frame-no-bbox.txt', b'0 0.500000 0.500000 0.100000 0.100000', 'text/plain'),
+    ('web-user/2023/11/14/f1/cropped_impurity_0.jpg', b'\xff\xd8crop', 'image/jpeg'),
+    ('web-user/2023/11/14/f2/empty.txt', b'', 'text/plain'),
+]
+
+
+def ranged_get(data, byte_range):
+    """What S3 returns for a GET of data with an HTTP Range header"""
+    first, last = (int(v) for v in byte_range[len('bytes='):].split('-'))
+    return data[first:last + 1]
+
+
+@pytest.fixture
+def archive():
+    archive = BatchArchive()
+    ranges = [archive.add(name, body, content_type) for name, body, content_type in MEMBERS]
+    return archive, ranges
+
+
+def test_members_round_trip_through_member_urls(archive):
+    archive, ranges = archive
+    data = archive.to_bytes()
+    for (name, body, _), (offset, length) in zip(MEMBERS, ranges):
+        if not length:
+            continue  # an empty member has no byte range to reference
+        url, byte_range = parse_member_url(member_url(ARCHIVE_URL, offset, length))
+        assert url == ARCHIVE_URL
+        assert ranged_get(data, byte_range) == body
+
+
+def test_index_lists_every_member(archive):
+    archive, ranges = archive
+    data = archive.to_bytes()
+    index = read_index(data)
+    assert [(m['name'], m['contentType']) for m in index] == [(name, ct) for name, _, ct in MEMBERS]
+    assert [(m['offset'], m['length']) for m in index] == ranges
+    for member, (_, body, _) in zip(index, MEMBERS):
+        assert data[member['offset']:member['offset'] + member['length']] == body
+    assert len(archive) == len(MEMBERS)
+
+
+def test_index_and_member_urls_agree(archive):
+    archive, _ = archive
+    data = archive.to_bytes()
+    for member in read_index(data):
+        if member['length']:
+            _, byte_range = parse_member_url(member_url(ARCHIVE_URL, member['offset'], member['length']))
+            assert len(ranged_get(data, byte_range)) == member['length']
+
+
+def test_read_index_from_archive_tail(archive):
+    archive, _ = archive
+    data = archive.to_bytes()
+    index_len, _ = TRAILER.unpack(data[-TRAILER.size:])
+    assert read_index(data[-(TRAILER.size + index_len):]) == read_index(data)
+    with pytest.raises(ValueError, match='Need the last'):
+        read_index(data[-(TRAILER.size + index_len - 1):])
+
+
+def test_plain_urls_have_no_range():
+    assert parse_member_url('s3://bucket/key.jpg') == ('s3://bucket/key.jpg', None)
+
+
+@pytest.mark.parametrize('data', [b'', b'short', b'x' * 64])
+def test_read_index_rejects_other_data(data):
+    with pytest.raises(ValueError, match='Not a batch archive'):
+        read_index(data)
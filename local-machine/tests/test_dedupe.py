@@ -0,0 +1,107 @@
+"""
+Parity of the pure-Python and NumPy NMS in DetectionSender.dedupe_detections
+"""
+import random
+
+import pytest
+
+from mozuku_detection_sender import DetectionSender, DEDUPE_NUMPY_MIN_BOXES
+
+THRESHOLDS = [0.3, 0.5, 0.7, 0.9]
+
+
+@pytest.fixture(scope='module')
+def sender():
+    return DetectionSender()
+
+
+def detection(x, y, width, height, confidence):
+    return {'label': 'impurity', 'confidence': confidence,
+            'bbox': {'x': x, 'y': y, 'width': width, 'height': height}}
+
+
+def make_detections(count, rng, frame_w=1920, frame_h=1080):
+    """Random detections clustered around a few impurities, with coarse confidences and some empty boxes"""
+    centers = [(rng.uniform(0, frame_w), rng.uniform(0, frame_h)) for _ in range(max(1, count // 5))]
+    detections = []
+    for _ in range(count):
+        cx, cy = rng.choice(centers)
+        width, height = rng.randint(0, 120), rng.randint(0, 120)
+        detections.append(detection(int(cx + rng.gauss(0, 8) - width / 2), int(cy + rng.gauss(0, 8) - height / 2),
+                                    width, height, round(rng.uniform(0.25, 1.0), 1)))
+    return detections
+
+
+def kept_ids(detections):
+    return [id(d) for d in detections]
+
+
+@pytest.mark.parametrize('threshold', THRESHOLDS)
+def test_random_sets_match(sender, threshold):
+    rng = random.Random(threshold)
+    for _ in range(100):
+        detections = make_detections(rng.randint(0, 200), rng)
+        expected = sender.dedupe_detections_python(detections, threshold)
+        assert kept_ids(sender.dedupe_detections_numpy(detections, threshold)) == kept_ids(expected)
+
+
+@pytest.mark.parametrize('threshold', THRESHOLDS)
+@pytest.mark.parametrize('count', [DEDUPE_NUMPY_MIN_BOXES - 1, DEDUPE_NUMPY_MIN_BOXES, DEDUPE_NUMPY_MIN_BOXES + 1])
+def test_dispatch_boundary_matches(sender, count, threshold):
+    detections = make_detections(count, random.Random(count))
+    expected = sender.dedupe_detections_python(detections, threshold)
+    assert kept_ids(sender.dedupe_detections(detections, threshold)) == kept_ids(expected)
+
+
+@pytest.mark.parametrize('count, implementation', [
+    (DEDUPE_NUMPY_MIN_BOXES - 1, 'python'),
+    (DEDUPE_NUMPY_MIN_BOXES, 'numpy'),
+])
+def test_dispatch_picks_implementation(sender, monkeypatch, count, implementation):
+    called = []
+    for name in ('python', 'numpy'):
+        monkeypatch.setattr(sender, f'dedupe_detections_{name}',
+                            lambda detections, iou_threshold=0.7, name=name: called.append(name) or [])
+    sender.dedupe_detections(make_detections(count, random.Random(0)))
+    assert called == [implementation]
+
+
+@pytest.mark.parametrize('threshold', THRESHOLDS)
+@pytest.mark.parametrize('count', [2, DEDUPE_NUMPY_MIN_BOXES + 4])
+def test_ties_keep_the_first_detection(sender, count, threshold):
+    # Identical boxes with equal confidence: both implementations keep the earliest one only
+    detections = [detection(10, 10, 50, 50, 0.8) for _ in range(count)]
+    for dedupe in (sender.dedupe_detections_python, sender.dedupe_detections_numpy, sender.dedupe_detections):
+        assert kept_ids(dedupe(detections, threshold)) == [id(detections[0])]
+
+
+@pytest.mark.parametrize('threshold', THRESHOLDS)
+def test_ties_between_separate_boxes_keep_input_order(sender, threshold):
+    detections = [detection(i * 100, 0, 50, 50, 0.5) for i in range(DEDUPE_NUMPY_MIN_BOXES + 2)]
+    expected = kept_ids(detections)
+    assert kept_ids(sender.dedupe_detections_python(detections, threshold)) == expected
+    assert kept_ids(sender.dedupe_detections_numpy(detections, threshold)) == expected
+
+
+@pytest.mark.parametrize('threshold', THRESHOLDS)
+def test_zero_area_boxes_are_dropped(sender, threshold):
+    empty = [detection(10, 10, 0, 50, 0.9), detection(10, 10, 50, 0, 0.9), detection(10, 10, 0, 0, 0.9),
+             detection(10, 10, -5, 50, 0.9)]
+    box = detection(10, 10, 50, 50, 0.5)
+    for detections in (empty + [box], (empty * DEDUPE_NUMPY_MIN_BOXES) + [box]):
+        for dedupe in (sender.dedupe_detections_python, sender.dedupe_detections_numpy, sender.dedupe_detections):
+            assert kept_ids(dedupe(detections, threshold)) == [id(box)]
+    assert sender.dedupe_detections_numpy(empty, threshold) == []
+    assert sender.dedupe_detections_python(empty, threshold) == []
+
+
+def test_threshold_is_inclusive(sender):
+    # IoU of exactly 0.5 suppresses at threshold 0.5 and not above it
+    detections = [detection(0, 0, 100, 100, 0.9), detection(0, 0, 100, 50, 0.8)]
+    for dedupe in (sender.dedupe_detections_python, sender.dedupe_detections_numpy):
+        assert kept_ids(dedupe(detections, 0.5)) == [id(detections[0])]
+        assert kept_ids(dedupe(detections, 0.7)) == kept_ids(detections)
+
+
+def test_empty_input(sender):
+    assert sender.dedupe_detections([]) == []
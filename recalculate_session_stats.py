@@ -1,134 +1,456 @@
 #!/usr/bin/env python3
 """
 Recalculate statistics for existing sessions based on actual frame data
+
+Progress is checkpointed to a JSON file, so an interrupted run resumes where it
+stopped: the frame scan continues from the saved per-segment positions with the
+totals accumulated so far, and sessions already updated are skipped. With
+--incremental (or --since) only sessions that can have changed are recomputed:
+open sessions, sessions new since the last run, sessions whose time range
+reaches past the cutoff, and sessions with frames relabeled since.
 """
+import os
+import json
+import time
+import bisect
+import argparse
 import boto3
 from decimal import Decimal
 from datetime import datetime
+from dynamodb_scan import parallel_scan, CapacityBudget, DEFAULT_SEGMENTS
 
 dynamodb = boto3.resource('dynamodb', region_name='ap-northeast-1')
 frame_table = dynamodb.Table('FrameDetections-dev')
 stats_table = dynamodb.Table('DetectionStats-dev')
 
-def recalculate_all_sessions():
-    """Recalculate stats for all sessions"""
-    # Get all sessions
-    response = stats_table.scan(
-        FilterExpression='periodType = :ptype',
-        ExpressionAttributeValues={':ptype': 'session'}
+# Only what the recalculation reads, to keep the scans small
+SESSION_ATTRIBUTES = ['userId', 'timePeriod', 'sessionId', 'startTime', 'endTime']
+FRAME_ATTRIBUTES = ['userId', 'timestamp', 'detectionCount', 'labelingStatus', 'labelingMetrics']
+
+DEFAULT_CHECKPOINT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.recalc_checkpoint.json')
+CHECKPOINT_EVERY = 25  # sessions between checkpoint writes
+SCAN_CHECKPOINT_SEC = 30  # seconds between checkpoint writes during the frame scan
+
+
+def _encode_decimal(value):
+    # Scan cursors can hold numeric key attributes, which boto3 returns as Decimal
+    if isinstance(value, Decimal):
+        return {'$decimal': str(value)}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _decode_decimal(obj):
+    return Decimal(obj['$decimal']) if set(obj) == {'$decimal'} else obj
+
+
+class Checkpoint:
+    """
+    {'highWater': <start ms of the last completed run>,
+     'sessions': [session keys recalculated by any completed or current run],
+     'run': {'startedAt': ms, 'since': ms or null, 'done': [session keys],
+             'scan': frame scan state (see scan_frame_totals) once it started} while a run is in progress}
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.data = {'highWater': None, 'sessions': [], 'run': None}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.data.update(json.load(f, object_hook=_decode_decimal))
+        self._known = set(self.data['sessions'])
+        self._done = set(self.data['run']['done']) if self.data['run'] else set()
+
+    @staticmethod
+    def key(session):
+        return f"{session['userId']}|{session['timePeriod']}"
+
+    def knows(self, session):
+        return self.key(session) in self._known
+
+    def is_done(self, session):
+        return self.key(session) in self._done
+
+    def start_run(self, started_at, since):
+        self.data['run'] = {'startedAt': started_at, 'since': since, 'done': []}
+        self._done = set()
+        self.save()
+
+    def scan_state(self):
+        return self.data['run'].get('scan') if self.data['run'] else None
+
+    def save_scan(self, state):
+        self.data['run']['scan'] = state
+        self.save()
+
+    def mark_done(self, session):
+        key = self.key(session)
+        self._done.add(key)
+        self._known.add(key)
+        if len(self._done) % CHECKPOINT_EVERY == 0:
+            self.save()
+
+    def finish_run(self):
+        self.data['highWater'] = self.data['run']['startedAt']
+        self.data['run'] = None
+        self._done = set()
+        self.save()
+
+    def save(self):
+        if self.data['run'] is not None:
+            self.data['run']['done'] = sorted(self._done)
+        self.data['sessions'] = sorted(self._known)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.data, f, default=_encode_decimal)
+        os.replace(tmp_path, self.path)
+
+
+def parse_since(value):
+    """Epoch milliseconds, or an ISO date/datetime (local time)"""
+    if value.isdigit():
+        return int(value)
+    return int(datetime.fromisoformat(value).timestamp() * 1000)
+
+class SessionIndex:
+    """
+    Per-user interval index over session time ranges.
+
+    Sessions of a user are sorted by start time; running_max_end[i] is the latest
+    end among the first i+1 sessions, so the search for sessions containing a
+    timestamp can stop as soon as no earlier session reaches it. A lookup is a
+    bisect plus one step per matching (overlapping) session.
+    """
+
+    def __init__(self, sessions, now_ms):
+        by_user = {}
+        for session in sessions:
+            start_time = int(session.get('startTime', 0))
+            end_time = int(session.get('endTime', 0)) or now_ms  # open session: up to now
+            by_user.setdefault(session['userId'], []).append((start_time, end_time, session))
+        self._index = {}
+        for user_id, intervals in by_user.items():
+            intervals.sort(key=lambda interval: interval[0])
+            running_max_end = []
+            latest = None
+            for _, end_time, _ in intervals:
+                latest = end_time if latest is None else max(latest, end_time)
+                running_max_end.append(latest)
+            self._index[user_id] = ([i[0] for i in intervals], running_max_end, intervals)
+
+    def sessions_for(self, user_id, timestamp):
+        """Sessions of user_id whose [startTime, endTime] contains timestamp"""
+        entry = self._index.get(user_id)
+        if entry is None:
+            return []
+        starts, running_max_end, intervals = entry
+        i = bisect.bisect_right(starts, timestamp) - 1
+        matches = []
+        while i >= 0 and running_max_end[i] >= timestamp:
+            start_time, end_time, session = intervals[i]
+            if end_time >= timestamp:
+                matches.append(session)
+            i -= 1
+        return matches
+
+
+class SessionTotals:
+    """Frame counts and labeling metrics accumulated for one session"""
+
+    def __init__(self):
+        self.total_frames = 0
+        self.total_detections = 0
+        self.verified_frames = 0
+        self.total_TP = 0
+        self.total_FP = 0
+        self.total_FN = 0
+
+    def add(self, frame):
+        self.total_frames += 1
+        self.total_detections += int(frame.get('detectionCount', 0))
+        if frame.get('labelingStatus') == 'verified' and frame.get('labelingMetrics'):
+            metrics = frame['labelingMetrics']
+            self.verified_frames += 1
+            self.total_TP += int(metrics.get('TP', 0))
+            self.total_FP += int(metrics.get('FP', 0))
+            self.total_FN += int(metrics.get('FN', 0))
+
+    def to_list(self):
+        return [self.total_frames, self.total_detections, self.verified_frames,
+                self.total_TP, self.total_FP, self.total_FN]
+
+    @classmethod
+    def from_list(cls, values):
+        totals = cls()
+        if values:
+            (totals.total_frames, totals.total_detections, totals.verified_frames,
+             totals.total_TP, totals.total_FP, totals.total_FN) = values
+        return totals
+
+
+def accumulate_session_totals(index, totals, frames):
+    """Add frames to the SessionTotals of the sessions covering them; returns how many were read"""
+    scanned = 0
+    for frame in frames:
+        scanned += 1
+        user_id = frame.get('userId')
+        if user_id is None or 'timestamp' not in frame:
+            continue
+        for session in index.sessions_for(user_id, int(frame['timestamp'])):
+            totals[Checkpoint.key(session)].add(frame)
+    return scanned
+
+
+def scan_frame_totals(sessions, now_ms, segments, budget, checkpoint):
+    """
+    Scan frames once (from the earliest session start) and assign each to the
+    session(s) covering its timestamp; returns {session key: SessionTotals}.
+
+    The scan position and totals are checkpointed as the run's 'scan' state
+    {'sessions', 'nowMs', 'earliest', 'segments', 'cursors', 'totals', 'frames'}
+    every SCAN_CHECKPOINT_SEC, and kept once the scan is complete, so a resumed
+    run continues the scan (or skips it) instead of starting over.
+    """
+    state = checkpoint.scan_state()
+    if state is None:
+        state = {
+            'sessions': [Checkpoint.key(session) for session in sessions],
+            'nowMs': now_ms,
+            'earliest': min(int(session.get('startTime', 0)) for session in sessions),
+            'segments': segments,
+            'cursors': {},
+            'totals': {},
+            'frames': 0,
+        }
+    else:
+        finished = sum(1 for cursor in state['cursors'].values() if cursor is None)
+        print(f"Resuming frame scan: {finished}/{state['segments']} segments finished, {state['frames']} frames read")
+    index = SessionIndex(sessions, state['nowMs'])
+    totals = {key: SessionTotals.from_list(state['totals'].get(key)) for key in state['sessions']}
+    cursors = {int(segment): cursor for segment, cursor in state['cursors'].items()}
+
+    def save():
+        state['cursors'] = {str(segment): cursor for segment, cursor in cursors.items()}
+        state['totals'] = {key: session_totals.to_list() for key, session_totals in totals.items()}
+        checkpoint.save_scan(state)
+
+    pages = parallel_scan(
+        frame_table.name,
+        segments=state['segments'],  # cursors are only valid for the segmentation they came from
+        projection=FRAME_ATTRIBUTES,
+        budget=budget,
+        pages=True,
+        cursors=cursors,
+        FilterExpression='#ts >= :earliest',
+        ExpressionAttributeNames={'#ts': 'timestamp'},
+        ExpressionAttributeValues={':earliest': state['earliest']}
     )
+    last_save = time.time()
+    for page in pages:
+        # cursors now cover exactly the pages already added to totals
+        if time.time() - last_save >= SCAN_CHECKPOINT_SEC:
+            save()
+            last_save = time.time()
+        state['frames'] += accumulate_session_totals(index, totals, page)
+    save()
+    print(f"Scanned {state['frames']} frames")
+    return totals
+
+
+def update_session(session, totals):
+    """Write recalculated statistics for one session"""
+    user_id = session['userId']
+    session_id = session['sessionId']
+    time_period = session['timePeriod']
     
-    sessions = response.get('Items', [])
-    print(f"Found {len(sessions)} sessions to process")
+    start_time = int(session.get('startTime', 0))
+    end_time = int(session.get('endTime', 0))
     
-    for session in sessions:
-        user_id = session['userId']
-        session_id = session['sessionId']
-        time_period = session['timePeriod']
+    print(f"\nProcessing session: {session_id}")
+    print(f"  User: {user_id}")
+    print(f"  Time range: {start_time} - {end_time or 'now'}")
+    
+    # Calculate statistics
+    total_frames = totals.total_frames
+    total_detections = totals.total_detections
+    impurities_found = total_detections  # All detections are impurities
+    
+    detection_rate = (total_detections / total_frames * 100) if total_frames > 0 else 0
+    avg_detections_per_frame = (total_detections / total_frames) if total_frames > 0 else 0
+    
+    # Calculate accuracy metrics from verified frames
+    if totals.verified_frames:
+        total_TP, total_FP, total_FN = totals.total_TP, totals.total_FP, totals.total_FN
         
-        # Parse start and end times
-        start_time = int(session.get('startTime', 0))
-        end_time = int(session.get('endTime', 0))
+        precision = total_TP / (total_TP + total_FP) if (total_TP + total_FP) > 0 else 0
+        recall = total_TP / (total_TP + total_FN) if (total_TP + total_FN) > 0 else 0
+        accuracy = total_TP / (total_TP + total_FP + total_FN) if (total_TP + total_FP + total_FN) > 0 else 0
+        f1_score = 2 * (precision * recall) / (precision + recall) if (precision + recall) > 0 else 0
         
-        if end_time == 0:
-            end_time = int(datetime.now().timestamp() * 1000)
+        print(f"  Calculated: {total_frames} frames, {total_detections} detections")
+        print(f"  Verified: {totals.verified_frames} frames with accuracy metrics")
+        print(f"  Accuracy: TP={total_TP}, FP={total_FP}, FN={total_FN}")
+        print(f"  Metrics: Precision={precision:.1%}, Recall={recall:.1%}, Accuracy={accuracy:.1%}, F1={f1_score:.1%}")
+    else:
+        total_TP = total_FP = total_FN = 0
+        precision = recall = accuracy = f1_score = 0
+        print(f"  Calculated: {total_frames} frames, {total_detections} detections")
+        print(f"  No verified frames with accuracy metrics")
+    
+    # Update session
+    try:
+        update_expression = ('SET totalFrames = :frames, totalDetections = :detections, '
+                           'impuritiesFound = :impurities, detectionRate = :rate, '
+                           'avgDetectionsPerFrame = :avg, updatedAt = :updated')
         
-        print(f"\nProcessing session: {session_id}")
-        print(f"  User: {user_id}")
-        print(f"  Time range: {start_time} - {end_time}")
+        expression_values = {
+            ':frames': total_frames,
+            ':detections': total_detections,
+            ':impurities': impurities_found,
+            ':rate': Decimal(str(round(detection_rate, 2))),
+            ':avg': Decimal(str(round(avg_detections_per_frame, 2))),
+            ':updated': datetime.now().isoformat()
+        }
         
-        # Query frames for this session
-        frame_response = frame_table.scan(
-            FilterExpression='#ts BETWEEN :start AND :end AND userId = :uid',
-            ExpressionAttributeNames={'#ts': 'timestamp'},
-            ExpressionAttributeValues={
-                ':start': start_time,
-                ':end': end_time,
-                ':uid': user_id
+        # Add accuracy metrics if available
+        if totals.verified_frames:
+            update_expression += (', sessionAccuracy = :accuracy')
+            expression_values[':accuracy'] = {
+                'totalTP': total_TP,
+                'totalFP': total_FP,
+                'totalFN': total_FN,
+                'totalActual': total_TP + total_FN,
+                'verifiedFrames': totals.verified_frames,
+                'precision': Decimal(str(round(precision, 3))),
+                'recall': Decimal(str(round(recall, 3))),
+                'accuracy': Decimal(str(round(accuracy, 3))),
+                'f1_score': Decimal(str(round(f1_score, 3))),
+                'calculatedAt': int(datetime.now().timestamp() * 1000)
             }
-        )
-        
-        frames = frame_response.get('Items', [])
-        
-        # Calculate statistics
-        total_frames = len(frames)
-        total_detections = sum(int(f.get('detectionCount', 0)) for f in frames)
-        impurities_found = total_detections  # All detections are impurities
         
-        detection_rate = (total_detections / total_frames * 100) if total_frames > 0 else 0
-        avg_detections_per_frame = (total_detections / total_frames) if total_frames > 0 else 0
-        
-        # Calculate accuracy metrics from verified frames
-        verified_frames = [f for f in frames if f.get('labelingStatus') == 'verified' and f.get('labelingMetrics')]
-        
-        if verified_frames:
-            total_TP = sum(int(f.get('labelingMetrics', {}).get('TP', 0)) for f in verified_frames)
-            total_FP = sum(int(f.get('labelingMetrics', {}).get('FP', 0)) for f in verified_frames)
-            total_FN = sum(int(f.get('labelingMetrics', {}).get('FN', 0)) for f in verified_frames)
-            
-            precision = total_TP / (total_TP + total_FP) if (total_TP + total_FP) > 0 else 0
-            recall = total_TP / (total_TP + total_FN) if (total_TP + total_FN) > 0 else 0
-            accuracy = total_TP / (total_TP + total_FP + total_FN) if (total_TP + total_FP + total_FN) > 0 else 0
-            f1_score = 2 * (precision * recall) / (precision + recall) if (precision + recall) > 0 else 0
-            
-            print(f"  Calculated: {total_frames} frames, {total_detections} detections")
-            print(f"  Verified: {len(verified_frames)} frames with accuracy metrics")
-            print(f"  Accuracy: TP={total_TP}, FP={total_FP}, FN={total_FN}")
-            print(f"  Metrics: Precision={precision:.1%}, Recall={recall:.1%}, Accuracy={accuracy:.1%}, F1={f1_score:.1%}")
-        else:
-            total_TP = total_FP = total_FN = 0
-            precision = recall = accuracy = f1_score = 0
-            print(f"  Calculated: {total_frames} frames, {total_detections} detections")
-            print(f"  No verified frames with accuracy metrics")
+        stats_table.update_item(
+            Key={
+                'userId': user_id,
+                'timePeriod': time_period
+            },
+            UpdateExpression=update_expression,
+            ExpressionAttributeValues=expression_values
+        )
+        print(f"  ✓ Updated session {session_id}")
+        return True
+    except Exception as e:
+        print(f"  ✗ Error updating session: {e}")
+        return False
+
+
+def find_relabeled_sessions(sessions, since, now_ms, segments, budget):
+    """Keys of sessions containing frames labeled at or after since"""
+    index = SessionIndex(sessions, now_ms)
+    dirty = set()
+    frames = parallel_scan(
+        frame_table.name,
+        segments=segments,
+        projection=['userId', 'timestamp'],
+        budget=budget,
+        FilterExpression='labeledAt >= :since',
+        ExpressionAttributeValues={':since': since}
+    )
+    for frame in frames:
+        for session in index.sessions_for(frame.get('userId'), int(frame['timestamp'])):
+            dirty.add(Checkpoint.key(session))
+    return dirty
+
+
+def select_changed_sessions(sessions, since, now_ms, checkpoint, segments, budget):
+    """Sessions that may have changed since the cutoff"""
+    relabeled = find_relabeled_sessions(sessions, since, now_ms, segments, budget)
+    changed = []
+    for session in sessions:
+        end_time = int(session.get('endTime', 0))
+        if (end_time == 0                              # still open
+                or end_time >= since                   # received frames after the cutoff
+                or not checkpoint.knows(session)       # never recalculated
+                or Checkpoint.key(session) in relabeled):
+            changed.append(session)
+    return changed
+
+
+def recalculate_all_sessions(segments=DEFAULT_SEGMENTS, max_rcu=0, since=None, incremental=False,
+                             checkpoint_path=DEFAULT_CHECKPOINT, restart=False):
+    """
+    Recalculate stats for all (or only changed) sessions with a single (parallel)
+    scan of the frame table, resuming an interrupted run unless restart is set
+    """
+    budget = CapacityBudget(max_rcu)
+    checkpoint = Checkpoint(checkpoint_path)
+    run = checkpoint.data['run']
+    if run and restart:
+        run = None
+    
+    if run:
+        started_at, since = run['startedAt'], run['since']
+        print(f"Resuming run started at {started_at} ({len(run['done'])} sessions already done)")
+    else:
+        started_at = int(datetime.now().timestamp() * 1000)
+        if since is None and incremental:
+            since = checkpoint.data['highWater']
+            if since is None:
+                print("No completed run in the checkpoint - recalculating everything")
+        checkpoint.start_run(started_at, since)
+    
+    # Get all sessions
+    sessions = list(parallel_scan(
+        stats_table.name,
+        segments=segments,
+        projection=SESSION_ATTRIBUTES,
+        budget=budget,
+        FilterExpression='periodType = :ptype',
+        ExpressionAttributeValues={':ptype': 'session'}
+    ))
+    print(f"Found {len(sessions)} sessions")
+    
+    now_ms = int(datetime.now().timestamp() * 1000)
+    scan = checkpoint.scan_state()
+    if scan is not None:
+        # The interrupted run already chose its sessions; keep them so the saved totals match
+        selected = set(scan['sessions'])
+        sessions = [session for session in sessions if Checkpoint.key(session) in selected]
+    elif since is not None:
+        print(f"Incremental: looking for changes since {since}")
+        sessions = select_changed_sessions(sessions, since, now_ms, checkpoint, segments, budget)
+    sessions = [session for session in sessions if not checkpoint.is_done(session)]
+    print(f"{len(sessions)} sessions to process")
+    
+    if sessions:
+        totals = scan_frame_totals(sessions, now_ms, segments, budget, checkpoint)
         
-        # Update session
-        try:
-            update_expression = ('SET totalFrames = :frames, totalDetections = :detections, '
-                               'impuritiesFound = :impurities, detectionRate = :rate, '
-                               'avgDetectionsPerFrame = :avg, updatedAt = :updated')
-            
-            expression_values = {
-                ':frames': total_frames,
-                ':detections': total_detections,
-                ':impurities': impurities_found,
-                ':rate': Decimal(str(round(detection_rate, 2))),
-                ':avg': Decimal(str(round(avg_detections_per_frame, 2))),
-                ':updated': datetime.now().isoformat()
-            }
-            
-            # Add accuracy metrics if available
-            if verified_frames:
-                update_expression += (', sessionAccuracy = :accuracy')
-                expression_values[':accuracy'] = {
-                    'totalTP': total_TP,
-                    'totalFP': total_FP,
-                    'totalFN': total_FN,
-                    'totalActual': total_TP + total_FN,
-                    'verifiedFrames': len(verified_frames),
-                    'precision': Decimal(str(round(precision, 3))),
-                    'recall': Decimal(str(round(recall, 3))),
-                    'accuracy': Decimal(str(round(accuracy, 3))),
-                    'f1_score': Decimal(str(round(f1_score, 3))),
-                    'calculatedAt': int(datetime.now().timestamp() * 1000)
-                }
-            
-            stats_table.update_item(
-                Key={
-                    'userId': user_id,
-                    'timePeriod': time_period
-                },
-                UpdateExpression=update_expression,
-                ExpressionAttributeValues=expression_values
-            )
-            print(f"  ✓ Updated session {session_id}")
-        except Exception as e:
-            print(f"  ✗ Error updating session: {e}")
+        for session in sessions:
+            if update_session(session, totals[Checkpoint.key(session)]):
+                checkpoint.mark_done(session)
+        checkpoint.save()
+    
+    failed = [session for session in sessions if not checkpoint.is_done(session)]
+    if failed:
+        print(f"\n{len(failed)} session(s) failed - run again to retry them")
+    else:
+        checkpoint.finish_run()
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Recalculate session statistics from frame data')
+    parser.add_argument('--segments', type=int, default=DEFAULT_SEGMENTS, help='Parallel scan segments')
+    parser.add_argument('--max-rcu', type=float, default=0, help='Read capacity units per second (0 = unlimited)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only recompute sessions changed since the last completed run')
+    parser.add_argument('--since', type=parse_since, default=None,
+                        help='Only recompute sessions changed since this time (epoch ms or ISO date)')
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help='Checkpoint file')
+    parser.add_argument('--restart', action='store_true', help='Ignore an interrupted run instead of resuming it')
+    args = parser.parse_args()
+    
     print("=" * 60)
     print("Recalculating Session Statistics")
     print("=" * 60)
-    recalculate_all_sessions()
+    recalculate_all_sessions(segments=args.segments, max_rcu=args.max_rcu, since=args.since,
+                             incremental=args.incremental, checkpoint_path=args.checkpoint, restart=args.restart)
     print("\n" + "=" * 60)
     print("Done!")
     print("=" * 60)
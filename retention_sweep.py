@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Delete frames and crops older than N days, together with their S3 objects
+
+FrameDetections items older than the cutoff are deleted with the frame images
+and YOLO labels they reference (s3UrlWithBbox, s3UrlWithoutBbox, s3LabelsPath),
+ImpurityData items with their crop (s3Url). S3 objects go first and the item
+after them, so an interrupted pass never leaves an object nobody references.
+
+Passes are incremental: --max-items ends a pass early and the next run picks
+up from the per-segment scan cursors in the checkpoint file, with the same
+cutoff, until the pass completes. --max-wcu/--max-rcu are token-bucket limits
+so a sweep leaves the live sender its write capacity.
+
+Crops are also swept straight from the impurities bucket by LastModified.
+ImpurityData items carry a 30-day DynamoDB TTL, so they usually expire long
+before the cutoff and the table scan never sees them; their crops would
+otherwise stay in the bucket forever. A crop is uploaded after its frame was
+captured, so a crop older than the cutoff only ever belongs to an expired item.
+
+Batch-mode archives (s3://bucket/key#bytes=...) hold the members of several
+frames captured within a few seconds of each other. An archive is deleted
+only once the referencing frame is ARCHIVE_SPAN_SEC older than the cutoff, so
+every frame in it has expired; archives of frames near the cutoff are kept in
+the checkpoint and deleted by a later pass.
+"""
+import os
+import json
+import time
+import argparse
+from decimal import Decimal
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import wait
+from dynamodb_scan import parallel_scan, CapacityBudget, DEFAULT_SEGMENTS
+from cleanup_dev_data import (dynamodb, s3_client, batch_delete_keys, delete_s3_objects, BoundedPool, PurgeProgress,
+                              DELETE_WORKERS, DYNAMODB_BATCH_SIZE, S3_BATCH_SIZE)
+
+# table -> attributes holding S3 URLs of objects owned by its items
+RETENTION_TABLES = {
+    'FrameDetections-dev': ['s3UrlWithBbox', 's3UrlWithoutBbox', 's3LabelsPath'],
+    'ImpurityData-dev': ['s3Url'],
+}
+# bucket -> table whose items reference its objects; swept by object age when that table is swept,
+# because the items can disappear through TTL without the sweeper ever seeing them
+RETENTION_BUCKETS = {
+    'mozuku-impurities-dev': 'ImpurityData-dev',
+}
+DEFAULT_RETENTION_DAYS = 90
+DEFAULT_MAX_WCU = 25  # leave most of the tables' write capacity to the sender
+DEFAULT_MAX_RCU = 50
+ARCHIVE_SPAN_SEC = 3600  # newest frame of a batch archive is at most this much newer than any other member
+
+DEFAULT_CHECKPOINT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.retention_checkpoint.json')
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Not JSON serializable: {type(value).__name__}")
+
+
+class SweepCheckpoint:
+    """
+    {'cutoff': ms of the pass in progress or null,
+     'tables': {table: {'segments': N, 'cursors': {segment: LastEvaluatedKey or null}, 'done': bool}},
+     'buckets': {bucket: {'startAfter': last listed key or null, 'done': bool}},
+     'pendingArchives': {'s3://bucket/key': newest referencing item timestamp (ms)},
+     'deleted': {table or bucket: count over all passes}}
+    """
+
+    def __init__(self, path, persist=True):
+        self.path = path
+        self.persist = persist  # False for dry runs: nothing is deleted, so nothing may be marked done
+        self.data = {'cutoff': None, 'tables': {}, 'buckets': {}, 'pendingArchives': {}, 'deleted': {}}
+        self._counted = {}  # progress counts already added to 'deleted'
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.data.update(json.load(f, parse_float=Decimal))
+
+    def start_pass(self, cutoff, tables, segments):
+        self.data['cutoff'] = cutoff
+        self.data['tables'] = {table: {'segments': segments, 'cursors': {}, 'done': False} for table in tables}
+        self.data['buckets'] = {}
+        self.save()
+
+    def bucket_state(self, bucket):
+        return self.data['buckets'].setdefault(bucket, {'startAfter': None, 'done': False})
+
+    def cursors(self, table):
+        """Scan cursors of table keyed by int segment (JSON stores them as strings)"""
+        state = self.data['tables'][table]
+        return {int(segment): key for segment, key in state['cursors'].items()}
+
+    def save(self, cursors=None, progress=None):
+        for table, table_cursors in (cursors or {}).items():
+            self.data['tables'][table]['cursors'] = {str(s): k for s, k in table_cursors.items()}
+        if progress is not None:
+            for target in list(progress.counts):
+                deleted = progress.get(target)[0]
+                self.data['deleted'][target] = self.data['deleted'].get(target, 0) + deleted - self._counted.get(target, 0)
+                self._counted[target] = deleted
+        if not self.persist:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.data, f, default=_json_default)
+        os.replace(tmp_path, self.path)
+
+    def finish_pass(self):
+        self.data['cutoff'] = None
+        self.data['tables'] = {}
+        self.data['buckets'] = {}
+        self.save()
+
+
+def split_s3_url(url):
+    """(bucket, key, is_archive) for s3:// URLs, None for anything else (empty, https, ...)"""
+    if not isinstance(url, str) or not url.startswith('s3://'):
+        return None
+    url, _, byte_range = url.partition('#bytes=')
+    bucket, _, key = url[len('s3://'):].partition('/')
+    if not bucket or not key:
+        return None
+    return bucket, key, bool(byte_range)
+
+
+class RetentionSweeper:
+    """
+    Args:
+        cutoff: items with timestamp (ms) below this are deleted
+        checkpoint: SweepCheckpoint
+        pool: BoundedPool running the deletes
+        progress: PurgeProgress
+        write_budget/read_budget: CapacityBudget for the deletes and the scans
+        dry_run: count what would be deleted without deleting
+    """
+
+    def __init__(self, cutoff, checkpoint, pool, progress, write_budget, read_budget, dry_run=False):
+        self.cutoff = cutoff
+        self.checkpoint = checkpoint
+        self.pool = pool
+        self.progress = progress
+        self.write_budget = write_budget
+        self.read_budget = read_budget
+        self.dry_run = dry_run
+        self._archives_deleted = set()
+
+    def _archive_ready(self, newest_ms):
+        return newest_ms < self.cutoff - ARCHIVE_SPAN_SEC * 1000
+
+    @staticmethod
+    def _wait(futures):
+        """Wait for a group of deletes; returns how many failed (raises unexpected errors)"""
+        failed = 0
+        for future in wait(futures).done:
+            if future.exception() is not None:
+                raise future.exception()
+            failed += future.result()[1]
+        return failed
+
+    def _delete_objects(self, objects):
+        """objects: {bucket: set(keys)}; returns the futures of the DeleteObjects calls"""
+        futures = []
+        for bucket, keys in objects.items():
+            keys = sorted(keys)
+            if self.dry_run:
+                self.progress.add(bucket, deleted=len(keys))
+                continue
+            for i in range(0, len(keys), S3_BATCH_SIZE):
+                futures.append(self.pool.submit(delete_s3_objects, bucket, keys[i:i + S3_BATCH_SIZE], self.progress))
+        return futures
+
+    def _delete_items(self, table_name, keys):
+        if self.dry_run:
+            self.progress.add(table_name, deleted=len(keys))
+            return []
+        return [self.pool.submit(batch_delete_keys, table_name, keys[i:i + DYNAMODB_BATCH_SIZE],
+                                 self.write_budget, self.progress)
+                for i in range(0, len(keys), DYNAMODB_BATCH_SIZE)]
+
+    def sweep_pending_archives(self):
+        """Delete archives left by earlier passes whose frames have all expired by now"""
+        pending = self.checkpoint.data['pendingArchives']
+        ready = [url for url, newest in pending.items() if self._archive_ready(int(newest))]
+        objects = {}
+        for url in ready:
+            bucket, key, _ = split_s3_url(url)
+            objects.setdefault(bucket, set()).add(key)
+        self._wait(self._delete_objects(objects))
+        for url in ready:
+            del pending[url]
+            self._archives_deleted.add(url)
+        if ready:
+            print(f"   🗃️  Deleted {len(ready)} batch archive(s) held back by earlier passes")
+
+    def _page_objects(self, page, url_attributes):
+        """S3 objects owned by the items of one page, deferring archives that may hold unexpired frames"""
+        pending = self.checkpoint.data['pendingArchives']
+        objects = {}
+        for item in page:
+            for attribute in url_attributes:
+                parsed = split_s3_url(item.get(attribute))
+                if parsed is None:
+                    continue
+                bucket, key, is_archive = parsed
+                if is_archive:
+                    url = f"s3://{bucket}/{key}"
+                    if url in self._archives_deleted:
+                        continue
+                    newest = max(int(item['timestamp']), int(pending.get(url, 0)))
+                    if not self._archive_ready(newest):
+                        pending[url] = newest
+                        continue
+                    pending.pop(url, None)
+                    self._archives_deleted.add(url)
+                objects.setdefault(bucket, set()).add(key)
+        return objects
+
+    def sweep_table(self, table_name, url_attributes, max_items=0):
+        """
+        Delete one table's expired items page by page, stopping after about
+        max_items (0 = no limit). Returns the number of items swept.
+        """
+        state = self.checkpoint.data['tables'][table_name]
+        if state['done']:
+            return 0
+        key_names = [key['AttributeName'] for key in dynamodb.Table(table_name).key_schema]
+        attributes = list(dict.fromkeys(key_names + ['timestamp'] + url_attributes))
+        cursors = self.checkpoint.cursors(table_name)
+        self.progress.add(table_name)
+        swept = 0
+        pages = parallel_scan(table_name, segments=state['segments'], projection=attributes, budget=self.read_budget,
+                              progress=False, pages=True, cursors=cursors,
+                              FilterExpression='#ts < :cutoff',
+                              ExpressionAttributeNames={'#ts': 'timestamp'},
+                              ExpressionAttributeValues={':cutoff': self.cutoff})
+        try:
+            for page in pages:
+                if not page:
+                    continue
+                # Objects first, then the items that reference them. If an object could not be
+                # deleted, the page's items stay so the next pass finds them and retries.
+                if self._wait(self._delete_objects(self._page_objects(page, url_attributes))):
+                    self.progress.add(table_name, failed=len(page))
+                else:
+                    self._wait(self._delete_items(table_name, [{k: item[k] for k in key_names} for item in page]))
+                swept += len(page)
+                # cursors only advance when the next page is requested, so this saves what came before
+                self.checkpoint.save({table_name: cursors}, self.progress)
+                if max_items and swept >= max_items:
+                    return swept
+        finally:
+            pages.close()
+        state['done'] = True
+        self.checkpoint.save({table_name: cursors}, self.progress)
+        return swept
+
+    def sweep_bucket(self, bucket, max_items=0):
+        """
+        Delete the objects of bucket last modified before the cutoff, listing from
+        the checkpointed key and stopping after about max_items deletes (0 = no limit).
+        Returns the number of objects swept.
+        """
+        state = self.checkpoint.bucket_state(bucket)
+        if state['done']:
+            return 0
+        cutoff = datetime.fromtimestamp(self.cutoff / 1000, tz=timezone.utc)
+        kwargs = {'Bucket': bucket, 'PaginationConfig': {'PageSize': S3_BATCH_SIZE}}
+        if state['startAfter']:
+            kwargs['StartAfter'] = state['startAfter']
+        self.progress.add(bucket)
+        swept = 0
+        for page in s3_client.get_paginator('list_objects_v2').paginate(**kwargs):
+            contents = page.get('Contents', [])
+            expired = {obj['Key'] for obj in contents if obj['LastModified'] < cutoff}
+            if expired:
+                self._wait(self._delete_objects({bucket: expired}))
+                swept += len(expired)
+            if contents:
+                state['startAfter'] = contents[-1]['Key']
+            self.checkpoint.save(progress=self.progress)
+            if max_items and swept >= max_items:
+                return swept
+        state['done'] = True
+        self.checkpoint.save(progress=self.progress)
+        return swept
+
+
+def run_pass(days, tables=None, segments=DEFAULT_SEGMENTS, workers=DELETE_WORKERS, max_wcu=DEFAULT_MAX_WCU,
+             max_rcu=DEFAULT_MAX_RCU, max_items=0, checkpoint_path=DEFAULT_CHECKPOINT, restart=False, dry_run=False):
+    """Run (or resume) one retention pass. Returns True when the pass completed"""
+    tables = tables or list(RETENTION_TABLES)
+    buckets = [bucket for bucket, table in RETENTION_BUCKETS.items() if table in tables]
+    checkpoint = SweepCheckpoint(checkpoint_path, persist=not dry_run)
+    if restart or checkpoint.data['cutoff'] is None or set(checkpoint.data['tables']) != set(tables):
+        cutoff = int((datetime.utcnow() - timedelta(days=days)).timestamp() * 1000)
+        checkpoint.start_pass(cutoff, tables, segments)
+        print(f"🆕 New pass: deleting items older than {days} days "
+              f"(before {datetime.utcfromtimestamp(cutoff / 1000).isoformat()}Z)")
+    else:
+        cutoff = int(checkpoint.data['cutoff'])
+        print(f"⏯️  Resuming pass with cutoff {datetime.utcfromtimestamp(cutoff / 1000).isoformat()}Z")
+
+    progress = PurgeProgress()
+    pool = BoundedPool(workers)
+    sweeper = RetentionSweeper(cutoff, checkpoint, pool, progress, CapacityBudget(max_wcu), CapacityBudget(max_rcu),
+                               dry_run=dry_run)
+    progress.start()
+    remaining = max_items
+    try:
+        sweeper.sweep_pending_archives()
+        for table_name in tables:
+            remaining -= sweeper.sweep_table(table_name, RETENTION_TABLES[table_name], remaining if max_items else 0)
+            if max_items and remaining <= 0:
+                break
+        else:
+            # After the tables, so items found by the scans go together with their objects first
+            for bucket in buckets:
+                remaining -= sweeper.sweep_bucket(bucket, remaining if max_items else 0)
+                if max_items and remaining <= 0:
+                    break
+    finally:
+        pool.join()
+        pool.shutdown()
+        progress.stop()
+        checkpoint.save(progress=progress)
+    for target, (_, failed) in progress.counts.items():
+        if failed:
+            print(f"   ⚠️  {target}: {failed} deletes failed, the next pass retries them")
+    completed = all(state['done'] for state in checkpoint.data['tables'].values()) and \
+        all(checkpoint.bucket_state(bucket)['done'] for bucket in buckets)
+    if completed:
+        checkpoint.finish_pass()
+    return completed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Delete frames, crops and labels older than N days')
+    parser.add_argument('--days', type=int, default=DEFAULT_RETENTION_DAYS,
+                        help=f'Keep this many days of data (default: {DEFAULT_RETENTION_DAYS})')
+    parser.add_argument('--table', action='append', choices=list(RETENTION_TABLES),
+                        help='Only sweep this table (repeatable; default: all)')
+    parser.add_argument('--segments', type=int, default=DEFAULT_SEGMENTS,
+                        help=f'Parallel scan segments (default: {DEFAULT_SEGMENTS})')
+    parser.add_argument('--workers', type=int, default=DELETE_WORKERS,
+                        help=f'Concurrent delete requests (default: {DELETE_WORKERS})')
+    parser.add_argument('--max-wcu', type=float, default=DEFAULT_MAX_WCU,
+                        help=f'Write capacity units per second for deletes (default: {DEFAULT_MAX_WCU}, 0 = unlimited)')
+    parser.add_argument('--max-rcu', type=float, default=DEFAULT_MAX_RCU,
+                        help=f'Read capacity units per second for scans (default: {DEFAULT_MAX_RCU}, 0 = unlimited)')
+    parser.add_argument('--max-items', type=int, default=0,
+                        help='End this run after about this many items; the next run resumes (default: no limit)')
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help='Checkpoint file of the pass in progress')
+    parser.add_argument('--restart', action='store_true', help='Discard an unfinished pass and start a new one')
+    parser.add_argument('--dry-run', action='store_true', help='Count what would be deleted, delete nothing')
+    args = parser.parse_args()
+    if args.days < 1:
+        parser.error('--days must be at least 1')
+
+    print("=" * 70)
+    print(f"🧹 Retention sweep: keep {args.days} days" + (" (dry run)" if args.dry_run else ""))
+    print(f"   WCU {args.max_wcu or 'unlimited'}, RCU {args.max_rcu or 'unlimited'}, {args.workers} delete workers")
+    print("=" * 70)
+    started = time.time()
+    completed = run_pass(args.days, tables=args.table, segments=args.segments, workers=args.workers,
+                         max_wcu=args.max_wcu, max_rcu=args.max_rcu, max_items=args.max_items,
+                         checkpoint_path=args.checkpoint, restart=args.restart, dry_run=args.dry_run)
+    print(f"\n{'✅ Pass completed' if completed else '⏸️  Pass paused, run again to continue'} "
+          f"in {time.time() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 import React, { useState, useRef, useEffect } from 'react';
+import { resolveMediaUrl, releaseMediaUrl } from '../s3Media';
 
-export default function BboxAnnotator({ imageUrl, detections, onSave, onCancel, readOnly = false }) {
+export default function BboxAnnotator({ imageUrl: sourceImageUrl, detections, onSave, onCancel, readOnly = false }) {
   const canvasRef = useRef(null);
   const [bboxes, setBboxes] = useState([]);
   const [editMode, setEditMode] = useState(false);
@@ -10,6 +11,30 @@ export default function BboxAnnotator({ imageUrl, detections, onSave, onCancel,
   const [selectedBboxIndex, setSelectedBboxIndex] = useState(null);
   const [imageLoaded, setImageLoaded] = useState(false);
   const [imageDimensions, setImageDimensions] = useState({ width: 0, height: 0 });
+  const [imageUrl, setImageUrl] = useState('');
+
+  // Batch-mode frames are archive members: fetch them with their byte range first
+  useEffect(() => {
+    let isActive = true;
+    let resolvedUrl = '';
+    setImageUrl('');
+    if (sourceImageUrl) {
+      resolveMediaUrl(sourceImageUrl)
+        .then((url) => {
+          if (!isActive) {
+            releaseMediaUrl(url);
+            return;
+          }
+          resolvedUrl = url;
+          setImageUrl(url);
+        })
+        .catch((err) => console.error('❌ Failed to load image:', sourceImageUrl, err));
+    }
+    return () => {
+      isActive = false;
+      releaseMediaUrl(resolvedUrl);
+    };
+  }, [sourceImageUrl]);
 
   // Convert detections to bbox format on mount
   useEffect(() => {
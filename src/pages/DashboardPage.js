@@ -1,15 +1,7 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { useTranslation } from 'react-i18next';
 import LanguageSwitcher from '../components/LanguageSwitcher';
-
-const buildHttpsUrlFromS3 = (s3Url) => {
-  if (!s3Url || typeof s3Url !== 'string' || !s3Url.startsWith('s3://')) return s3Url;
-  const parts = s3Url.replace('s3://', '').split('/', 2);
-  const bucket = parts[0];
-  const key = parts[1] || '';
-  const region = process.env.REACT_APP_COGNITO_REGION || 'ap-northeast-1';
-  return `https://${bucket}.s3.${region}.amazonaws.com/${key}`;
-};
+import { buildHttpsUrlFromS3, isMemberUrl, fetchMedia, resolveMediaUrl, releaseMediaUrl } from '../s3Media';
 
 const getFrameLabelsUrl = (frame) => {
   if (!frame) return '';
@@ -17,7 +9,8 @@ const getFrameLabelsUrl = (frame) => {
   if (frame.s3LabelsPath) return buildHttpsUrlFromS3(frame.s3LabelsPath);
 
   const source = frame.s3UrlWithoutBbox || frame.fullImageUrlWithoutBbox || frame.fullImageUrl || '';
-  if (!source) return '';
+  // Batched frames have no sibling .txt; their labels are only reachable through s3LabelsPath
+  if (!source || isMemberUrl(source)) return '';
 
   const https = buildHttpsUrlFromS3(source);
   const base = https.split('?')[0];
@@ -112,17 +105,30 @@ export default function DashboardPage({ user, onSignOut }) {
   // Update image URL when selectedDetection changes
   useEffect(() => {
     let isActive = true;
+    let resolvedUrl = '';
+    const cleanup = () => {
+      isActive = false;
+      releaseMediaUrl(resolvedUrl);
+    };
     if (selectedDetection) {
-      const imageUrl = getFrameImageUrl(selectedDetection);
-      setSelectedImageUrl(imageUrl);
+      resolveMediaUrl(getFrameImageUrl(selectedDetection))
+        .then((url) => {
+          if (isActive) {
+            resolvedUrl = url;
+            setSelectedImageUrl(url);
+          } else {
+            releaseMediaUrl(url);
+          }
+        })
+        .catch((err) => console.error('❌ Failed to load frame image:', err));
 
       const labelsUrl = getFrameLabelsUrl(selectedDetection);
       if (!labelsUrl) {
         setSelectedBboxes([]);
-        return () => { isActive = false; };
+        return cleanup;
       }
 
-      fetch(labelsUrl)
+      fetchMedia(labelsUrl)
         .then((res) => res.text())
         .then((text) => {
           if (!isActive) return;
@@ -134,7 +140,7 @@ export default function DashboardPage({ user, onSignOut }) {
           if (isActive) setSelectedBboxes([]);
         });
     }
-    return () => { isActive = false; };
+    return cleanup;
   }, [selectedDetection]);
 
   // Draw detection bboxes on canvas from extracted coordinates
@@ -2,15 +2,7 @@ import React, { useState, useEffect, useRef } from 'react';
 import { useTranslation } from 'react-i18next';
 import LanguageSwitcher from '../components/LanguageSwitcher';
 import BboxAnnotator from '../components/BboxAnnotator';
-
-const buildHttpsUrlFromS3 = (s3Url) => {
-  if (!s3Url || typeof s3Url !== 'string' || !s3Url.startsWith('s3://')) return s3Url;
-  const parts = s3Url.replace('s3://', '').split('/', 2);
-  const bucket = parts[0];
-  const key = parts[1] || '';
-  const region = process.env.REACT_APP_COGNITO_REGION || 'ap-northeast-1';
-  return `https://${bucket}.s3.${region}.amazonaws.com/${key}`;
-};
+import { buildHttpsUrlFromS3, isMemberUrl, fetchMedia, resolveMediaUrl, releaseMediaUrl } from '../s3Media';
 
 const getFrameLabelsUrl = (frame) => {
   if (!frame) return '';
@@ -18,7 +10,8 @@ const getFrameLabelsUrl = (frame) => {
   if (frame.s3LabelsPath) return buildHttpsUrlFromS3(frame.s3LabelsPath);
 
   const source = frame.s3UrlWithoutBbox || frame.fullImageUrlWithoutBbox || frame.fullImageUrl || '';
-  if (!source) return '';
+  // Batched frames have no sibling .txt; their labels are only reachable through s3LabelsPath
+  if (!source || isMemberUrl(source)) return '';
 
   const https = buildHttpsUrlFromS3(source);
   const base = https.split('?')[0];
@@ -220,7 +213,7 @@ export default function HistoryPage({ user, onSignOut }) {
       return () => { isActive = false; };
     }
 
-    fetch(labelsUrl)
+    fetchMedia(labelsUrl)
       .then((res) => res.text())
       .then((text) => {
         if (!isActive) return;
@@ -249,6 +242,8 @@ export default function HistoryPage({ user, onSignOut }) {
     const canvas = canvasRef.current;
     const ctx = canvas.getContext('2d');
     const img = new Image();
+    let isActive = true;
+    let resolvedUrl = '';
     
     img.crossOrigin = 'anonymous';
     img.onload = () => {
@@ -281,7 +276,21 @@ export default function HistoryPage({ user, onSignOut }) {
       console.error('❌ Failed to load image for canvas drawing:', currentFrame.s3UrlWithoutBbox);
     };
     
-    img.src = currentFrame.s3UrlWithoutBbox;
+    resolveMediaUrl(currentFrame.s3UrlWithoutBbox)
+      .then((url) => {
+        if (!isActive) {
+          releaseMediaUrl(url);
+          return;
+        }
+        resolvedUrl = url;
+        img.src = url;
+      })
+      .catch((err) => console.error('❌ Failed to load frame image:', err));
+
+    return () => {
+      isActive = false;
+      releaseMediaUrl(resolvedUrl);
+    };
   }, [sessionFrames, currentFrameIndex, currentFrameBboxes]);
 
   const handleNextFrame = () => {
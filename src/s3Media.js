@@ -0,0 +1,55 @@
+// S3 URLs of frames, crops and YOLO labels as stored by the local sender.
+//
+// In batch mode the sender packs many objects into one archive and stores
+// member URLs: s3://bucket/key#bytes=<first>-<last>. The fragment is the HTTP
+// Range of the member inside the archive, so it has to be fetched with a ranged
+// GET - an <img src> would load the whole archive. resolveMediaUrl turns such a
+// URL into an object URL of just the member; plain URLs pass through unchanged.
+
+const MEMBER_MARKER = '#bytes=';
+
+export const parseMemberUrl = (url) => {
+  if (!url || typeof url !== 'string' || !url.includes(MEMBER_MARKER)) return { url, range: null };
+  const [archiveUrl, byteRange] = url.split(MEMBER_MARKER, 2);
+  return { url: archiveUrl, range: `bytes=${byteRange}` };
+};
+
+export const isMemberUrl = (url) => parseMemberUrl(url).range !== null;
+
+export const buildHttpsUrlFromS3 = (s3Url) => {
+  if (!s3Url || typeof s3Url !== 'string' || !s3Url.startsWith('s3://')) return s3Url;
+  const { url, range } = parseMemberUrl(s3Url);
+  // split('/', 2) would drop everything after the second segment of the key
+  const path = url.replace('s3://', '');
+  const slash = path.indexOf('/');
+  const bucket = slash === -1 ? path : path.slice(0, slash);
+  const key = slash === -1 ? '' : path.slice(slash + 1);
+  const region = process.env.REACT_APP_COGNITO_REGION || 'ap-northeast-1';
+  const https = `https://${bucket}.s3.${region}.amazonaws.com/${key}`;
+  return range ? `${https}${MEMBER_MARKER}${range.replace('bytes=', '')}` : https;
+};
+
+// fetch() for s3://, https:// and member URLs (members are fetched with their Range)
+export const fetchMedia = (mediaUrl) => {
+  const { url, range } = parseMemberUrl(buildHttpsUrlFromS3(mediaUrl));
+  return fetch(url, range ? { headers: { Range: range } } : undefined).then((res) => {
+    if (!res.ok) throw new Error(`HTTP ${res.status} for ${url}`);
+    if (range && res.status !== 206) throw new Error(`Range ${range} ignored for ${url}`);
+    return res;
+  });
+};
+
+// Resolves to a URL an <img> can load. Object URLs made for archive members
+// must be released with releaseMediaUrl once the image is no longer shown.
+export const resolveMediaUrl = (mediaUrl) => {
+  const https = buildHttpsUrlFromS3(mediaUrl);
+  if (!isMemberUrl(https)) return Promise.resolve(https);
+  return fetchMedia(https)
+    .then((res) => res.blob())
+    // Archive ranges come back as application/octet-stream; members shown as images are JPEGs
+    .then((blob) => URL.createObjectURL(new Blob([blob], { type: 'image/jpeg' })));
+};
+
+export const releaseMediaUrl = (url) => {
+  if (url && url.startsWith('blob:')) URL.revokeObjectURL(url);
+};